@@ -1,10 +1,27 @@
-from flask import Flask, request, jsonify
+import time
+
+# 记录模块导入耗时（启动基准的一部分）
+_import_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from face_recognition import FaceRecognitionSystem
-from utils import base64_to_image
+from flask_sock import Sock
+from face_system import FaceRecognitionSystem
+from face_quality import LowQualityFace
+from engine import RecognitionEngine, EngineBusy
+from image_decode import (
+    DECODE_LIMITS, decode_image, decode_base64_image, restore_locations, ImageDecodeError, ImageTooLarge
+)
+from telemetry import create_metrics
+from tracking import StreamTracker
+from streaming import serve_stream
+from enrollment import iter_archive, name_from_path
+import cv2
 import os
+import json
+import threading
+import uuid
 from dotenv import load_dotenv
-import mlflow
 import logging
 
 # 配置日志
@@ -15,19 +32,127 @@ load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app)
+
+# 请求体上限由MAX_IMAGE_BYTES推算（base64约膨胀4/3，另留JSON字段的余量）：
+# 单图接口按一张图，其余接口按MAX_BATCH_SIZE张，超出时Werkzeug不读取请求体
+IMAGE_REQUEST_BYTES = DECODE_LIMITS['max_bytes'] * 4 // 3 + 64 * 1024
+app.config['MAX_CONTENT_LENGTH'] = IMAGE_REQUEST_BYTES * int(os.getenv('MAX_BATCH_SIZE', 32))
+SINGLE_IMAGE_ENDPOINTS = {'recognize_face', 'register_face'}
+
+# 指标缓冲，后台线程定期汇总写入MLflow
+metrics = create_metrics()
+
+# 视频流会话：按stream_id在完整检测之间做光流跟踪
+tracker = StreamTracker(metrics=metrics)
+
+# 人脸识别系统在预热阶段初始化（加载特征库、启动工作进程、加载模型）
+# MODEL_PRELOAD: background（默认，后台线程预热）| eager（导入时同步预热）| lazy（首个请求时预热）
+face_system = None
+engine = None
+model_preload = os.getenv('MODEL_PRELOAD', 'background').lower()
+startup = {'import_seconds': time.perf_counter() - _import_started}
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """初始化识别系统并预热模型；可重复调用，只执行一次，返回是否可用"""
+    global face_system, engine
+    with _warm_up_lock:
+        if _ready.is_set():
+            return face_system is not None
+        try:
+            start = time.perf_counter()
+            system = FaceRecognitionSystem(metrics=metrics)
+            startup['gallery_load_seconds'] = time.perf_counter() - start
+            recognition_engine = RecognitionEngine(system)
+            
+            # 模型加载失败不影响特征库管理接口，只记录下来
+            try:
+                startup['model_warmup_seconds'] = recognition_engine.warm_up()
+            except Exception as e:
+                logger.warning(f"Model warm-up failed: {e}")
+                startup['model_warmup_error'] = str(e)
+            
+            face_system, engine = system, recognition_engine
+            logger.info("Face recognition system initialized successfully")
+            logger.info(f"Loaded {len(face_system.known_face_names)} known faces")
+            logger.info(f"Recognition engine: {engine.workers} workers, queue size {engine.queue_size}")
+            
+            # 定期增量同步其他副本/进程注册的人脸
+            face_system.start_sync()
+        except Exception as e:
+            logger.error(f"Failed to initialize face recognition system: {e}")
+            startup['error'] = str(e)
+            metrics.increment('startup_failures')
+        finally:
+            for name, value in startup.items():
+                if isinstance(value, float):
+                    metrics.set_gauge(f"startup_{name}", value)
+            # 初始化失败时也要把失败计数和启动耗时写出去
+            metrics.start()
+            _ready.set()
+        return face_system is not None
+
+def system_unavailable():
+    """识别系统不可用时返回错误响应（预热中为503），可用时返回None"""
+    if model_preload == 'lazy' and not _ready.is_set():
+        warm_up()
+    if face_system:
+        return None
+    if not _ready.is_set():
+        response = jsonify({"error": "Face recognition system is starting"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify({"error": "Face recognition system not initialized"}), 500
 
-# 初始化MLflow
-mlflow.set_tracking_uri(os.getenv('MLFLOW_TRACKING_URI'))
-mlflow.set_experiment(os.getenv('MLFLOW_EXPERIMENT_NAME'))
+@app.before_request
+def limit_request_size():
+    """单图接口的请求体超过一张图的上限时直接返回413"""
+    if request.endpoint in SINGLE_IMAGE_ENDPOINTS and (request.content_length or 0) > IMAGE_REQUEST_BYTES:
+        return jsonify({"error": f"Request exceeds {IMAGE_REQUEST_BYTES} bytes"}), 413
 
-# 初始化人脸识别系统
-try:
-    face_system = FaceRecognitionSystem()
-    logger.info("Face recognition system initialized successfully")
-    logger.info(f"Loaded {len(face_system.known_face_names)} known faces")
-except Exception as e:
-    logger.error(f"Failed to initialize face recognition system: {e}")
-    face_system = None
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": f"Request exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+def busy_response(e):
+    """任务队列已满时返回429"""
+    response = jsonify({"error": str(e)})
+    response.status_code = 429
+    response.headers['Retry-After'] = '1'
+    return response
+
+def decode_error_response(e):
+    """超过大小限制返回413，其余解码失败返回400"""
+    if isinstance(e, ImageTooLarge):
+        return jsonify({"error": str(e)}), 413
+    return jsonify({"error": "Invalid image data"}), 400
+
+def record_recognition(endpoint, images, batch_results, decode_seconds, recognize_seconds):
+    """把一次识别请求累加到指标缓冲中"""
+    faces_detected = sum(len(results) for results in batch_results)
+    known_faces_matched = sum(
+        1 for results in batch_results for r in results if r['name'] != 'Unknown'
+    )
+    
+    metrics.increment(f"{endpoint}_requests")
+    metrics.increment("images_processed", len(images))
+    metrics.increment("faces_detected", faces_detected)
+    metrics.increment("known_faces_matched", known_faces_matched)
+    metrics.observe("decode_ms", decode_seconds * 1000)
+    metrics.observe(f"{endpoint}_ms", recognize_seconds * 1000)
+    
+    if metrics.should_sample():
+        metrics.record_sample(
+            endpoint=endpoint,
+            image_sizes=[f"{image.shape[1]}x{image.shape[0]}" for image in images],
+            faces_detected=faces_detected,
+            known_faces_matched=known_faces_matched,
+            decode_ms=decode_seconds * 1000,
+            recognize_ms=recognize_seconds * 1000
+        )
 
 @app.route('/')
 def index():
@@ -39,8 +164,9 @@ def index():
 
 @app.route('/recognize', methods=['POST'])
 def recognize_face():
-    if not face_system:
-        return jsonify({"error": "Face recognition system not initialized"}), 500
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
         
     try:
         data = request.get_json()
@@ -52,36 +178,142 @@ def recognize_face():
         if not image_data:
             return jsonify({"error": "No image data provided"}), 400
         
-        # 转换图像
-        image = base64_to_image(image_data)
-        if image is None:
-            return jsonify({"error": "Invalid image data"}), 400
+        # 直接解码为RGB（可按DECODE_MAX_WIDTH缩小解码）
+        start = time.perf_counter()
+        try:
+            rgb_image, scale = decode_base64_image(image_data)
+        except ImageDecodeError as e:
+            return decode_error_response(e)
+        decoded = time.perf_counter()
         
-        # 记录到MLflow
-        with mlflow.start_run(run_name="face_recognition"):
-            mlflow.log_param("image_size", f"{image.shape[1]}x{image.shape[0]}")
-            
-            # 识别人脸
-            results = face_system.recognize_face(image)
-            
-            mlflow.log_metric("faces_detected", len(results))
-            known_faces_matched = len([r for r in results if r['name'] != 'Unknown'])
-            mlflow.log_metric("known_faces_matched", known_faces_matched)
-        
-        return jsonify({
-            "success": True,
-            "results": results,
-            "faces_detected": len(results)
-        })
+        # 识别人脸；带stream_id时在完整检测之间复用跟踪结果
+        stream_id = data.get('stream_id')
+        if stream_id:
+            gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+            results = tracker.process(str(stream_id), gray, lambda: engine.recognize_batch([rgb_image])[0])
+        else:
+            results = engine.recognize_batch([rgb_image])[0]
+        
+        record_recognition("recognize", [rgb_image], [results], decoded - start, time.perf_counter() - decoded)
+        results = restore_locations(results, scale)
+        
+        with metrics.timer("serialize_ms"):
+            return jsonify({
+                "success": True,
+                "results": results,
+                "faces_detected": len(results)
+            })
     
+    except EngineBusy as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Recognition error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """批量识别：multipart多文件，或单个原始JPEG/PNG请求体"""
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+        
+    try:
+        if request.files:
+            uploads = [(f.filename, f.read()) for f in request.files.getlist('images') or request.files.values()]
+        elif request.mimetype in ('image/jpeg', 'image/png', 'application/octet-stream'):
+            uploads = [(None, request.get_data())]
+        else:
+            uploads = []
+        
+        uploads = [(filename, data) for filename, data in uploads if data]
+        if not uploads:
+            return jsonify({"error": "No image data provided"}), 400
+        
+        max_batch_size = int(os.getenv('MAX_BATCH_SIZE', 32))
+        if len(uploads) > max_batch_size:
+            return jsonify({"error": f"Batch size exceeds limit of {max_batch_size}"}), 400
+        
+        # 直接解码为RGB；单张失败只影响该张
+        start = time.perf_counter()
+        decoded_images = []
+        for _, data in uploads:
+            try:
+                decoded_images.append(decode_image(data))
+            except ImageTooLarge as e:
+                decoded_images.append(str(e))
+            except ImageDecodeError:
+                decoded_images.append("Invalid image data")
+        valid = [d[0] for d in decoded_images if not isinstance(d, str)]
+        decoded = time.perf_counter()
+        
+        # 识别人脸
+        batch_results = engine.recognize_batch(valid)
+        
+        record_recognition("recognize_batch", valid, batch_results, decoded - start, time.perf_counter() - decoded)
+        
+        results_iter = iter(batch_results)
+        items = []
+        for index, ((filename, _), decoded_image) in enumerate(zip(uploads, decoded_images)):
+            item = {"index": index, "filename": filename}
+            if isinstance(decoded_image, str):
+                item["error"] = decoded_image
+            else:
+                item["results"] = restore_locations(next(results_iter), decoded_image[1])
+                item["faces_detected"] = len(item["results"])
+            items.append(item)
+        
+        faces_detected = sum(item.get("faces_detected", 0) for item in items)
+        
+        with metrics.timer("serialize_ms"):
+            return jsonify({
+                "success": True,
+                "images": items,
+                "faces_detected": faces_detected
+            })
+    
+    except EngineBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.error(f"Batch recognition error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@sock.route('/ws/recognize')
+def recognize_stream(ws):
+    """WebSocket持续识别：客户端发送二进制JPEG帧，服务端只处理最新帧并异步推送结果"""
+    if system_unavailable():
+        ws.send(json.dumps({"error": "Face recognition system not initialized"}))
+        return
+    
+    stream_id = request.args.get('stream_id') or uuid.uuid4().hex
+    
+    def process(frame):
+        start = time.perf_counter()
+        try:
+            rgb_image, scale = decode_image(frame)
+        except ImageDecodeError as e:
+            return {"error": str(e) if isinstance(e, ImageTooLarge) else "Invalid image data"}
+        decoded = time.perf_counter()
+        
+        try:
+            gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+            results = tracker.process(stream_id, gray, lambda: engine.recognize_batch([rgb_image])[0])
+        except EngineBusy as e:
+            return {"error": str(e), "busy": True}
+        
+        record_recognition("recognize_stream", [rgb_image], [results], decoded - start, time.perf_counter() - decoded)
+        results = restore_locations(results, scale)
+        return {"success": True, "results": results, "faces_detected": len(results)}
+    
+    try:
+        serve_stream(ws.receive, lambda message: ws.send(json.dumps(message)), process)
+    finally:
+        tracker.end(stream_id)
+
 @app.route('/register', methods=['POST'])
 def register_face():
-    if not face_system:
-        return jsonify({"error": "Face recognition system not initialized"}), 500
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
         
     try:
         data = request.get_json()
@@ -94,20 +326,19 @@ def register_face():
         if not image_data or not name:
             return jsonify({"error": "Image data and name are required"}), 400
         
-        # 转换图像
-        image = base64_to_image(image_data)
-        if image is None:
-            return jsonify({"error": "Invalid image data"}), 400
+        # 注册照片按原分辨率解码
+        try:
+            rgb_image, _ = decode_base64_image(image_data, max_width=0)
+        except ImageDecodeError as e:
+            return decode_error_response(e)
         
-        # 记录到MLflow
-        with mlflow.start_run(run_name="face_registration"):
-            mlflow.log_param("person_name", name)
-            mlflow.log_param("image_size", f"{image.shape[1]}x{image.shape[0]}")
-            
-            # 注册人脸
-            success = face_system.add_new_face(image, name)
-            
-            mlflow.log_metric("registration_success", int(success))
+        # 注册人脸
+        start = time.perf_counter()
+        success = engine.register_rgb(rgb_image, name)
+        
+        metrics.increment("register_requests")
+        metrics.increment("registration_success", int(success))
+        metrics.observe("register_ms", (time.perf_counter() - start) * 1000)
         
         if success:
             return jsonify({
@@ -118,23 +349,166 @@ def register_face():
         else:
             return jsonify({"error": "No face detected in the image"}), 400
     
+    except LowQualityFace as e:
+        return jsonify({"error": str(e)}), 400
+    except EngineBusy as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Registration error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/register/bulk', methods=['POST'])
+def register_bulk():
+    """批量注册：上传zip/tar归档(archive)，或多个图像文件(images)并可附带同序的names"""
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+        
+    try:
+        if 'archive' in request.files:
+            items = iter_archive(request.files['archive'].stream)
+        else:
+            uploads = request.files.getlist('images')
+            names = request.form.getlist('names')
+            if not uploads:
+                return jsonify({"error": "An archive or image files are required"}), 400
+            if names and len(names) != len(uploads):
+                return jsonify({"error": "names must match the number of images"}), 400
+            items = [
+                (f.filename, names[i] if names else name_from_path(f.filename or str(i)), f.read())
+                for i, f in enumerate(uploads)
+            ]
+        
+        start = time.perf_counter()
+        summary = engine.enroll(items)
+        
+        metrics.increment("register_bulk_requests")
+        metrics.increment("registration_success", summary["enrolled"])
+        metrics.increment("registration_failed", summary["failed"])
+        metrics.observe("register_bulk_ms", (time.perf_counter() - start) * 1000)
+        
+        return jsonify(dict(summary, success=True, total_faces=len(face_system.known_face_names)))
+    
+    except EngineBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.error(f"Bulk registration error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def page_args(default_limit=100, max_limit=1000):
+    """从查询参数读取分页参数 (offset, limit)"""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+    return offset, limit
+
 @app.route('/status')
 def status():
-    if not face_system:
-        return jsonify({"error": "Face recognition system not initialized"}), 500
-        
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+    
+    # face_names只返回一页（按人去重），总人数见known_people
+    offset, limit = page_args()
+    people, total = face_system.list_people(offset, limit)
     return jsonify({
-        "known_faces": len(face_system.known_face_names),
-        "face_names": face_system.known_face_names
+        "known_faces": len(face_system.gallery),
+        "known_people": total,
+        "face_names": [name for name, _ in people],
+        "offset": offset,
+        "limit": limit
     })
 
+@app.route('/identities')
+def list_identities():
+    """分页列出已注册的人及其特征条数"""
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+    
+    offset, limit = page_args()
+    people, total = face_system.list_people(offset, limit)
+    return jsonify({
+        "identities": [{"name": name, "faces": count} for name, count in people],
+        "total": total,
+        "offset": offset,
+        "limit": limit
+    })
+
+@app.route('/identities/<name>', methods=['GET', 'PATCH', 'DELETE'])
+def identity(name):
+    """查看(GET)、改名(PATCH {"name": 新名字})或删除(DELETE)某人的全部特征"""
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+    
+    face_ids = face_system.person_face_ids(name)
+    if not face_ids:
+        return jsonify({"error": f"Identity not found: {name}"}), 404
+    
+    try:
+        if request.method == 'GET':
+            return jsonify({"name": name, "faces": len(face_ids), "face_ids": face_ids})
+        
+        if request.method == 'DELETE':
+            deleted = face_system.delete_person(name)
+            metrics.increment("identities_deleted")
+            return jsonify({"success": True, "deleted": deleted})
+        
+        data = request.get_json(silent=True) or {}
+        new_name = (data.get('name') or '').strip()
+        if not new_name:
+            return jsonify({"error": "New name is required"}), 400
+        renamed = face_system.rename_person(name, new_name)
+        return jsonify({"success": True, "name": new_name, "renamed": renamed})
+    
+    except Exception as e:
+        logger.error(f"Identity update error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/faces/<face_id>', methods=['DELETE'])
+def delete_face(face_id):
+    """删除单条特征（例如一张质量差的注册照片）"""
+    unavailable = system_unavailable()
+    if unavailable:
+        return unavailable
+    
+    try:
+        if not face_system.delete_faces([face_id]):
+            return jsonify({"error": f"Face not found: {face_id}"}), 404
+        return jsonify({"success": True, "deleted": 1})
+    except Exception as e:
+        logger.error(f"Face deletion error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus文本格式的指标"""
+    if face_system:
+        metrics.set_gauge("gallery_size", len(face_system.gallery))
+    if engine:
+        metrics.set_gauge("queue_depth", engine.queue_depth)
+        metrics.set_gauge("queue_capacity", engine.queue_size)
+        metrics.set_gauge("encoding_cache_entries", len(engine.cache))
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
-    return jsonify({"status": "healthy", "face_system_ready": face_system is not None})
+    """存活检查；ready表示特征库和模型均已就绪（任一失败时为false并返回error），startup为各启动阶段耗时"""
+    error = startup.get('error') or startup.get('model_warmup_error')
+    return jsonify({
+        "status": "healthy" if _ready.is_set() else "starting",
+        "ready": face_system is not None and error is None,
+        "face_system_ready": face_system is not None,
+        "error": error,
+        "startup": startup
+    })
+
+# 工作进程(spawn)会以 __mp_main__ 重新导入本模块，此时不预热
+if __name__ != '__mp_main__':
+    if model_preload == 'eager':
+        warm_up()
+    elif model_preload == 'background':
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,158 @@
+"""
+ASGI入口：/recognize 走异步路径，并发的单张请求由微批处理器合并后一次识别，
+其余接口原样交给Flask应用（WSGI）处理。
+运行: uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import time
+
+import cv2
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    # uvicorn自带的WSGI适配器已弃用，但功能相同
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import app as flask_app
+from batcher import MicroBatcher
+from engine import EngineBusy
+from image_decode import decode_base64_image, restore_locations, ImageDecodeError, ImageTooLarge
+
+logger = flask_app.logger
+
+wsgi_application = WSGIMiddleware(flask_app.app)
+
+
+def recognize_batch(rgb_images):
+    """微批处理函数：在线程池中对合并后的一批RGB图像做识别"""
+    return flask_app.engine.recognize_batch(rgb_images)
+
+
+batcher = MicroBatcher(recognize_batch, metrics=flask_app.metrics)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        # 与Flask应用的CORS(app)一致：允许任意来源，前端页面可跨域调用；预检请求由Flask处理
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    (b'access-control-allow-origin', b'*'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def system_unavailable(loop):
+    """与app.system_unavailable一致：返回 (状态码, 错误信息)，可用时返回None"""
+    if flask_app.model_preload == 'lazy' and not flask_app._ready.is_set():
+        await loop.run_in_executor(None, flask_app.warm_up)
+    if flask_app.face_system:
+        return None
+    if not flask_app._ready.is_set():
+        return 503, "Face recognition system is starting"
+    return 500, "Face recognition system not initialized"
+
+
+async def recognize(receive, send):
+    """POST /recognize 的异步实现，请求与响应格式和Flask版本相同"""
+    loop = asyncio.get_running_loop()
+    retry_after = [(b'retry-after', b'1')]
+
+    unavailable = await system_unavailable(loop)
+    if unavailable:
+        status, error = unavailable
+        return await send_json(send, status, {"error": error}, retry_after if status == 503 else ())
+
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not data or not isinstance(data, dict):
+            return await send_json(send, 400, {"error": "No JSON data provided"})
+
+        image_data = data.get('image')
+        if not image_data:
+            return await send_json(send, 400, {"error": "No image data provided"})
+
+        # 在线程池中直接解码为RGB
+        start = time.perf_counter()
+        try:
+            rgb_image, scale = await loop.run_in_executor(None, decode_base64_image, image_data)
+        except ImageTooLarge as e:
+            return await send_json(send, 413, {"error": str(e)})
+        except ImageDecodeError:
+            return await send_json(send, 400, {"error": "Invalid image data"})
+        decoded = time.perf_counter()
+
+        # 识别人脸；带stream_id时跟踪器在线程池中决定是否需要完整识别，
+        # 需要时同步等待微批结果（批在批处理器的专用线程池中执行，不会与之争抢线程）
+        stream_id = data.get('stream_id')
+        if stream_id:
+            def detect():
+                return asyncio.run_coroutine_threadsafe(batcher.submit(rgb_image), loop).result()
+
+            gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+            results = await loop.run_in_executor(
+                None, flask_app.tracker.process, str(stream_id), gray, detect
+            )
+        else:
+            results = await batcher.submit(rgb_image)
+
+        flask_app.record_recognition("recognize", [rgb_image], [results], decoded - start, time.perf_counter() - decoded)
+        results = restore_locations(results, scale)
+
+        with flask_app.metrics.timer("serialize_ms"):
+            return await send_json(send, 200, {
+                "success": True,
+                "results": results,
+                "faces_detected": len(results)
+            })
+
+    except EngineBusy as e:
+        return await send_json(send, 429, {"error": str(e)}, retry_after)
+    except Exception as e:
+        logger.error(f"Recognition error: {e}")
+        return await send_json(send, 500, {"error": str(e)})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await batcher.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def reject_websocket(receive, send):
+    """WSGI适配器无法处理WebSocket：握手前关闭，客户端收到403后回退到HTTP轮询"""
+    message = await receive()
+    if message['type'] == 'websocket.connect':
+        await send({'type': 'websocket.close', 'code': 1008})
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'websocket':
+        # WebSocket流式识别只由flask-sock在WSGI服务器上提供
+        return await reject_websocket(receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/recognize' and scope['method'] == 'POST':
+        return await recognize(receive, send)
+    return await wsgi_application(scope, receive, send)
@@ -0,0 +1,264 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from enrollment import bounded_map, IMAGE_EXTENSIONS
+from face_system import detect_and_encode_batch, warm_up
+from image_decode import decode_image, restore_locations, ImageDecodeError
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+CSV_FIELDS = ('source', 'frame', 'timestamp', 'name', 'confidence', 'top', 'right', 'bottom', 'left', 'low_quality')
+
+
+def list_sources(source):
+    """目录下的图像和视频文件（按路径排序），或单个视频/图像文件"""
+    if not os.path.isdir(source):
+        return [source]
+    paths = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS) and not filename.startswith('.'):
+                paths.append(os.path.join(root, filename))
+    return paths
+
+
+def iter_video(path, fps, skip=0):
+    """按fps抽帧，产出 (帧号, 时间戳秒, RGB帧)；前skip个抽样帧只grab不解码，帧为None"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        print(f"Cannot open video {path}")
+        return
+    try:
+        video_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(int(round(video_fps / fps)), 1) if fps > 0 else 1
+        frame_index = 0
+        sampled = 0
+        while True:
+            if frame_index % step == 0 and sampled >= skip:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame_index, frame_index / video_fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            else:
+                if not capture.grab():
+                    return
+                if frame_index % step == 0:
+                    yield frame_index, frame_index / video_fps, None
+            if frame_index % step == 0:
+                sampled += 1
+            frame_index += 1
+    finally:
+        capture.release()
+
+
+def iter_frames(sources, fps, skip=0):
+    """把所有来源展开为连续编号的帧，产出 (序号, 来源, 帧号, 时间戳, RGB帧, 缩放比例)
+
+    序号用于断点续跑：前skip个直接跳过，图像不读取，视频帧不解码；
+    无法解码的图像帧为None，照常占一个序号。
+    """
+    position = 0
+    for path in sources:
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            for frame_index, timestamp, rgb_image in iter_video(path, fps, max(skip - position, 0)):
+                if rgb_image is not None:
+                    yield position, path, frame_index, timestamp, rgb_image, 1.0
+                position += 1
+            continue
+
+        if position >= skip:
+            try:
+                with open(path, 'rb') as f:
+                    rgb_image, scale = decode_image(f.read())
+                yield position, path, 0, None, rgb_image, scale
+            except (OSError, ImageDecodeError) as e:
+                print(f"Skipping {path}: {e}")
+                yield position, path, 0, None, None, 1.0
+        position += 1
+
+
+def prefetch(iterable, size):
+    """在读取线程中迭代（解码视频/图像），主线程从有界队列取数据"""
+    buffer = queue.Queue(maxsize=size)
+    done = object()
+    error = []
+
+    def reader():
+        try:
+            for item in iterable:
+                buffer.put(item)
+        except Exception as e:
+            error.append(e)
+        finally:
+            buffer.put(done)
+
+    threading.Thread(target=reader, name='frame-reader', daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is done:
+            break
+        yield item
+    if error:
+        raise error[0]
+
+
+def chunked(frames, size):
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_chunk(chunk):
+    """在工作进程中执行：检测并编码一块帧，只把元数据和检测结果传回主进程"""
+    images = [frame[4] for frame in chunk if frame[4] is not None]
+    detections = iter(detect_and_encode_batch(images))
+    return [(frame[:4] + (frame[5],), next(detections) if frame[4] is not None else None) for frame in chunk]
+
+
+def result_rows(meta, results):
+    _, source, frame_index, timestamp, _ = meta
+    for result in results:
+        top, right, bottom, left = result['location']
+        yield {
+            'source': source,
+            'frame': frame_index,
+            'timestamp': None if timestamp is None else round(timestamp, 3),
+            'name': result['name'],
+            'confidence': round(result['confidence'], 4),
+            'top': top, 'right': right, 'bottom': bottom, 'left': left,
+            'low_quality': result.get('low_quality'),
+        }
+
+
+class ResultWriter:
+    """增量写出JSONL或CSV（按扩展名），每块结果落盘后再更新断点文件"""
+
+    def __init__(self, path, checkpoint_path, sources):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.sources = sources
+        self.csv = path.lower().endswith('.csv')
+
+        checkpoint = self.load_checkpoint()
+        self.position = checkpoint['position'] if checkpoint else 0
+        offset = checkpoint['offset'] if checkpoint else 0
+
+        # 截掉上次断点之后写出的半块结果
+        self.file = open(path, 'r+' if checkpoint else 'w', newline='')
+        self.file.seek(offset)
+        self.file.truncate()
+        self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS) if self.csv else None
+        if self.csv and offset == 0:
+            self.writer.writeheader()
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path) or not os.path.exists(self.path):
+            return None
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('sources') != self.sources:
+            print("Checkpoint is for a different source list, starting over")
+            return None
+        return checkpoint
+
+    def write(self, rows):
+        for row in rows:
+            if self.csv:
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + '\n')
+
+    def commit(self, position):
+        """结果落盘后原子地更新断点：下次从position开始"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.position = position
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'position': position, 'offset': self.file.tell(), 'sources': self.sources}, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def close(self):
+        self.file.close()
+
+
+def run(face_system, sources, output, executor=None, fps=1.0, batch_size=16, max_pending=8, checkpoint_path=None):
+    """处理全部来源并写出结果，返回汇总"""
+    writer = ResultWriter(output, checkpoint_path or output + '.checkpoint', sources)
+    start = time.perf_counter()
+    frames_done = faces = chunks = 0
+    try:
+        frames = prefetch(iter_frames(sources, fps, skip=writer.position), size=4 * batch_size)
+        for encoded in bounded_map(encode_chunk, chunked(frames, batch_size), executor, max_pending):
+            valid = [(meta, detection) for meta, detection in encoded if detection is not None]
+            batch_results = face_system.match_detections([detection for _, detection in valid])
+            for (meta, _), results in zip(valid, batch_results):
+                results = restore_locations(results, meta[4])
+                faces += len(results)
+                writer.write(result_rows(meta, results))
+
+            frames_done += len(encoded)
+            chunks += 1
+            writer.commit(encoded[-1][0][0] + 1)
+            if chunks % 50 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{frames_done} frames, {faces} faces, {frames_done / elapsed:.1f} frames/s")
+    finally:
+        writer.close()
+
+    return {'frames': frames_done, 'faces': faces, 'seconds': time.perf_counter() - start}
+
+
+def main():
+    from dotenv import load_dotenv
+    from face_system import FaceRecognitionSystem
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Offline recognition over an image directory or video files")
+    parser.add_argument('source', nargs='?', help="directory of images/videos or a video file (default: UNKNOWN_FACES_DIR)")
+    parser.add_argument('--output', default='results.jsonl', help="results file; .csv for CSV, otherwise JSONL")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument('--fps', type=float, default=1.0, help="frames sampled per second of video; 0 for every frame")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    face_system = FaceRecognitionSystem()
+    sources = list_sources(args.source or face_system.unknown_faces_dir)
+    print(f"{len(sources)} sources, gallery of {len(face_system.known_face_names)} faces")
+
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'), initializer=warm_up
+        )
+
+    try:
+        summary = run(
+            face_system, sources, args.output, executor, fps=args.fps, batch_size=args.batch_size,
+            max_pending=2 * max(args.workers, 1), checkpoint_path=args.checkpoint
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print(f"Processed {summary['frames']} frames, {summary['faces']} faces in {summary['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
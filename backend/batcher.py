@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """动态微批处理：把并发到达的单张识别请求合并成一批，交给同步的批处理函数
+
+    第一个请求到达后最多再等待 max_wait_ms 毫秒或凑满 max_batch_size 张就立即派发，
+    派发后马上开始收集下一批，因此低负载时几乎没有额外延迟，高负载时批自然变大。
+    """
+
+    def __init__(self, process_batch, max_batch_size=None, max_wait_ms=None, metrics=None, executor=None):
+        self.process_batch = process_batch
+        self.max_batch_size = int(os.getenv('MICROBATCH_MAX_SIZE', 8)) if max_batch_size is None else max_batch_size
+        self.max_wait_ms = float(os.getenv('MICROBATCH_MAX_WAIT_MS', 5)) if max_wait_ms is None else max_wait_ms
+        self.metrics = metrics
+        # 批处理函数在专用线程池中执行，不阻塞事件循环。不能用事件循环的默认线程池：
+        # 在默认线程池里同步等待批结果的调用方（如跟踪器）会占满线程，批永远得不到执行
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('MICROBATCH_THREADS', 4)), thread_name_prefix='microbatch'
+            )
+        self.executor = executor
+
+        self._queue = None
+        self._collector = None
+        self._inflight = set()
+
+    async def submit(self, item):
+        """提交一个请求，返回它在批结果中对应的那一项"""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def _start(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.ensure_future(self._collect())
+
+    async def _collect(self):
+        """收集循环：等到第一个请求，再在截止时间前尽量凑满一批"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        """在线程池中执行一批，把结果或异常分发给各个请求"""
+        items = [item for item, _ in batch]
+        if self.metrics is not None:
+            self.metrics.increment('microbatch_batches')
+            self.metrics.increment('microbatch_items', len(items))
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.process_batch, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """停止收集，等待已派发的批执行完"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+特征库索引召回率/延迟基准测试（与精确扫描对比）
+运行: python backend/benchmarks/bench_index.py --size 1000000 --index ivf
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gallery import FaceGallery
+from gallery_index import IVFIndex
+
+
+def synthetic_encodings(size, dim=128, seed=0):
+    """生成模拟的128维人脸特征（范数约为1，与dlib输出同量级）"""
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=1 / np.sqrt(dim), size=(size, dim)).astype(np.float32)
+
+
+def synthetic_queries(encodings, count, noise=0.03, seed=1):
+    """从库中抽样并加噪声，模拟同一人的新照片"""
+    rng = np.random.default_rng(seed)
+    truth = rng.choice(len(encodings), count, replace=False)
+    queries = encodings[truth] + rng.normal(scale=noise, size=(count, encodings.shape[1]))
+    return queries.astype(np.float32), truth
+
+
+def time_search(gallery, queries, k):
+    """逐条查询计时，返回(结果索引, 每次查询毫秒数)"""
+    indices = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        result, _ = gallery.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        indices.append(result[0])
+    return np.array(indices), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gallery index benchmark")
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--n-probe', type=int, default=16)
+    args = parser.parse_args()
+
+    encodings = synthetic_encodings(args.size)
+    queries, _ = synthetic_queries(encodings, args.queries)
+
+    exact = FaceGallery(capacity=args.size, index='brute')
+    exact.add_many(encodings, [''] * args.size)
+
+    approx = FaceGallery(capacity=args.size, index='brute')
+    approx.add_many(encodings, [''] * args.size)
+    approx.index = IVFIndex(approx, n_lists=args.n_lists, n_probe=args.n_probe)
+    start = time.perf_counter()
+    approx.index.train()
+    train_seconds = time.perf_counter() - start
+
+    exact_indices, exact_latency = time_search(exact, queries, args.k)
+    approx_indices, approx_latency = time_search(approx, queries, args.k)
+
+    recall = np.mean([
+        len(set(a) & set(e)) / len(e)
+        for a, e in zip(approx_indices, exact_indices)
+    ])
+
+    report = {
+        'size': args.size,
+        'queries': args.queries,
+        'k': args.k,
+        'n_lists': len(approx.index.lists),
+        'n_probe': args.n_probe,
+        'train_seconds': round(train_seconds, 3),
+        'recall_at_k': round(float(recall), 4),
+        'exact_ms': {'p50': float(np.percentile(exact_latency, 50)),
+                     'p99': float(np.percentile(exact_latency, 99))},
+        'ivf_ms': {'p50': float(np.percentile(approx_latency, 50)),
+                   'p99': float(np.percentile(approx_latency, 99))},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
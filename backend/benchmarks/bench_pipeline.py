@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+识别流水线基准测试套件：特征库冷加载、各阶段延迟、比对吞吐、HTTP吞吐、峰值内存
+运行: python backend/benchmarks/bench_pipeline.py --sizes 1000 100000 1000000 --output run.json
+对比: python backend/benchmarks/bench_pipeline.py --output new.json --compare run.json
+
+每个部分在独立的子进程中运行，峰值RSS按部分统计；随机数种子固定，
+结果写为JSON，--compare 时与基线比较并在退化超过阈值时以非零状态退出；
+某个部分出错、缺失或有非2xx响应时同样以非零状态退出。
+"""
+
+import argparse
+import base64
+import glob
+import http.client
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BACKEND_DIR)
+sys.path.append(BENCH_DIR)
+
+from bench_index import synthetic_encodings, synthetic_queries
+
+SECTIONS = ('gallery_load', 'matching', 'stages', 'flask', 'wsgi')
+
+
+def percentiles(latencies_ms):
+    latencies_ms = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def request_summary(outcomes, elapsed_seconds):
+    """按 (状态码, 延迟ms) 汇总请求：吞吐和延迟只计2xx响应，其余计入failed_requests"""
+    statuses = {}
+    for status, _ in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    succeeded = [latency for status, latency in outcomes if 200 <= status < 300]
+    summary = percentiles(succeeded) if succeeded else {}
+    return dict(summary, requests=len(outcomes), statuses=statuses,
+                failed_requests=len(outcomes) - len(succeeded),
+                requests_per_second=len(succeeded) / elapsed_seconds)
+
+
+def synthetic_images(directory, count, seed=0):
+    """生成本地测试图像：噪声背景上画椭圆“人脸”，两种分辨率，保存为JPEG
+
+    目录中已有图像（例如真实照片）时直接使用。
+    """
+    from PIL import Image, ImageDraw
+
+    existing = sorted(glob.glob(os.path.join(directory, '*.jpg')) + glob.glob(os.path.join(directory, '*.png')))
+    if existing:
+        return existing
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        width, height = (640, 480) if i % 2 == 0 else (1280, 720)
+        pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 240))
+        draw.ellipse((x, y, x + 160, y + 200), fill=(224, 172, 105))
+        draw.ellipse((x + 40, y + 60, x + 60, y + 80), fill=(40, 30, 20))
+        draw.ellipse((x + 100, y + 60, x + 120, y + 80), fill=(40, 30, 20))
+        draw.rectangle((x + 55, y + 140, x + 105, y + 150), fill=(150, 60, 60))
+        path = os.path.join(directory, f'synthetic_{i:03d}.jpg')
+        image.save(path, format='JPEG', quality=90)
+        paths.append(path)
+    return paths
+
+
+def image_payload(path):
+    with open(path, 'rb') as f:
+        return 'data:image/jpeg;base64,' + base64.b64encode(f.read()).decode()
+
+
+def bench_gallery_load(args):
+    """写入合成快照后冷加载：解密读取与建库（人员/中心/索引）分别计时"""
+    from cryptography.fernet import Fernet
+    from gallery import FaceGallery
+    from gallery_store import GalleryStore, GalleryCipher
+
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            store = GalleryStore(directory, GalleryCipher(Fernet.generate_key()))
+            people = max(size // args.photos_per_person, 1)
+            store.write_snapshot(
+                [f'{i:08x}' for i in range(size)],
+                [f'person_{i % people}' for i in range(size)],
+                synthetic_encodings(size), 1
+            )
+
+            start = time.perf_counter()
+            ids, names, encodings = store.load()
+            loaded = time.perf_counter()
+            gallery = FaceGallery(capacity=size)
+            gallery.add_many(encodings, names, ids)
+            results[str(size)] = {
+                'read_seconds': loaded - start,
+                'build_seconds': time.perf_counter() - loaded,
+                'total_seconds': time.perf_counter() - start,
+            }
+    return results
+
+
+def bench_matching(args):
+    """不同库规模下按人员比对的单查询延迟和批量吞吐"""
+    from gallery import FaceGallery
+
+    results = {}
+    for size in args.sizes:
+        encodings = synthetic_encodings(size)
+        people = max(size // args.photos_per_person, 1)
+        gallery = FaceGallery(capacity=size)
+        gallery.add_many(encodings, [f'person_{i % people}' for i in range(size)])
+        queries, _ = synthetic_queries(encodings, min(args.queries, size))
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            gallery.search_people(query[None, :])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        batch = queries[:8]
+        rounds = max(len(queries) // len(batch), 1)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            gallery.search_people(batch)
+        elapsed = time.perf_counter() - start
+
+        results[str(size)] = dict(
+            percentiles(latencies),
+            queries_per_second=len(queries) / (sum(latencies) / 1000),
+            batch8_faces_per_second=rounds * len(batch) / elapsed,
+        )
+    return results
+
+
+def bench_stages(args):
+    """在测试图像上跑完整识别，按阶段统计延迟分位数"""
+    from PIL import Image
+    from face_system import FaceRecognitionSystem, warm_up
+    from telemetry import MetricsBuffer
+
+    metrics = MetricsBuffer()
+    system = FaceRecognitionSystem(metrics=metrics)
+    size = args.stage_gallery_size
+    system.gallery.add_many(synthetic_encodings(size), [f'person_{i}' for i in range(size)])
+
+    images = [np.asarray(Image.open(path).convert('RGB')) for path in args.image_paths]
+    warm_seconds = warm_up()
+    for _ in range(args.repeats):
+        for rgb_image in images:
+            with metrics.timer('total_ms'):
+                system.recognize_batch([rgb_image])
+
+    results = {'gallery_size': size, 'images': len(images), 'warm_up_seconds': warm_seconds}
+    for name, histogram in sorted(metrics.histograms.items()):
+        results[name] = {
+            'p50_ms': histogram.quantile(0.5),
+            'p95_ms': histogram.quantile(0.95),
+            'p99_ms': histogram.quantile(0.99),
+            'mean_ms': histogram.sum / max(histogram.count, 1),
+        }
+    return results
+
+
+def _load_app():
+    import app as app_module
+    app_module.warm_up()
+    return app_module
+
+
+def bench_flask(args):
+    """通过Flask测试客户端顺序请求 /recognize"""
+    app_module = _load_app()
+    client = app_module.app.test_client()
+    payloads = [image_payload(path) for path in args.image_paths]
+
+    outcomes = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        response = client.post('/recognize', json={'image': payloads[i % len(payloads)]})
+        outcomes.append((response.status_code, (time.perf_counter() - start) * 1000))
+
+    return request_summary(outcomes, sum(latency for _, latency in outcomes) / 1000)
+
+
+def bench_wsgi(args):
+    """在线程化WSGI服务器上并发请求 /recognize"""
+    from werkzeug.serving import make_server
+
+    app_module = _load_app()
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    bodies = [json.dumps({'image': image_payload(path)}) for path in args.image_paths]
+
+    def request(i):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        start = time.perf_counter()
+        connection.request('POST', '/recognize', body=bodies[i % len(bodies)],
+                           headers={'Content-Type': 'application/json'})
+        status = connection.getresponse().status
+        connection.close()
+        return status, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    return dict(request_summary(outcomes, elapsed), concurrency=args.concurrency)
+
+
+BENCHMARKS = {
+    'gallery_load': bench_gallery_load,
+    'matching': bench_matching,
+    'stages': bench_stages,
+    'flask': bench_flask,
+    'wsgi': bench_wsgi,
+}
+
+
+def run_section(section, argv, env):
+    """在子进程中运行一个部分，返回其结果（失败时返回error）"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', section] + argv,
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'error': (completed.stderr.strip().splitlines() or ['no output'])[-1]}
+    return json.loads(lines[-1])
+
+
+def flatten(results, prefix=''):
+    """把嵌套结果展开为 {a.b.c: 数值}"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def failures(results):
+    """出错的部分和有非2xx响应的部分，这些结果不能当作有效测量"""
+    found = []
+    for section, result in results.items():
+        if 'error' in result:
+            found.append({'metric': section, 'error': result['error']})
+        elif result.get('failed_requests'):
+            found.append({'metric': f'{section}.failed_requests', 'error': f"non-2xx responses: {result['statuses']}"})
+    return found
+
+
+def compare(current, baseline, threshold):
+    """对比两次结果：延迟/耗时/内存变大或吞吐变小超过threshold视为退化
+
+    基线中有、本次缺失的部分或指标（例如该部分出错）同样视为退化。
+    """
+    regressions = []
+    for section in baseline:
+        if section not in current:
+            regressions.append({'metric': section, 'error': 'section missing from this run'})
+    current_flat = flatten(current)
+    for path, base in flatten(baseline).items():
+        value = current_flat.get(path)
+        if value is None:
+            if path.split('.', 1)[0] in current:
+                regressions.append({'metric': path, 'error': 'metric missing from this run'})
+            continue
+        if base == 0:
+            continue
+        if path.endswith('_per_second'):
+            change = (base - value) / base
+        elif path.endswith(('_ms', '_seconds', '_mb')):
+            change = (value - base) / base
+        else:
+            continue
+        if change > threshold:
+            regressions.append({'metric': path, 'baseline': base, 'current': value, 'change': round(change, 4)})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognition pipeline benchmark suite")
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--photos-per-person', type=int, default=1)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--images', default=None, help="directory of test images (generated if empty)")
+    parser.add_argument('--image-count', type=int, default=8)
+    parser.add_argument('--stage-gallery-size', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', default=None, help="write the JSON report to this file")
+    parser.add_argument('--compare', default=None, help="baseline JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative change flagged as a regression")
+    parser.add_argument('--child', choices=SECTIONS, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        images_dir = args.images or os.path.join(workdir, 'images')
+        args.image_paths = synthetic_images(images_dir, args.image_count)
+
+        if args.child:
+            result = BENCHMARKS[args.child](args)
+            # Linux上ru_maxrss单位为KB
+            result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(json.dumps(result))
+            return
+
+        from cryptography.fernet import Fernet
+
+        env = dict(
+            os.environ,
+            MODEL_PRELOAD='lazy',
+            KNOWN_FACES_DIR=os.path.join(workdir, 'known_faces'),
+            ENCRYPTION_KEY=Fernet.generate_key().decode(),
+            GALLERY_SYNC_INTERVAL='0',
+            PYTHONHASHSEED='0',
+        )
+        env.pop('MLFLOW_TRACKING_URI', None)
+
+        # 子进程复用同一批测试图像
+        argv = sys.argv[1:]
+        if not args.images:
+            argv += ['--images', images_dir]
+        for option in ('--output', '--compare'):
+            if option in argv:
+                index = argv.index(option)
+                del argv[index:index + 2]
+
+        results = {}
+        for section in args.sections:
+            print(f"Running {section}...", file=sys.stderr)
+            results[section] = run_section(section, argv, env)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('image_paths', 'child')},
+        },
+        'results': results,
+    }
+
+    report['failures'] = failures(results)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(results, baseline['results'], args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    for failure in report['failures']:
+        print(f"FAILED {failure['metric']}: {failure['error']}", file=sys.stderr)
+    for regression in report.get('regressions', []):
+        if 'error' in regression:
+            print(f"REGRESSION {regression['metric']}: {regression['error']}", file=sys.stderr)
+        else:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} ({regression['change']:+.1%})", file=sys.stderr)
+    if report['failures'] or report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+int8特征库存储基准测试：与float32存储对比常驻内存（NumPy数组及含Python对象的总量）、检索延迟和识别结果
+运行: python backend/benchmarks/bench_quantization.py --size 1000000 --per-person 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from gallery import FaceGallery
+from bench_index import synthetic_encodings, synthetic_queries
+
+
+def build_gallery(encodings, names, storage, index):
+    """建库并用tracemalloc统计建库期间新分配且仍驻留的内存（含姓名、行号列表等Python对象）"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    gallery = FaceGallery(capacity=len(encodings), index=index, storage=storage)
+    gallery.add_many(encodings, names)
+    if hasattr(gallery.index, 'wait'):
+        gallery.index.wait()
+    seconds = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return gallery, seconds, traced
+
+
+def time_people_search(gallery, queries, shortlist):
+    """逐条按人员检索（match_faces的路径），返回 (人员序号, 距离, 每次查询毫秒数)"""
+    people, distances, latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        person, distance = gallery.search_people(query, shortlist=shortlist)
+        latencies.append((time.perf_counter() - start) * 1000)
+        people.append(person[0])
+        distances.append(distance[0])
+    return np.array(people), np.array(distances), np.array(latencies)
+
+
+def time_scan(gallery, queries):
+    """逐条全库精确扫描的延迟（毫秒）"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        gallery.match(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def percentiles(latencies):
+    return {'p50': round(float(np.percentile(latencies, 50)), 3),
+            'p99': round(float(np.percentile(latencies, 99)), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 gallery storage benchmark")
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--per-person', type=int, default=1, help="encodings per identity")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--shortlist', type=int, default=8)
+    parser.add_argument('--index', default='brute', choices=['brute', 'ivf'])
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('DISTANCE_THRESHOLD', 0.6)))
+    parser.add_argument('--project-size', type=int, default=3_000_000, help="gallery size for the memory projection")
+    args = parser.parse_args()
+
+    encodings = synthetic_encodings(args.size)
+    names = [f'person_{i // args.per_person}' for i in range(args.size)]
+    queries, _ = synthetic_queries(encodings, args.queries)
+
+    report = {'size': args.size, 'per_person': args.per_person, 'queries': args.queries, 'index': args.index,
+              'shortlist': args.shortlist, 'threshold': args.threshold, 'variants': {}}
+    exact_people = exact_distances = None
+    for storage in ('float32', 'int8'):
+        gallery, build_seconds, traced_bytes = build_gallery(encodings, names, storage, args.index)
+        people, distances, latencies = time_people_search(gallery, queries, args.shortlist)
+        if exact_people is None:
+            exact_people, exact_distances = people, distances
+
+        report['variants'][storage] = {
+            'build_seconds': round(build_seconds, 3),
+            'array_bytes_per_face': round(gallery.nbytes / args.size, 1),
+            'total_bytes_per_face': round(traced_bytes / args.size, 1),
+            'projected_mb': round(traced_bytes / args.size * args.project_size / 2**20, 1),
+            'search_people_ms': percentiles(latencies),
+            'full_scan_ms': percentiles(time_scan(gallery, queries[:50])),
+            'identity_agreement': float(np.mean(people == exact_people)),
+            'decision_agreement': float(np.mean((distances <= args.threshold) == (exact_distances <= args.threshold))),
+            'max_distance_delta': float(np.max(np.abs(distances - exact_distances))),
+        }
+        del gallery
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+冷启动基准测试：在全新的解释器中导入app并预热，记录各阶段耗时
+运行: python backend/benchmarks/bench_startup.py --runs 5 --gallery-size 100000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+# 子进程中执行：导入app（lazy模式不预热），再显式预热
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.warm_up()
+report = dict(app.startup, import_app_seconds=imported - start, total_seconds=time.perf_counter() - start)
+print(json.dumps(report))
+"""
+
+
+def populate_gallery(directory, key, size):
+    """写入size条模拟特征作为待加载的特征库"""
+    from gallery_store import GalleryStore, GalleryCipher
+    from bench_index import synthetic_encodings
+
+    store = GalleryStore(directory, GalleryCipher(key))
+    encodings = synthetic_encodings(size)
+    store.write_snapshot([f'{i:08x}' for i in range(size)], [f'person_{i}' for i in range(size)], encodings, 1)
+
+
+def run_once(env):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    report['process_seconds'] = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--gallery-size', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=0, help="RECOGNITION_WORKERS for the child process")
+    args = parser.parse_args()
+
+    from cryptography.fernet import Fernet
+
+    with tempfile.TemporaryDirectory() as directory:
+        key = Fernet.generate_key()
+        if args.gallery_size:
+            sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+            populate_gallery(directory, key, args.gallery_size)
+
+        env = dict(
+            os.environ,
+            MODEL_PRELOAD='lazy',
+            KNOWN_FACES_DIR=directory,
+            ENCRYPTION_KEY=key.decode(),
+            RECOGNITION_WORKERS=str(args.workers),
+            GALLERY_SYNC_INTERVAL='0',
+        )
+        env.pop('MLFLOW_TRACKING_URI', None)
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    phases = sorted({name for run in runs for name, value in run.items() if isinstance(value, float)})
+    report = {
+        'runs': args.runs,
+        'gallery_size': args.gallery_size,
+        'workers': args.workers,
+        'median_seconds': {name: round(float(np.median([run[name] for run in runs if name in run])), 4)
+                           for name in phases},
+        'errors': sorted({run[name] for run in runs for name in run if name.endswith('error')}),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
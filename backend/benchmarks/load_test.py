@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+负载测试：模拟多个摄像头客户端，以固定帧率把本地JPEG回放到 /recognize 或 /ws/recognize
+运行: python backend/benchmarks/load_test.py --url http://127.0.0.1:5000 --clients 16 --fps 5 --duration 60
+      python backend/benchmarks/load_test.py --mode ws --images ./frames --output load.json
+
+每个客户端的行为与 frontend/script.js 的 processFrame 一致：按帧率计时，HTTP模式下
+上一个请求未返回时跳过该帧，WebSocket模式下发送缓冲未清空时跳过该帧。
+报告为JSON：吞吐、延迟百分位、错误/超时比例，以及按时间采样的服务端队列深度（/metrics）。
+HTTP/WebSocket客户端直接用asyncio流实现（不依赖requests/websockets）；帧掩码和统计用numpy，
+未指定--images时用bench_pipeline生成合成帧。可离线对开发服务器或本机gunicorn运行。
+"""
+
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from bench_pipeline import percentiles, synthetic_images
+
+
+class HTTPClient:
+    """最简的HTTP/1.1 keep-alive客户端；服务端关闭连接时下次请求自动重连"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """返回 (状态码, 响应体)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        version, status = (await self.reader.readline()).decode().split(' ', 2)[:2]
+        response_headers = {}
+        while True:
+            line = (await self.reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunks.append(await self.reader.readexactly(size + 2))
+                if size == 0:
+                    break
+            data = b''.join(chunk[:-2] for chunk in chunks)
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+            self.close()
+        return int(status), data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class WebSocketClient:
+    """最简的WebSocket客户端：发送二进制帧（客户端帧需加掩码），接收文本消息"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode())
+        await writer.drain()
+        status = (await reader.readline()).decode()
+        while (await reader.readline()).strip():
+            pass
+        if ' 101 ' not in status:
+            writer.close()
+            raise ConnectionError(f"WebSocket handshake failed: {status.strip()}")
+        return cls(reader, writer)
+
+    @property
+    def buffered(self):
+        """尚未发出的字节数，对应浏览器的 bufferedAmount"""
+        return self.writer.transport.get_write_buffer_size()
+
+    def _frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 1 << 16:
+            header += bytes([0x80 | 126]) + length.to_bytes(2, 'big')
+        else:
+            header += bytes([0x80 | 127]) + length.to_bytes(8, 'big')
+        # 按4字节一组与掩码异或
+        mask = os.urandom(4)
+        padded = np.zeros((length + 3) // 4 * 4, dtype=np.uint8)
+        padded[:length] = np.frombuffer(payload, dtype=np.uint8)
+        words = padded.view(np.uint32)
+        words ^= np.frombuffer(mask, dtype=np.uint32)[0]
+        return header + mask + padded[:length].tobytes()
+
+    def send(self, payload):
+        self.writer.write(self._frame(0x2, payload))
+
+    async def receive(self):
+        """下一条文本/二进制消息；服务端关闭连接时返回None"""
+        message = b''
+        while True:
+            try:
+                first, second = await self.reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                return None
+            length = second & 0x7F
+            if length == 126:
+                length = int.from_bytes(await self.reader.readexactly(2), 'big')
+            elif length == 127:
+                length = int.from_bytes(await self.reader.readexactly(8), 'big')
+            payload = await self.reader.readexactly(length)
+
+            opcode = first & 0x0F
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self.writer.write(self._frame(0xA, payload))
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if first & 0x80:
+                return message
+
+    async def close(self):
+        try:
+            self.writer.write(self._frame(0x8, (1000).to_bytes(2, 'big')))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+class Recorder:
+    """记录每个请求的 (开始时间, 延迟毫秒, 结果)，结果为HTTP状态码或 timeout/error/busy"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.requests = []
+        self.skipped = 0
+        self.server_dropped = 0
+        self.queue = []
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    def add(self, started, outcome):
+        self.requests.append((started, (self.now() - started) * 1000, outcome))
+
+
+async def http_client(index, args, address, frames, recorder, deadline):
+    """HTTP回退路径：每个tick发送一帧base64 JSON，上一个请求未返回时跳过"""
+    client = HTTPClient(*address)
+    stream_id = f'load-{index}'
+    bodies = [json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(frame).decode(),
+                          'stream_id': stream_id}).encode() for frame in frames]
+    headers = {'Content-Type': 'application/json'}
+
+    async def send(body):
+        started = recorder.now()
+        try:
+            status, _ = await asyncio.wait_for(client.request('POST', '/recognize', body, headers), args.timeout)
+            recorder.add(started, status)
+        except asyncio.TimeoutError:
+            client.close()
+            recorder.add(started, 'timeout')
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            client.close()
+            recorder.add(started, 'error')
+
+    await asyncio.sleep(index / args.clients / args.fps)
+    pending = None
+    frame = 0
+    while recorder.now() < deadline:
+        if pending is None or pending.done():
+            pending = asyncio.ensure_future(send(bodies[frame % len(bodies)]))
+            frame += 1
+        else:
+            recorder.skipped += 1
+        await asyncio.sleep(1 / args.fps)
+    if pending is not None:
+        await pending
+    client.close()
+
+
+async def ws_client(index, args, address, frames, recorder, deadline):
+    """WebSocket路径：按帧率发送二进制JPEG，服务端只处理最新帧，结果按帧序号对应发送时间"""
+    started = recorder.now()
+    try:
+        socket = await asyncio.wait_for(
+            WebSocketClient.connect(*address, f'/ws/recognize?stream_id=load-{index}'), args.timeout
+        )
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        recorder.add(started, 'error')
+        return
+
+    sent = {}
+    dropped = 0
+
+    async def receive():
+        nonlocal dropped
+        while True:
+            message = await socket.receive()
+            if message is None:
+                return
+            data = json.loads(message)
+            send_time = sent.pop(data.get('frame'), None)
+            if send_time is None:
+                continue
+            # 服务端跳过的旧帧不会有结果，丢弃其发送时间
+            for sequence in [sequence for sequence in sent if sequence < data['frame']]:
+                del sent[sequence]
+            dropped = data.get('dropped_frames', dropped)
+            if data.get('success'):
+                outcome = 200
+            else:
+                outcome = 'busy' if data.get('busy') else 'error'
+            recorder.add(send_time, outcome)
+
+    receiver = asyncio.ensure_future(receive())
+    await asyncio.sleep(index / args.clients / args.fps)
+    sequence = 0
+    try:
+        while recorder.now() < deadline and not receiver.done():
+            if socket.buffered > 0:
+                recorder.skipped += 1
+            else:
+                sequence += 1
+                sent[sequence] = recorder.now()
+                socket.send(frames[sequence % len(frames)])
+            await asyncio.sleep(1 / args.fps)
+        # 等待最后一帧的结果
+        grace = recorder.now() + args.timeout
+        while sent and recorder.now() < grace and not receiver.done():
+            await asyncio.sleep(0.05)
+    except ConnectionError:
+        pass
+    finally:
+        receiver.cancel()
+        await socket.close()
+
+    for send_time in sent.values():
+        recorder.add(send_time, 'timeout')
+    recorder.server_dropped += dropped
+
+
+def parse_prometheus(text, names):
+    """从Prometheus文本中取出给定名称的样本值"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('#') or ' ' not in line:
+            continue
+        name, value = line.rsplit(' ', 1)
+        if name in names:
+            values[names[name]] = float(value)
+    return values
+
+
+async def poll_metrics(args, address, recorder, deadline):
+    """按间隔采样服务端 /metrics 中的队列深度"""
+    client = HTTPClient(*address)
+    names = {'face_queue_depth': 'queue_depth', 'face_queue_capacity': 'queue_capacity'}
+    while recorder.now() < deadline:
+        sample = {'t': round(recorder.now(), 3)}
+        try:
+            status, body = await asyncio.wait_for(client.request('GET', '/metrics'), args.timeout)
+            if status == 200:
+                sample.update(parse_prometheus(body.decode(), names))
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            client.close()
+        recorder.queue.append(sample)
+        await asyncio.sleep(args.metrics_interval)
+    client.close()
+
+
+async def wait_ready(address, timeout):
+    """轮询 /health 直到模型和特征库就绪"""
+    client = HTTPClient(*address)
+    give_up = time.perf_counter() + timeout
+    try:
+        while True:
+            try:
+                status, body = await client.request('GET', '/health')
+                if status == 200 and json.loads(body).get('ready'):
+                    return
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                client.close()
+            if time.perf_counter() > give_up:
+                raise TimeoutError(f"Server not ready after {timeout}s")
+            await asyncio.sleep(0.5)
+    finally:
+        client.close()
+
+
+def summarize(args, recorder, elapsed, frame_count):
+    outcomes = [outcome for _, _, outcome in recorder.requests]
+    statuses = {}
+    for outcome in outcomes:
+        statuses[str(outcome)] = statuses.get(str(outcome), 0) + 1
+    ok = [latency for _, latency, outcome in recorder.requests if isinstance(outcome, int) and outcome < 400]
+    total = max(len(outcomes), 1)
+
+    timeline = []
+    for sample in recorder.queue:
+        window = [(latency, outcome) for started, latency, outcome in recorder.requests
+                  if sample['t'] - args.metrics_interval < started + latency / 1000 <= sample['t']]
+        window_ok = [latency for latency, outcome in window if isinstance(outcome, int) and outcome < 400]
+        timeline.append(dict(
+            sample,
+            completed=len(window_ok),
+            failed=len(window) - len(window_ok),
+            p95_ms=round(float(np.percentile(window_ok, 95)), 1) if window_ok else None,
+        ))
+
+    return {
+        'url': args.url,
+        'mode': args.mode,
+        'clients': args.clients,
+        'fps': args.fps,
+        'duration_seconds': round(elapsed, 3),
+        'images': frame_count,
+        'offered_fps': args.clients * args.fps,
+        'requests': len(outcomes),
+        'completed': len(ok),
+        'throughput_fps': len(ok) / elapsed,
+        'latency': dict(percentiles(ok), mean_ms=float(np.mean(ok)), max_ms=float(np.max(ok))) if ok else None,
+        'statuses': statuses,
+        'error_rate': (len(outcomes) - len(ok) - outcomes.count('timeout')) / total,
+        'timeout_rate': outcomes.count('timeout') / total,
+        'busy_rate': (outcomes.count(429) + outcomes.count('busy')) / total,
+        'client_skipped_frames': recorder.skipped,
+        'server_dropped_frames': recorder.server_dropped if args.mode == 'ws' else None,
+        'queue_depth_max': max((sample.get('queue_depth', 0) for sample in recorder.queue), default=None),
+        'timeline': timeline,
+    }
+
+
+async def run(args, frames):
+    parts = urlsplit(args.url)
+    address = (parts.hostname or '127.0.0.1', parts.port or 80)
+    if args.wait_ready:
+        await wait_ready(address, args.wait_ready)
+
+    recorder = Recorder()
+    deadline = args.duration
+    client = ws_client if args.mode == 'ws' else http_client
+    tasks = [client(i, args, address, frames, recorder, deadline) for i in range(args.clients)]
+    tasks.append(poll_metrics(args, address, recorder, deadline))
+    await asyncio.gather(*tasks)
+    return summarize(args, recorder, recorder.now(), len(frames))
+
+
+def load_frames(directory, count):
+    """读取目录中的JPEG；目录为空或未指定时生成合成图像"""
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(), 'face_bench_images')
+    paths = sorted(glob.glob(os.path.join(directory, '*.jpg')) + glob.glob(os.path.join(directory, '*.jpeg')))
+    if not paths:
+        paths = synthetic_images(directory, count)
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay local JPEGs against the recognition server")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="server base URL (dev server or gunicorn)")
+    parser.add_argument('--mode', choices=['http', 'ws'], default='http',
+                        help="http: POST /recognize like the fetch fallback; ws: /ws/recognize binary frames")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent webcam clients")
+    parser.add_argument('--fps', type=float, default=5.0, help="frames per second per client (frontend uses 5)")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run")
+    parser.add_argument('--images', help="directory of JPEG frames (default: synthetic images)")
+    parser.add_argument('--synthetic', type=int, default=8, help="synthetic images to generate when --images is empty")
+    parser.add_argument('--timeout', type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument('--metrics-interval', type=float, default=1.0, help="seconds between /metrics samples")
+    parser.add_argument('--wait-ready', type=float, default=60.0,
+                        help="wait up to this many seconds for /health to report ready (0 to skip)")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.synthetic)
+    report = asyncio.run(run(args, frames))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+
+import numpy as np
+
+# 未拟合时置信度曲线的斜率：距离比阈值近/远0.1时置信度约为0.9/0.1
+DEFAULT_SLOPE = float(np.log(9) / 0.1)
+MAX_SLOPE = 200.0
+# 拟合斜率时向默认值收缩的强度，避免两类完全可分时斜率发散
+SLOPE_PRIOR = 1e-3
+CHUNK_ROWS = 4096
+MAX_FIT_POINTS = 100000
+
+
+def calibration_settings():
+    """从环境变量读取阈值与校准配置（启动时读取一次）"""
+    return {
+        'threshold': float(os.getenv('DISTANCE_THRESHOLD', 0.6)),
+        'enabled': os.getenv('THRESHOLD_CALIBRATION', 'True').lower() == 'true',
+        # 每人阈值相对全局阈值的最大调整量
+        'max_adjust': float(os.getenv('CALIBRATION_MAX_ADJUST', 0.1)),
+        # 阈值与最近的其他人特征之间至少保留的距离
+        'margin': float(os.getenv('CALIBRATION_MARGIN', 0.02)),
+        # 估计类间距离用的参考特征条数
+        'sample_size': int(os.getenv('CALIBRATION_SAMPLE_SIZE', 256)),
+    }
+
+
+def _pairwise(a, b):
+    """a与b两两之间的欧氏距离"""
+    dist_sq = a @ b.T
+    dist_sq *= -2
+    dist_sq += np.einsum('ij,ij->i', a, a)[:, None]
+    dist_sq += np.einsum('ij,ij->i', b, b)[None, :]
+    np.maximum(dist_sq, 0, out=dist_sq)
+    return np.sqrt(dist_sq, out=dist_sq)
+
+
+def intra_distances(gallery, persons):
+    """类内统计：每条特征到同一人其他特征的最近距离
+
+    返回 (每人的最大值, 各距离所属的人员序号位置, 距离)；只有一条特征的人为NaN。
+    特征条数相同的人合并成一个 (人数×条数×dim) 的批次一起计算。
+    """
+    high = np.full(len(persons), np.nan)
+    groups = {}
+    for i, person in enumerate(persons):
+        count = len(gallery.person_rows[person])
+        if count >= 2:
+            groups.setdefault(count, []).append(i)
+
+    owners, distances = [], []
+    for count, members in groups.items():
+        # 每批的距离矩阵不超过约4M个元素
+        step = max(1, (1 << 22) // (count * count))
+        for start in range(0, len(members), step):
+            group = members[start:start + step]
+            rows = np.array([gallery.person_rows[persons[i]] for i in group], dtype=np.int64)
+            encodings = gallery.encodings_of(rows)
+            sq_norms = np.einsum('mnd,mnd->mn', encodings, encodings)
+            dist_sq = encodings @ encodings.transpose(0, 2, 1)
+            dist_sq *= -2
+            dist_sq += sq_norms[:, :, None] + sq_norms[:, None, :]
+            np.maximum(dist_sq, 0, out=dist_sq)
+            dist_sq[:, np.arange(count), np.arange(count)] = np.inf
+            nearest = np.sqrt(dist_sq.min(axis=2))
+            high[group] = nearest.max(axis=1)
+            owners.append(np.repeat(group, count))
+            distances.append(nearest.ravel())
+    if not distances:
+        return high, np.empty(0, dtype=np.int64), np.empty(0)
+    return high, np.concatenate(owners), np.concatenate(distances)
+
+
+def nearest_impostors(gallery, persons, reference, reference_people):
+    """类间统计：每条特征到参考特征中其他人的最近距离
+
+    返回 (每人的最小值, 各距离所属的人员序号位置, 距离)；没有参考特征时为inf。
+    """
+    low = np.full(len(persons), np.inf)
+    counts = [len(gallery.person_rows[person]) for person in persons]
+    rows = np.array([row for person in persons for row in gallery.person_rows[person]], dtype=np.int64)
+    owners = np.repeat(np.arange(len(persons)), counts)
+    if len(rows) == 0 or len(reference) == 0:
+        return low, owners, np.full(len(rows), np.inf)
+
+    distances = np.empty(len(rows))
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start:start + CHUNK_ROWS]
+        block = _pairwise(gallery.encodings_of(chunk), reference)
+        block[gallery.row_person[chunk][:, None] == reference_people[None, :]] = np.inf
+        distances[start:start + len(chunk)] = block.min(axis=1)
+    np.minimum.at(low, owners, distances)
+    return low, owners, distances
+
+
+def fit_slope(genuine, impostor, slope=DEFAULT_SLOPE, iterations=25):
+    """在 (阈值 - 距离) 上拟合无截距的逻辑回归斜率，两类等权
+
+    无截距保证距离等于阈值时置信度为0.5，与接受/拒绝的判定一致。
+    """
+    if len(genuine) == 0 or len(impostor) == 0:
+        return slope
+    x = np.concatenate((genuine, impostor))
+    y = np.concatenate((np.ones(len(genuine)), np.zeros(len(impostor))))
+    weights = np.concatenate((np.full(len(genuine), 1 / len(genuine)), np.full(len(impostor), 1 / len(impostor))))
+    x, y, weights = x[np.isfinite(x)], y[np.isfinite(x)], weights[np.isfinite(x)]
+
+    prior = slope
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-np.clip(slope * x, -50, 50)))
+        gradient = np.sum(weights * (y - p) * x) - SLOPE_PRIOR * (slope - prior)
+        hessian = np.sum(weights * p * (1 - p) * x * x) + SLOPE_PRIOR
+        step = gradient / hessian
+        slope = float(np.clip(slope + step, 1.0, MAX_SLOPE))
+        if abs(step) < 1e-6:
+            break
+    return slope
+
+
+class ScoreCalibrator:
+    """每人的距离阈值和置信度校准
+
+    每人的阈值从全局阈值出发：同一人的照片彼此较远时放宽，最近的其他人
+    较近时收紧到其下方，调整量不超过max_adjust。置信度为
+    sigmoid(slope × (阈值 - 距离))，slope在类内/类间距离上拟合。
+    """
+
+    def __init__(self, settings=None, seed=0):
+        self.settings = settings or calibration_settings()
+        self.slope = DEFAULT_SLOPE
+        self._rng = np.random.default_rng(seed)
+        self._reference = None
+        self._reference_people = None
+        self._reference_size = 0
+
+    def fit(self, gallery):
+        """全量校准：重新抽取参考特征，计算所有人的阈值并拟合斜率"""
+        gallery.stale_people.clear()
+        if not self.settings['enabled']:
+            return
+        count = min(self.settings['sample_size'], len(gallery))
+        rows = np.sort(self._rng.choice(len(gallery), count, replace=False))
+        self._reference = gallery.encodings_of(rows).copy()
+        self._reference_people = gallery.row_person[rows].copy()
+        self._reference_size = count
+
+        genuine, impostor = self._update(gallery, np.arange(len(gallery.people)))
+        self.slope = fit_slope(genuine, impostor)
+
+    def refresh(self, gallery):
+        """增量校准：只重算特征有变化的人，斜率不变
+
+        这些人的参考特征可能已被删除或改名，先从参考集中剔除；
+        剩余不足一半或特征库已远大于参考集时改为全量校准。
+        """
+        persons = np.array(sorted(gallery.stale_people), dtype=np.int64)
+        gallery.stale_people.clear()
+        if len(persons) == 0 or not self.settings['enabled']:
+            return
+
+        if self._reference is not None:
+            keep = ~np.isin(self._reference_people, persons)
+            self._reference = self._reference[keep]
+            self._reference_people = self._reference_people[keep]
+        undersampled = self._reference_size < self.settings['sample_size'] and len(gallery) >= 2 * self._reference_size
+        if self._reference is None or 2 * len(self._reference) < self._reference_size or undersampled:
+            return self.fit(gallery)
+        self._update(gallery, persons)
+
+    def _update(self, gallery, persons):
+        """重算给定人员的阈值，返回拟合斜率用的 (类内余量, 类间余量)"""
+        base = self.settings['threshold']
+        adjust = self.settings['max_adjust']
+
+        high, genuine_owners, genuine = intra_distances(gallery, persons)
+        low, impostor_owners, impostor = nearest_impostors(
+            gallery, persons, self._reference, self._reference_people
+        )
+        thresholds = np.minimum(np.fmax(high, base), low - self.settings['margin'])
+        thresholds = np.clip(thresholds, base - adjust, base + adjust)
+        thresholds[np.array([len(gallery.person_rows[person]) == 0 for person in persons], dtype=bool)] = np.nan
+        gallery.thresholds[persons] = thresholds
+
+        genuine = thresholds[genuine_owners] - genuine
+        impostor = thresholds[impostor_owners] - impostor
+        if len(genuine) > MAX_FIT_POINTS:
+            genuine = self._rng.choice(genuine, MAX_FIT_POINTS, replace=False)
+        if len(impostor) > MAX_FIT_POINTS:
+            impostor = self._rng.choice(impostor, MAX_FIT_POINTS, replace=False)
+        return genuine, impostor
+
+    def score(self, gallery, people, distances):
+        """一次性把每个查询的距离与所属人员的阈值比较，返回 (是否接受, 置信度)
+
+        people为-1（特征库为空）的查询不接受、置信度为0；未校准的人用全局阈值。
+        """
+        base = self.settings['threshold']
+        valid = people >= 0
+        table = gallery.thresholds
+        thresholds = np.full(len(people), base, dtype=np.float32)
+        known = valid & (people < len(table))
+        thresholds[known] = table[people[known]]
+        thresholds[np.isnan(thresholds)] = base
+
+        accepted = valid & (distances <= thresholds)
+        with np.errstate(over='ignore', invalid='ignore'):
+            if self.settings['enabled']:
+                confidence = 1 / (1 + np.exp(-self.slope * (thresholds - distances)))
+            else:
+                confidence = 1 - distances
+        return accepted, np.where(valid, confidence, 0.0)
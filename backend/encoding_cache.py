@@ -0,0 +1,122 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# 感知哈希命中后核对用的整帧缩略图和人脸小图边长
+THUMBNAIL_SIZE = 32
+PATCH_SIZE = 16
+
+
+def content_key(rgb_image):
+    """解码后图像像素的哈希（包含尺寸）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(rgb_image.shape).encode())
+    digest.update(np.ascontiguousarray(rgb_image).data)
+    return 'c:' + digest.hexdigest()
+
+
+def perceptual_key(rgb_image):
+    """64位差值哈希(dHash)：轻微噪声/压缩差异的帧得到相同的键"""
+    gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY) if rgb_image.ndim == 3 else rgb_image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = int(np.packbits(bits).view('>u8')[0])
+    return f'p:{rgb_image.shape[0]}x{rgb_image.shape[1]}:{value:016x}'
+
+
+def region_signature(rgb_image, face_locations):
+    """整帧缩略图加每个已检测人脸框的小图（灰度）
+
+    整帧8×9的dHash在静态背景前换了一个人时可能不变；命中后在这些区域上
+    逐像素核对，画面中有人进出或人脸换了人时拒绝命中。
+    """
+    gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY) if rgb_image.ndim == 3 else rgb_image
+    patches = [cv2.resize(gray, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)]
+    height, width = gray.shape
+    for top, right, bottom, left in face_locations:
+        crop = gray[max(top, 0):min(bottom, height), max(left, 0):min(right, width)]
+        if crop.size:
+            patches.append(cv2.resize(crop, (PATCH_SIZE, PATCH_SIZE), interpolation=cv2.INTER_AREA))
+    return np.concatenate([patch.ravel() for patch in patches]).astype(np.int16)
+
+
+class EncodingCache:
+    """检测+编码结果的LRU缓存（按条数和TTL淘汰），比对不缓存
+
+    感知哈希模式下条目同时保存region_signature，命中时与新帧比较，
+    任一像素灰度差超过tolerance即按未命中处理。
+    """
+
+    def __init__(self, max_entries=None, ttl=None, perceptual=None, metrics=None, tolerance=None):
+        self.max_entries = int(os.getenv('ENCODING_CACHE_SIZE', 256)) if max_entries is None else max_entries
+        self.ttl = float(os.getenv('ENCODING_CACHE_TTL', 60)) if ttl is None else ttl
+        if perceptual is None:
+            perceptual = os.getenv('ENCODING_CACHE_PERCEPTUAL', 'False').lower() == 'true'
+        self.perceptual = perceptual
+        self.tolerance = int(os.getenv('ENCODING_CACHE_TOLERANCE', 16)) if tolerance is None else tolerance
+        self.metrics = metrics
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, rgb_image):
+        return perceptual_key(rgb_image) if self.perceptual else content_key(rgb_image)
+
+    def get(self, key, rgb_image=None):
+        """命中时返回缓存的 (face_locations, face_encodings)，否则返回None
+
+        感知哈希模式下需传入rgb_image，在缓存的人脸区域上核对后才算命中。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+        if entry is not None and entry[2] is not None:
+            signature = region_signature(rgb_image, entry[1][0]) if rgb_image is not None else None
+            if signature is None or signature.shape != entry[2].shape or \
+                    np.abs(signature - entry[2]).max() > self.tolerance:
+                self._count('encoding_cache_rejected')
+                entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+
+        self._count('encoding_cache_hits' if entry is not None else 'encoding_cache_misses')
+        return entry[1] if entry is not None else None
+
+    def put(self, key, detection, rgb_image=None):
+        signature = region_signature(rgb_image, detection[0]) if self.perceptual and rgb_image is not None else None
+        with self._lock:
+            self._entries[key] = (time.monotonic(), detection, signature)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.increment(name)
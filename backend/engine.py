@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+
+from face_system import detect_and_encode_batch, warm_up
+from encoding_cache import EncodingCache
+import enrollment
+
+
+class EngineBusy(Exception):
+    """任务队列已满，调用方应稍后重试"""
+
+
+def _detect_and_encode_chunk(rgb_images):
+    """工作进程中执行：逐张检测，整块一次编码，返回 (detections, timings)"""
+    timings = {}
+    detections = detect_and_encode_batch(rgb_images, timings)
+    return detections, timings
+
+
+def _init_worker():
+    """工作进程启动时加载并预热一次检测/编码模型"""
+    warm_up()
+
+
+class RecognitionEngine:
+    """识别引擎：检测和编码交给工作进程池，比对在主进程的特征库上完成
+
+    特征库只保存在主进程中，工作进程只持有模型，因此增加工作进程
+    不会成倍增加特征库内存。
+    """
+
+    def __init__(self, face_system, workers=None, queue_size=None, cache=None):
+        self.face_system = face_system
+        # 检测+编码结果缓存；比对每次都重新做，新注册的人脸能立即生效
+        self.cache = cache if cache is not None else EncodingCache(metrics=face_system.metrics)
+        self.workers = int(os.getenv('RECOGNITION_WORKERS', 0)) if workers is None else workers
+        if queue_size is None:
+            queue_size = int(os.getenv('RECOGNITION_QUEUE_SIZE', max(2 * self.workers, 8)))
+        self.queue_size = queue_size
+
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._register_lock = threading.Lock()
+
+        self._executor = None
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+
+    @property
+    def queue_depth(self):
+        """正在排队或执行的任务数"""
+        return self._pending
+
+    @contextmanager
+    def _job(self):
+        """占用一个队列位置；队列已满时抛出EngineBusy"""
+        if not self._slots.acquire(blocking=False):
+            raise EngineBusy(f"Recognition queue is full ({self.queue_size} jobs)")
+
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            yield
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _submit(self, rgb_images):
+        """占用一个队列位置，在进程池（或当前线程）中检测并编码"""
+        with self._job():
+            detections = [None] * len(rgb_images)
+            keys = [None] * len(rgb_images)
+            if self.cache.enabled:
+                with self.face_system.metrics.timer('cache_lookup_ms'):
+                    keys = [self.cache.key(rgb_image) for rgb_image in rgb_images]
+                    detections = [self.cache.get(key, rgb_image) for key, rgb_image in zip(keys, rgb_images)]
+
+            misses = [i for i, detection in enumerate(detections) if detection is None]
+            missing_images = [rgb_images[i] for i in misses]
+            # 未命中的图像按工作进程数分块：块间并行，块内的人脸一次性编码
+            chunk_count = min(max(self.workers, 1), len(missing_images))
+            chunks = [missing_images[c::chunk_count] for c in range(chunk_count)]
+            if self._executor is None:
+                outputs = [_detect_and_encode_chunk(chunk) for chunk in chunks]
+            else:
+                outputs = list(self._executor.map(_detect_and_encode_chunk, chunks))
+
+            for c, (chunk_detections, timings) in enumerate(outputs):
+                self.face_system.metrics.observe_all(timings)
+                for i, detection in zip(misses[c::chunk_count], chunk_detections):
+                    detections[i] = detection
+                    if keys[i] is not None:
+                        self.cache.put(keys[i], detection, rgb_images[i])
+            return detections
+
+    def recognize_batch(self, rgb_images):
+        """批量识别RGB图像"""
+        return self.face_system.match_detections(self._submit(rgb_images))
+
+    def recognize_face(self, image):
+        """识别OpenCV(BGR)图像"""
+        with self.face_system.metrics.timer('color_convert_ms'):
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.recognize_batch([rgb_image])[0]
+
+    def add_new_face(self, image, name):
+        """注册OpenCV(BGR)图像"""
+        return self.register_rgb(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), name)
+
+    def register_rgb(self, rgb_image, name):
+        """在工作进程中编码，在主进程中注册"""
+        detection = self._submit([rgb_image])[0]
+        with self._register_lock:
+            return self.face_system.register_detection(detection, name)
+
+    def enroll(self, items):
+        """批量注册 (文件名, 姓名, 图像字节) 列表：整批只占一个队列位置，写入时持有注册锁"""
+        with self._job():
+            return enrollment.enroll(
+                self.face_system, items, self._executor,
+                max_pending=4 * max(self.workers, 1), commit_lock=self._register_lock
+            )
+
+    def warm_up(self):
+        """预热：无工作进程时在当前进程加载模型，否则让每个工作进程启动并加载模型
+
+        进程池按需创建进程，不预热时第一批请求要承担进程启动和模型加载的开销。
+        """
+        if self._executor is None:
+            return warm_up()
+        start = time.perf_counter()
+        list(self._executor.map(warm_up, [None] * self.workers))
+        return time.perf_counter() - start
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
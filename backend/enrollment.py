@@ -0,0 +1,191 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from face_system import detect_and_encode
+from image_decode import decode_image, DECODE_LIMITS, ImageDecodeError, ImageTooLarge
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def name_from_path(path):
+    """<姓名>/<任意>.jpg 取目录名，平铺的 <姓名>.jpg 取文件名"""
+    parts = path.replace('\\', '/').split('/')
+    if len(parts) > 1 and parts[-2]:
+        return parts[-2]
+    return os.path.splitext(parts[-1])[0]
+
+
+def _is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(path).startswith('.')
+
+
+def iter_directory(directory):
+    """遍历目录，逐个产出 (相对路径, 姓名, 文件路径)；由工作进程自己读文件"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, directory)
+            if _is_image(relative):
+                yield relative, name_from_path(relative), path
+
+
+def _oversized(size):
+    """归档条目声明的解压大小超过限制时返回 ImageTooLarge，由 encode_item 记为该图像的失败"""
+    if size > DECODE_LIMITS['max_bytes']:
+        return ImageTooLarge(f"Image exceeds {DECODE_LIMITS['max_bytes']} bytes")
+    return None
+
+
+def iter_archive(fileobj):
+    """流式读取zip/tar归档，逐个产出 (归档内路径, 姓名, 图像字节)；超限条目不解压"""
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    source = _oversized(info.file_size) or archive.read(info)
+                    yield info.filename, name_from_path(info.filename), source
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and _is_image(member.name):
+                source = _oversized(member.size) or archive.extractfile(member).read()
+                yield member.name, name_from_path(member.name), source
+
+
+def iter_source(source):
+    """目录或归档文件路径"""
+    if os.path.isdir(source):
+        yield from iter_directory(source)
+    else:
+        with open(source, 'rb') as f:
+            yield from iter_archive(f)
+
+
+def encode_item(item):
+    """解码并编码一张注册照片，返回 (文件名, 姓名, 特征或None, 错误或None)
+
+    在工作进程中执行；item 的第三项是文件路径、图像字节，或归档读取时已判定的 ImageTooLarge。
+    """
+    filename, name, source = item
+    if isinstance(source, ImageTooLarge):
+        return filename, name, None, str(source)
+    try:
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                source = f.read()
+        try:
+            # 注册照片按原分辨率解码
+            rgb_image, _ = decode_image(source, max_width=0)
+        except ImageTooLarge as e:
+            return filename, name, None, str(e)
+        except ImageDecodeError:
+            return filename, name, None, 'Invalid image data'
+
+        _, face_encodings, low_quality = detect_and_encode(rgb_image)
+        faces = len(face_encodings) + len(low_quality)
+        if faces == 0:
+            return filename, name, None, 'No face detected'
+        if faces > 1:
+            return filename, name, None, f'Multiple faces detected ({faces})'
+        if low_quality:
+            return filename, name, None, f'Low quality face ({low_quality[0][1]})'
+        return filename, name, face_encodings[0], None
+    except Exception as e:
+        return filename, name, None, str(e)
+
+
+def bounded_map(function, items, executor=None, max_pending=64):
+    """按顺序产出 function(item)；进程池中最多同时挂起 max_pending 个任务，避免整个目录读入内存"""
+    if executor is None:
+        for item in items:
+            yield function(item)
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def encode_items(items, executor=None, max_pending=64):
+    """并行编码，返回 (encodings, names, failures)"""
+    encodings, names, failures = [], [], []
+    for filename, name, encoding, error in bounded_map(encode_item, items, executor, max_pending):
+        if error is None:
+            encodings.append(encoding)
+            names.append(name)
+        else:
+            failures.append({'filename': filename, 'name': name, 'error': error})
+    return encodings, names, failures
+
+
+def enroll(face_system, items, executor=None, max_pending=64, commit_lock=None):
+    """批量注册：先并行编码全部照片，再一次性写入特征库，返回汇总"""
+    start = time.perf_counter()
+    encodings, names, failures = encode_items(items, executor, max_pending)
+    encoded = time.perf_counter()
+    with commit_lock or nullcontext():
+        face_system.save_faces(encodings, names)
+
+    return {
+        'enrolled': len(names),
+        'failed': len(failures),
+        'failures': failures,
+        'encode_seconds': encoded - start,
+        'commit_seconds': time.perf_counter() - encoded,
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    from face_system import FaceRecognitionSystem
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Bulk enrolment from a directory or zip/tar archive")
+    parser.add_argument('source', help="<name>/<photo>.jpg directory tree, flat <name>.jpg files, or an archive of either")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--dry-run', action='store_true', help="encode and report failures without saving")
+    args = parser.parse_args()
+
+    encryption_key = os.getenv('ENCRYPTION_KEY')
+    if not args.dry_run and (not encryption_key or encryption_key == 'your-32-character-encryption-key-here'):
+        sys.exit("ENCRYPTION_KEY must be set so the enrolled faces can be read back")
+
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    try:
+        items = iter_source(args.source)
+        if args.dry_run:
+            encodings, _, failures = encode_items(items, executor, max_pending=4 * args.workers)
+            summary = {'enrolled': 0, 'encoded': len(encodings), 'failed': len(failures), 'failures': failures}
+        else:
+            summary = enroll(FaceRecognitionSystem(), items, executor, max_pending=4 * args.workers)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for failure in summary['failures']:
+        print(f"FAILED {failure['filename']}: {failure['error']}")
+    print(f"Enrolled {summary['enrolled']} faces, {summary['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
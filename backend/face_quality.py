@@ -0,0 +1,87 @@
+import math
+import os
+
+import cv2
+import numpy as np
+
+# 清晰度在统一缩放到该边长的人脸灰度图上计算，与人脸大小无关
+SHARPNESS_SIZE = 64
+# 鼻尖深度与两眼间距之比的经验值，用于从鼻尖偏移估算偏转角
+NOSE_DEPTH_RATIO = 0.55
+
+
+class LowQualityFace(ValueError):
+    """注册照片中只有不合格的人脸"""
+
+
+def quality_settings():
+    """从环境变量读取人脸质量门限；阈值为0表示不检查该项"""
+    return {
+        'enabled': os.getenv('FACE_QUALITY_GATE', 'True').lower() == 'true',
+        # 人脸框短边的最小像素数（原图坐标）
+        'min_size': int(os.getenv('FACE_MIN_SIZE', 40)),
+        # 拉普拉斯方差低于该值视为模糊
+        'min_sharpness': float(os.getenv('FACE_MIN_SHARPNESS', 25)),
+        # 估算的左右偏转角（度）超过该值视为侧脸
+        'max_yaw': float(os.getenv('FACE_MAX_YAW', 60)),
+    }
+
+# 预热等内部调用使用：不做任何检查
+NO_QUALITY_GATE = {'enabled': False, 'min_size': 0, 'min_sharpness': 0, 'max_yaw': 0}
+
+
+def face_size(location):
+    top, right, bottom, left = location
+    return min(bottom - top, right - left)
+
+
+def sharpness(rgb_image, location):
+    """人脸区域的拉普拉斯方差，越大越清晰"""
+    top, right, bottom, left = location
+    crop = rgb_image[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    gray = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def estimate_yaw(landmarks):
+    """由5点关键点（两眼和鼻尖）估算左右偏转角（度）
+
+    正脸时鼻尖在两眼中点正下方；转头时鼻尖相对两眼中点的水平偏移
+    约为 tan(yaw) * 鼻尖深度。
+    """
+    left_eye = np.mean(landmarks['left_eye'], axis=0)
+    right_eye = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.mean(landmarks['nose_tip'], axis=0)
+
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance == 0:
+        return 90.0
+    offset = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+    return math.degrees(math.atan(offset / NOSE_DEPTH_RATIO))
+
+
+def assess_faces(rgb_image, face_locations, face_landmarks, quality):
+    """依次检查大小、清晰度和姿态，返回每张人脸不合格的原因（合格为None）
+
+    face_landmarks(rgb_image, locations) 返回5点关键点；只对通过前两项检查的人脸调用。
+    """
+    reasons = [None] * len(face_locations)
+    if not quality['enabled']:
+        return reasons
+
+    for i, location in enumerate(face_locations):
+        if quality['min_size'] > 0 and face_size(location) < quality['min_size']:
+            reasons[i] = 'too_small'
+        elif quality['min_sharpness'] > 0 and sharpness(rgb_image, location) < quality['min_sharpness']:
+            reasons[i] = 'blurry'
+
+    candidates = [i for i, reason in enumerate(reasons) if reason is None]
+    if quality['max_yaw'] > 0 and candidates:
+        landmarks = face_landmarks(rgb_image, [face_locations[i] for i in candidates])
+        for i, face in zip(candidates, landmarks):
+            if estimate_yaw(face) > quality['max_yaw']:
+                reasons[i] = 'pose'
+    return reasons
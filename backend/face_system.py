@@ -0,0 +1,526 @@
+import cv2
+import numpy as np
+import os
+import tempfile
+from cryptography.fernet import Fernet
+from dotenv import load_dotenv
+import base64
+from gallery import FaceGallery
+from calibration import ScoreCalibrator
+from gallery_store import GalleryStore, GalleryCipher
+from telemetry import MetricsBuffer
+from face_quality import assess_faces, quality_settings, LowQualityFace, NO_QUALITY_GATE
+import threading
+import time
+
+load_dotenv()
+
+def detection_settings():
+    """从环境变量读取检测/编码配置"""
+    return {
+        'model': os.getenv('FACE_DETECTION_MODEL', 'hog'),
+        'upsample': int(os.getenv('FACE_DETECTION_UPSAMPLE', 1)),
+        # 大于0时，检测在缩小到该宽度的副本上进行
+        'max_width': int(os.getenv('DETECTION_MAX_WIDTH', 0)),
+        # 已注册的特征都由small(5点)模型生成，查询必须使用同一模型；不读取FACE_ENCODING_MODEL，
+        # 否则沿用.env.example中的large会让查询与特征库不可比
+        'encoding_model': 'small',
+    }
+
+DETECTION_SETTINGS = detection_settings()
+QUALITY_SETTINGS = quality_settings()
+
+_face_api = None
+
+def face_api():
+    """首次调用时才导入face_recognition库（导入时会加载dlib模型，耗时较长）"""
+    global _face_api
+    if _face_api is None:
+        import face_recognition
+        _face_api = face_recognition
+    return _face_api
+
+def warm_up(settings=None):
+    """加载模型并在空白图像上跑一遍检测和编码，返回耗时（秒）"""
+    start = time.perf_counter()
+    # 空白图像通不过质量检查，预热时跳过检查以确保编码模型也被加载
+    detect_and_encode(np.zeros((64, 64, 3), dtype=np.uint8), settings=settings, quality=NO_QUALITY_GATE)
+    return time.perf_counter() - start
+
+def detect_faces(rgb_image, settings=None):
+    """在（可选）缩小的图像上检测人脸，并把人脸框换算回原图坐标"""
+    settings = settings or DETECTION_SETTINGS
+    height, width = rgb_image.shape[:2]
+    max_width = settings['max_width']
+    
+    if max_width <= 0 or width <= max_width:
+        return face_api().face_locations(
+            rgb_image,
+            number_of_times_to_upsample=settings['upsample'],
+            model=settings['model']
+        )
+    
+    scale = max_width / width
+    small_image = cv2.resize(rgb_image, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small_locations = face_api().face_locations(
+        small_image,
+        number_of_times_to_upsample=settings['upsample'],
+        model=settings['model']
+    )
+    
+    face_locations = []
+    for top, right, bottom, left in small_locations:
+        face_locations.append((
+            max(int(round(top / scale)), 0),
+            min(int(round(right / scale)), width),
+            min(int(round(bottom / scale)), height),
+            max(int(round(left / scale)), 0)
+        ))
+    return face_locations
+
+def face_landmarks(rgb_image, face_locations):
+    """5点关键点（两眼和鼻尖），用于质量检查中的姿态估计"""
+    return face_api().face_landmarks(rgb_image, face_locations, model='small')
+
+def filter_faces(rgb_image, face_locations, quality=None):
+    """质量检查，返回 (合格的人脸框, [(不合格的人脸框, 原因)])"""
+    quality = quality or QUALITY_SETTINGS
+    reasons = assess_faces(rgb_image, face_locations, face_landmarks, quality)
+    accepted = [location for location, reason in zip(face_locations, reasons) if reason is None]
+    low_quality = [(location, reason) for location, reason in zip(face_locations, reasons) if reason is not None]
+    return accepted, low_quality
+
+def _add_timings(timings, start, located, gated):
+    if timings is not None:
+        timings['face_locations_ms'] = timings.get('face_locations_ms', 0) + (located - start) * 1000
+        timings['face_quality_ms'] = timings.get('face_quality_ms', 0) + (gated - located) * 1000
+        timings['face_encodings_ms'] = timings.get('face_encodings_ms', 0) + (time.perf_counter() - gated) * 1000
+
+def detect_and_encode(rgb_image, timings=None, settings=None, quality=None):
+    """检测RGB图像中的人脸，只为通过质量检查的人脸在原分辨率上计算特征
+
+    返回 (face_locations, face_encodings, low_quality)，low_quality 为
+    [(人脸框, 原因)]。传入timings字典时，把各阶段耗时（毫秒）累加进去。
+    """
+    settings = settings or DETECTION_SETTINGS
+    start = time.perf_counter()
+    face_locations = detect_faces(rgb_image, settings)
+    located = time.perf_counter()
+    face_locations, low_quality = filter_faces(rgb_image, face_locations, quality)
+    gated = time.perf_counter()
+    face_encodings = face_api().face_encodings(
+        rgb_image, face_locations, model=settings['encoding_model']
+    ) if face_locations else []
+    
+    _add_timings(timings, start, located, gated)
+    return face_locations, face_encodings, low_quality
+
+def _encode_batch_dlib(rgb_images, locations_list, model):
+    """用dlib的批量接口一次计算多张图像中所有人脸的特征"""
+    import dlib
+    api = face_api().api
+    
+    images, batch_faces, owners = [], [], []
+    for i, (rgb_image, face_locations) in enumerate(zip(rgb_images, locations_list)):
+        if len(face_locations) == 0:
+            continue
+        shapes = dlib.full_object_detections()
+        for shape in api._raw_face_landmarks(rgb_image, face_locations, model):
+            shapes.append(shape)
+        images.append(rgb_image)
+        batch_faces.append(shapes)
+        owners.append(i)
+    
+    encodings_list = [[] for _ in rgb_images]
+    if images:
+        # num_jitters=1，与face_recognition.face_encodings默认一致
+        descriptors = api.face_encoder.compute_face_descriptor(images, batch_faces, 1)
+        for owner, image_descriptors in zip(owners, descriptors):
+            encodings_list[owner] = [np.array(descriptor) for descriptor in image_descriptors]
+    return encodings_list
+
+def encode_faces(rgb_images, locations_list, settings=None):
+    """为多张图像中的人脸计算特征，能用批量接口时只调用一次模型"""
+    settings = settings or DETECTION_SETTINGS
+    if sum(len(face_locations) for face_locations in locations_list) > 1:
+        try:
+            return _encode_batch_dlib(rgb_images, locations_list, settings['encoding_model'])
+        except Exception:
+            # 旧版dlib没有批量接口时逐张计算
+            pass
+    return [
+        face_api().face_encodings(rgb_image, face_locations, model=settings['encoding_model'])
+        for rgb_image, face_locations in zip(rgb_images, locations_list)
+    ]
+
+def detect_and_encode_batch(rgb_images, timings=None, settings=None, quality=None):
+    """逐张检测和质量检查，所有图像中合格的人脸一次性编码
+
+    返回每张图像的 (face_locations, face_encodings, low_quality)。
+    """
+    settings = settings or DETECTION_SETTINGS
+    start = time.perf_counter()
+    locations_list = [detect_faces(rgb_image, settings) for rgb_image in rgb_images]
+    located = time.perf_counter()
+    filtered = [filter_faces(rgb_image, face_locations, quality)
+                for rgb_image, face_locations in zip(rgb_images, locations_list)]
+    locations_list = [face_locations for face_locations, _ in filtered]
+    gated = time.perf_counter()
+    encodings_list = encode_faces(rgb_images, locations_list, settings)
+    
+    _add_timings(timings, start, located, gated)
+    return [(face_locations, face_encodings, low_quality)
+            for (face_locations, low_quality), face_encodings in zip(filtered, encodings_list)]
+
+class FaceRecognitionSystem:
+    def __init__(self, metrics=None):
+        # 各阶段耗时的直方图
+        self.metrics = metrics if metrics is not None else MetricsBuffer()
+        
+        self.known_faces_dir = os.getenv('KNOWN_FACES_DIR', './data/known_faces')
+        self.unknown_faces_dir = os.getenv('UNKNOWN_FACES_DIR', './data/unknown_faces')
+        
+        # 加密配置
+        encryption_key = os.getenv('ENCRYPTION_KEY')
+        # 未配置密钥时生成临时密钥用于开发；用临时密钥写入的数据重启后无法解密，
+        # 因此不读写KNOWN_FACES_DIR，特征库只保存在本次运行的临时目录中
+        self.ephemeral_key = not encryption_key or encryption_key == 'your-32-character-encryption-key-here'
+        if self.ephemeral_key:
+            encryption_key = Fernet.generate_key().decode()
+        self.encryption_key = encryption_key.encode()
+        self.cipher = Fernet(self.encryption_key)
+        
+        self.gallery = FaceGallery()
+        
+        # 匹配配置在启动时读取一次
+        self.shortlist = int(os.getenv('PERSON_SHORTLIST', 8))
+        self.compact_threshold = int(os.getenv('GALLERY_COMPACT_THRESHOLD', 1000))
+        self.calibration = ScoreCalibrator()
+        
+        # 写入、同步和合并互斥；识别只取特征库的读锁，不取这把锁
+        self._sync_lock = threading.RLock()
+        self._sync_stop = threading.Event()
+        self._sync_thread = None
+        
+        self.load_known_faces()
+    
+    @property
+    def known_face_encodings(self):
+        return self.gallery.encodings
+    
+    @property
+    def known_face_names(self):
+        return self.gallery.names
+    
+    def encrypt_data(self, data):
+        """加密数据"""
+        if isinstance(data, np.ndarray):
+            data = data.tobytes()
+        elif isinstance(data, str):
+            data = data.encode()
+        return self.cipher.encrypt(data)
+    
+    def decrypt_data(self, encrypted_data):
+        """解密数据"""
+        decrypted = self.cipher.decrypt(encrypted_data)
+        return decrypted
+    
+    @property
+    def face_ids(self):
+        """每行特征的持久化ID（旧格式文件加载的为None）"""
+        return self.gallery.ids
+    
+    def load_known_faces(self):
+        """加载已知人脸"""
+        directory = self.known_faces_dir
+        if self.ephemeral_key:
+            self._ephemeral_dir = tempfile.TemporaryDirectory(prefix='face-gallery-')
+            directory = self._ephemeral_dir.name
+            print(f"ENCRYPTION_KEY is not set: faces in {self.known_faces_dir} are not loaded and "
+                  f"new registrations are kept only until restart")
+        self.store = GalleryStore(directory, GalleryCipher(self.encryption_key))
+        
+        ids, names, encodings = self.store.load()
+        self.gallery.add_many(encodings, names, ids)
+        self._known_ids = set(ids)
+        # 已应用到的特征库版本
+        self._generation = self.store.loaded_generation
+        self._journal_offset = self.store.journal_offset
+        print(f"Loaded {len(names)} faces from {self.store.snapshot_path}")
+        
+        # 兼容尚未迁移的旧格式文件
+        legacy_files = self.store.legacy_files()
+        if legacy_files:
+            names, encodings, _ = self.store.load_legacy()
+            self.gallery.add_many(encodings, names)
+            print(f"Loaded {len(names)} legacy faces; "
+                  f"run 'python gallery_store.py migrate' to convert them")
+        
+        self.compact_if_needed()
+        self.calibration.fit(self.gallery)
+    
+    def compact_if_needed(self):
+        """日志过长或快照仍是旧版本时合并进快照"""
+        if self.store.journal_count < self.compact_threshold and not self.store.needs_upgrade:
+            return
+        if self.store.unreadable_records:
+            # 不自动丢弃无法解密的记录，需人工确认后用 gallery_store.py compact --drop-unreadable
+            print(f"Not compacting: {self.store.unreadable_records} journal records could not be decrypted")
+            return
+        with self._sync_lock:
+            # 回放其他进程在合并前追加的记录后，内存特征库即等于新一代快照，
+            # 同步线程不必再整体重新加载
+            try:
+                records, generation = self.store.compact_from(self._generation, self._journal_offset)
+            except ValueError as e:
+                # 其他进程刚写入了无法解密的记录；本次写入已落盘，下次再合并
+                print(f"Not compacting: {e}")
+                return
+            if records is None:
+                return
+            if self._apply_records(records):
+                self.calibration.refresh(self.gallery)
+            self._generation, self._journal_offset = generation, 0
+    
+    def save_face(self, face_encoding, name):
+        """保存人脸数据（追加到加密日志）"""
+        with self._sync_lock:
+            face_id = self.store.append(face_encoding, name)
+            
+            # 更新内存中的数据
+            self.gallery.add(face_encoding, name, face_id)
+            self._known_ids.add(face_id)
+            self.calibration.refresh(self.gallery)
+            self.compact_if_needed()
+        
+        print(f"Saved face: {name}")
+    
+    def save_faces(self, face_encodings, names):
+        """批量保存人脸数据：一次写入并fsync，再整体加入特征库"""
+        if len(names) == 0:
+            return []
+        with self._sync_lock:
+            face_ids = self.store.append_many(face_encodings, names)
+            
+            self.gallery.add_many(face_encodings, names, face_ids)
+            self._known_ids.update(face_ids)
+            self.calibration.refresh(self.gallery)
+            self.compact_if_needed()
+        
+        print(f"Saved {len(names)} faces")
+        return face_ids
+    
+    def list_people(self, offset=0, limit=None):
+        """分页列出已注册的人，返回 ([(姓名, 特征条数)], 总人数)"""
+        return self.gallery.list_people(offset, limit)
+    
+    def person_face_ids(self, name):
+        """某人所有特征的ID；不存在时返回空列表
+
+        旧格式文件加载、尚未迁移的特征没有ID，无法删除或改名，不列出。
+        """
+        return self.gallery.face_ids_of(name)
+    
+    def delete_faces(self, face_ids):
+        """删除给定ID的特征（写墓碑后从内存特征库swap-remove），返回删除条数"""
+        with self._sync_lock:
+            face_ids = [face_id for face_id in face_ids if face_id in self.gallery.slots]
+            if not face_ids:
+                return 0
+            self.store.delete(face_ids)
+            for face_id in face_ids:
+                self.gallery.remove(self.gallery.slots[face_id])
+            self.calibration.refresh(self.gallery)
+            self.compact_if_needed()
+        return len(face_ids)
+    
+    def delete_person(self, name):
+        """删除某人的全部特征，返回删除条数"""
+        with self._sync_lock:
+            return self.delete_faces(self.person_face_ids(name))
+    
+    def rename_person(self, name, new_name):
+        """把某人的全部特征改名（新名字已存在时合并），返回改名条数"""
+        with self._sync_lock:
+            face_ids = self.person_face_ids(name)
+            if not face_ids or name == new_name:
+                return 0
+            self.store.rename(face_ids, new_name)
+            for face_id in face_ids:
+                self.gallery.rename(self.gallery.slots[face_id], new_name)
+            self.calibration.refresh(self.gallery)
+            self.compact_if_needed()
+        return len(face_ids)
+    
+    def _apply_add(self, face_ids, names, encodings):
+        new = [i for i, face_id in enumerate(face_ids) if face_id not in self._known_ids]
+        if new:
+            new_ids = [face_ids[i] for i in new]
+            self.gallery.add_many([encodings[i] for i in new], [names[i] for i in new], new_ids)
+            self._known_ids.update(new_ids)
+        return len(new)
+    
+    def _apply_delete(self, face_id):
+        if face_id not in self.gallery.slots:
+            return 0
+        self.gallery.remove(self.gallery.slots[face_id])
+        return 1
+    
+    def _apply_rename(self, face_id, name):
+        row = self.gallery.slots.get(face_id)
+        if row is None or self.gallery.names[row] == name:
+            return 0
+        self.gallery.rename(row, name)
+        return 1
+    
+    def _apply_records(self, records):
+        """按顺序回放日志记录，连续的新增记录攒成一批加入特征库，返回应用的变更数"""
+        changes = 0
+        pending = []
+        for op, face_id, name, encoding in records + [(None, None, None, None)]:
+            if op == 'add':
+                pending.append((face_id, name, encoding))
+                continue
+            if pending:
+                changes += self._apply_add(*zip(*pending))
+                pending = []
+            if op == 'delete':
+                changes += self._apply_delete(face_id)
+            elif op == 'rename':
+                changes += self._apply_rename(face_id, name)
+        return changes
+    
+    def sync(self):
+        """把其他进程/副本写入的变更增量应用到内存特征库，返回应用的变更数
+
+        同一代内只从上次的偏移继续读日志并按顺序回放；其他进程合并出新一代
+        快照时重新读取快照，与内存中的ID比对后只应用差异。
+        """
+        with self._sync_lock:
+            changes = 0
+            generation = self.store.generation
+            if generation == self._generation:
+                records, offset = self.store.tail_journal(generation, self._journal_offset)
+                changes += self._apply_records(records)
+            else:
+                ids, names, encodings = self.store.load()
+                generation, offset = self.store.loaded_generation, self.store.journal_offset
+                
+                current = set(ids)
+                for face_id in [face_id for face_id in self.gallery.slots if face_id not in current]:
+                    changes += self._apply_delete(face_id)
+                for face_id, name in zip(ids, names):
+                    changes += self._apply_rename(face_id, name)
+                changes += self._apply_add(ids, names, encodings)
+            
+            if changes:
+                self.calibration.refresh(self.gallery)
+                self.metrics.increment('gallery_sync_applied', changes)
+            self._generation, self._journal_offset = generation, offset
+            return changes
+    
+    def _sync_loop(self, interval):
+        while not self._sync_stop.wait(interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error syncing gallery: {e}")
+    
+    def start_sync(self, interval=None):
+        """启动后台线程定期同步特征库（GALLERY_SYNC_INTERVAL秒，0为关闭）"""
+        if interval is None:
+            interval = float(os.getenv('GALLERY_SYNC_INTERVAL', 0.5))
+        if interval <= 0 or self._sync_thread is not None:
+            return
+        self._sync_stop.clear()
+        self._sync_thread = threading.Thread(
+            target=self._sync_loop, args=(interval,), name='gallery-sync', daemon=True
+        )
+        self._sync_thread.start()
+    
+    def stop_sync(self):
+        if self._sync_thread is None:
+            return
+        self._sync_stop.set()
+        self._sync_thread.join()
+        self._sync_thread = None
+    
+    def recognize_face(self, image):
+        """识别人脸"""
+        # 转换图像格式
+        with self.metrics.timer('color_convert_ms'):
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.recognize_rgb(rgb_image)
+    
+    def recognize_rgb(self, rgb_image):
+        """识别RGB图像中的人脸"""
+        return self.recognize_batch([rgb_image])[0]
+    
+    def recognize_batch(self, rgb_images):
+        """批量识别：逐张检测和编码，所有人脸一次性与特征库比对"""
+        timings = {}
+        detections = [detect_and_encode(rgb_image, timings) for rgb_image in rgb_images]
+        self.metrics.observe_all(timings)
+        return self.match_detections(detections)
+    
+    def match_detections(self, detections):
+        """将多张图像的 (face_locations, face_encodings) 一次性比对，按图像拆分结果"""
+        all_encodings = []
+        all_locations = []
+        counts = []
+        
+        for face_locations, face_encodings, _ in detections:
+            all_encodings.extend(face_encodings)
+            all_locations.extend(face_locations)
+            counts.append(len(face_locations))
+        
+        with self.metrics.timer('match_ms'):
+            results = self.match_faces(all_encodings, all_locations)
+        
+        # 质量不合格的人脸没有特征，直接作为low_quality返回
+        batch_results = []
+        start = 0
+        for count, (_, _, low_quality) in zip(counts, detections):
+            batch_results.append(results[start:start + count] + [
+                {'name': 'Unknown', 'confidence': 0.0, 'location': location, 'low_quality': reason}
+                for location, reason in low_quality
+            ])
+            start += count
+            if low_quality:
+                self.metrics.increment('low_quality_faces', len(low_quality))
+        return batch_results
+    
+    def match_faces(self, face_encodings, face_locations):
+        """将一帧中的所有人脸一次性与特征库批量比对"""
+        if len(face_encodings) == 0:
+            return []
+        
+        # 每人取最近的一条特征，名字和置信度来自同一个人；
+        # 再与各人校准后的阈值一次性比较
+        people, distances = self.gallery.search_people(face_encodings, shortlist=self.shortlist)
+        accepted, confidences = self.calibration.score(self.gallery, people, distances)
+        
+        return [{
+            'name': self.gallery.people[people[i]] if accepted[i] else "Unknown",
+            'confidence': float(confidences[i]),
+            'location': face_location
+        } for i, face_location in enumerate(face_locations)]
+    
+    def add_new_face(self, image, name):
+        """添加新人脸"""
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.register_detection(detect_and_encode(rgb_image), name)
+    
+    def register_detection(self, detection, name):
+        """用第一张合格的人脸注册；只检测到不合格的人脸时抛出LowQualityFace"""
+        _, face_encodings, low_quality = detection
+        if len(face_encodings) == 0 and low_quality:
+            raise LowQualityFace(f"Face quality too low ({low_quality[0][1]})")
+        return self.register_encodings(face_encodings, name)
+    
+    def register_encodings(self, face_encodings, name):
+        """用检测到的第一张人脸注册"""
+        if len(face_encodings) > 0:
+            self.save_face(face_encodings[0], name)
+            return True
+        return False
@@ -0,0 +1,447 @@
+import os
+import threading
+from contextlib import contextmanager
+from itertools import chain, islice
+
+import numpy as np
+from gallery_index import create_index
+
+
+class ReadWriteLock:
+    """多读单写锁：检索可以并发，修改特征库时独占
+
+    读锁可在同一线程内重入（索引检索会回调gallery.match）；有写者等待时
+    不再放入新的读者，避免持续的识别请求让写入饿死。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            with self._condition:
+                while self._writer or self._waiting_writers:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._condition:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class FaceGallery:
+    """人脸特征库：连续的float32矩阵 + 预计算的平方范数
+
+    每行可带一个持久化ID，ids/slots 维护 行号↔ID 映射；删除时把最后一行
+    搬到被删除的位置（swap-remove），矩阵始终保持连续。
+    添加/删除/改名持有写锁，检索持有读锁，识别线程不会看到改到一半的特征库。
+
+    storage='int8'（或GALLERY_STORAGE=int8）时矩阵只保存按固定范围量化的int8编码，
+    每条特征占dim字节而不是4×dim；全库扫描分块解码，重排只解码候选行。
+    """
+
+    # int8存储时每次解码的行数，解码缓冲区约为 SCAN_BLOCK×dim×4 字节
+    SCAN_BLOCK = 4096
+
+    def __init__(self, dim=128, capacity=1024, index=None, storage=None):
+        self.dim = dim
+        self.storage = (storage or os.getenv('GALLERY_STORAGE', 'float32')).lower()
+        if self.storage not in ('float32', 'int8'):
+            raise ValueError(f"Unknown gallery storage: {self.storage}")
+        # int8编码 = round(特征 / code_scale)，超出 ±GALLERY_INT8_RANGE 的分量被截断
+        self.code_scale = np.float32(1)
+        if self.storage == 'int8':
+            self.code_scale = np.float32(float(os.getenv('GALLERY_INT8_RANGE', 0.5)) / 127)
+        self._encodings = np.zeros((max(capacity, 1), dim), dtype=self.storage)
+        self._sq_norms = np.zeros(max(capacity, 1), dtype=np.float32)
+        self.names = []
+        self.ids = []
+        self.slots = {}
+        self.size = 0
+        self.index = create_index(self, index)
+        self.lock = ReadWriteLock()
+
+        # 身份：同名的多条特征属于同一个人，维护每人的行号和特征中心
+        self.people = []
+        self.person_rows = []
+        self._person_index = {}
+        # 仍有特征的人数（删光特征的人保留序号，但不再列出）
+        self.active_people = 0
+        self._row_person = np.zeros(max(capacity, 1), dtype=np.int64)
+        # 特征中心与特征矩阵使用相同的存储格式；不保留累加和，变化时按该人的全部行重算
+        self._centroids = np.zeros((16, dim), dtype=self.storage)
+        self._centroid_sq = np.zeros(16, dtype=np.float32)
+        # 每人的距离阈值（NaN表示未校准，使用全局阈值），由calibration维护
+        self._thresholds = np.full(16, np.nan, dtype=np.float32)
+        # 特征有变化、需要重新校准的人员序号
+        self.stale_people = set()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self._encodings.shape[0]
+
+    @property
+    def encodings(self):
+        """当前有效的特征矩阵 (N×dim float32)；int8存储时为解码后的副本，只取部分行请用encodings_of"""
+        if self.storage == 'float32':
+            return self._encodings[:self.size]
+        return self.encodings_of(slice(0, self.size))
+
+    def encodings_of(self, rows):
+        """指定行的float32特征（int8存储时解码）"""
+        return self.dequantize(self._encodings[rows])
+
+    def codes_of(self, rows):
+        """指定行的存储格式（float32或int8编码），索引分区保存同样的格式；切片返回视图"""
+        return self._encodings[rows]
+
+    def quantize(self, encodings):
+        """float32特征转换为存储格式"""
+        if self.storage == 'float32':
+            return np.asarray(encodings, dtype=np.float32)
+        return np.clip(np.rint(encodings / self.code_scale), -127, 127).astype(np.int8)
+
+    def dequantize(self, codes):
+        """存储格式转换回float32特征；codes @ (q × code_scale) 等于解码后的 q·g"""
+        if self.storage == 'float32':
+            return codes
+        return codes.astype(np.float32) * self.code_scale
+
+    @property
+    def nbytes(self):
+        """特征库和索引中NumPy数组占用的字节数（含预留容量，不含姓名、行号列表等Python对象）"""
+        arrays = (self._encodings, self._sq_norms, self._row_person,
+                  self._centroids, self._centroid_sq, self._thresholds)
+        return sum(a.nbytes for a in arrays) + getattr(self.index, 'nbytes', 0)
+
+    @property
+    def sq_norms(self):
+        return self._sq_norms[:self.size]
+
+    @property
+    def row_person(self):
+        """每行特征所属的人员序号"""
+        return self._row_person[:self.size]
+
+    @property
+    def centroids(self):
+        """每人特征的均值 (P×dim float32)"""
+        return self.dequantize(self._centroids[:len(self.people)])
+
+    @property
+    def thresholds(self):
+        """每人的距离阈值 (P,)"""
+        return self._thresholds[:len(self.people)]
+
+    def _reserve(self, count):
+        """确保至少能容纳count条特征，不足时按倍数扩容"""
+        if count <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < count:
+            new_capacity *= 2
+
+        encodings = np.zeros((new_capacity, self.dim), dtype=self._encodings.dtype)
+        encodings[:self.size] = self._encodings[:self.size]
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:self.size] = self._sq_norms[:self.size]
+        row_person = np.zeros(new_capacity, dtype=np.int64)
+        row_person[:self.size] = self._row_person[:self.size]
+
+        self._encodings = encodings
+        self._sq_norms = sq_norms
+        self._row_person = row_person
+
+    def _reserve_people(self, count):
+        """确保中心矩阵至少能容纳count个人，不足时按倍数扩容"""
+        capacity = len(self._centroids)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+
+        extra = capacity - len(self._centroids)
+        self._centroids = np.concatenate((self._centroids, np.zeros((extra, self.dim), dtype=self.storage)))
+        self._centroid_sq = np.concatenate((self._centroid_sq, np.zeros(extra, dtype=np.float32)))
+        self._thresholds = np.concatenate((self._thresholds, np.full(extra, np.nan, dtype=np.float32)))
+
+    def _update_people(self, rows, names):
+        """把新行计入各自人员（按姓名新建人员），并重算受影响人员的中心"""
+        if len(rows) == 0:
+            return
+        persons = []
+        for row, name in zip(rows, names):
+            person = self._person_index.get(name)
+            if person is None:
+                person = len(self.people)
+                self._person_index[name] = person
+                self.people.append(name)
+                self.person_rows.append([])
+            if not self.person_rows[person]:
+                self.active_people += 1
+            self.person_rows[person].append(row)
+            persons.append(person)
+        self._reserve_people(len(self.people))
+        persons = np.array(persons, dtype=np.int64)
+        self._row_person[rows] = persons
+        touched = np.unique(persons)
+        self._refresh_centroids(touched)
+        self.stale_people.update(touched.tolist())
+
+    def _refresh_centroids(self, persons):
+        """按各人当前的全部行重算特征中心，O(这些人的特征数)"""
+        counts = np.array([len(self.person_rows[p]) for p in persons], dtype=np.int64)
+        # 没有特征的人不参与中心粗筛
+        empty = persons[counts == 0]
+        self._centroids[empty] = 0
+        self._centroid_sq[empty] = np.inf
+        persons, counts = persons[counts > 0], counts[counts > 0]
+        if len(persons) == 0:
+            return
+
+        # 分段求和；只有一行的人直接取该行，
+        # 其余用reduceat（np.add.at和逐段reduceat在大批量导入时都很慢）
+        rows = np.fromiter(chain.from_iterable(self.person_rows[p] for p in persons),
+                           dtype=np.int64, count=int(counts.sum()))
+        encodings = self.encodings_of(rows)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = encodings[starts].astype(np.float64)
+        multi = counts > 1
+        if multi.any():
+            in_multi = np.repeat(multi, counts)
+            multi_starts = np.concatenate(([0], np.cumsum(counts[multi])[:-1]))
+            sums[multi] = np.add.reduceat(encodings[in_multi], multi_starts, axis=0, dtype=np.float64)
+
+        codes = self.quantize((sums / counts[:, None]).astype(np.float32))
+        centroids = self.dequantize(codes)
+        self._centroids[persons] = codes
+        self._centroid_sq[persons] = np.einsum('ij,ij->i', centroids, centroids)
+
+    def add(self, encoding, name, face_id=None):
+        """添加一条特征，返回其行号"""
+        return self.add_many([encoding], [name], None if face_id is None else [face_id])[0]
+
+    def add_many(self, encodings, names, ids=None):
+        """批量添加特征，返回新行号列表"""
+        with self.lock.write():
+            encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+            if len(encodings) != len(names):
+                raise ValueError("encodings and names must have the same length")
+            ids = [None] * len(names) if ids is None else list(ids)
+
+            start = self.size
+            end = start + len(encodings)
+            self._reserve(end)
+
+            self._encodings[start:end] = self.quantize(encodings)
+            # 范数按存储（解码）后的值计算，与扫描时用的特征一致
+            encodings = self.encodings_of(slice(start, end))
+            self._sq_norms[start:end] = np.einsum('ij,ij->i', encodings, encodings)
+            self.names.extend(names)
+            self.ids.extend(ids)
+            for row, face_id in enumerate(ids, start):
+                if face_id is not None:
+                    self.slots[face_id] = row
+            self.size = end
+
+            rows = list(range(start, end))
+            self._update_people(rows, names)
+            self.index.add(rows)
+            return rows
+
+    def _detach(self, row):
+        """把一行从其所属人员中移除"""
+        person = self._row_person[row]
+        self.person_rows[person].remove(row)
+        if not self.person_rows[person]:
+            self.active_people -= 1
+        self._refresh_centroids(np.array([person]))
+        self.stale_people.add(int(person))
+
+    def remove(self, row):
+        """删除一行：最后一行搬到该位置，O(每人特征数)"""
+        with self.lock.write():
+            last = self.size - 1
+            self._detach(row)
+            face_id = self.ids[row]
+            if face_id is not None:
+                del self.slots[face_id]
+
+            if row != last:
+                person = self._row_person[last]
+                person_rows = self.person_rows[person]
+                person_rows[person_rows.index(last)] = row
+                self._encodings[row] = self._encodings[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._row_person[row] = person
+                self.names[row] = self.names[last]
+                self.ids[row] = self.ids[last]
+                if self.ids[row] is not None:
+                    self.slots[self.ids[row]] = row
+
+            self.names.pop()
+            self.ids.pop()
+            self.size = last
+            self.index.remove(row, last)
+
+    def rename(self, row, name):
+        """把一行改到另一个人名下"""
+        with self.lock.write():
+            self._detach(row)
+            self._update_people([row], [name])
+            self.names[row] = name
+
+    def list_people(self, offset=0, limit=None):
+        """分页列出当前有特征的人员，按首次注册顺序，返回 ([(姓名, 特征条数)], 总人数)
+
+        没有删光特征的人时直接按序号切片，O(limit)；否则需要跳过前面的空人员。
+        """
+        with self.lock.read():
+            end = None if limit is None else offset + limit
+            if self.active_people == len(self.people):
+                people = zip(self.people[offset:end], self.person_rows[offset:end])
+            else:
+                people = islice(((name, rows) for name, rows in zip(self.people, self.person_rows) if rows),
+                                offset, end)
+            return [(name, len(rows)) for name, rows in people], self.active_people
+
+    def face_ids_of(self, name):
+        """某人所有特征的持久化ID（没有ID的行不列出）；不存在时返回空列表"""
+        with self.lock.read():
+            person = self._person_index.get(name)
+            if person is None:
+                return []
+            ids = (self.ids[row] for row in self.person_rows[person])
+            return [face_id for face_id in ids if face_id is not None]
+
+    def distances(self, queries):
+        """一次性计算所有查询与库中特征的欧氏距离 (faces × gallery)"""
+        with self.lock.read():
+            queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+            query_sq = np.einsum('ij,ij->i', queries, queries)
+
+            # |q - g|^2 = |q|^2 + |g|^2 - 2 q·g
+            dist_sq = self._scan(queries, self._encodings[:self.size])
+            dist_sq *= -2
+            dist_sq += query_sq[:, None]
+            dist_sq += self.sq_norms[None, :]
+            np.maximum(dist_sq, 0, out=dist_sq)
+            return np.sqrt(dist_sq, out=dist_sq)
+
+    def _scan(self, queries, codes):
+        """queries与存储格式矩阵codes中每行的内积；int8编码分块转换到复用的float32缓冲区，缩放因子乘在查询上"""
+        if self.storage == 'float32':
+            return queries @ codes.T
+        scaled = queries * self.code_scale
+        dots = np.empty((len(queries), len(codes)), dtype=np.float32)
+        block = np.empty((min(self.SCAN_BLOCK, len(codes)), self.dim), dtype=np.float32)
+        for start in range(0, len(codes), self.SCAN_BLOCK):
+            end = min(start + self.SCAN_BLOCK, len(codes))
+            block[:end - start] = codes[start:end]
+            dots[:, start:end] = scaled @ block[:end - start].T
+        return dots
+
+    def search(self, queries, k=1):
+        """通过配置的索引检索最近的k条特征"""
+        with self.lock.read():
+            if self.size == 0:
+                return self.match(queries, k)
+            return self.index.search(queries, k)
+
+    def match(self, queries, k=1):
+        """精确扫描：返回每个查询最近的k条特征 (indices, distances)，按距离升序"""
+        with self.lock.read():
+            queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+            k = min(k, self.size)
+            if k == 0:
+                empty = np.empty((len(queries), 0))
+                return empty.astype(np.int64), empty.astype(np.float32)
+
+            distances = self.distances(queries)
+            if k == 1:
+                indices = np.argmin(distances, axis=1)[:, None]
+            else:
+                indices = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                order = np.argsort(np.take_along_axis(distances, indices, axis=1), axis=1)
+                indices = np.take_along_axis(indices, order, axis=1)
+
+            return indices, np.take_along_axis(distances, indices, axis=1)
+
+    def _candidate_people(self, queries, shortlist):
+        """第一轮：取每个查询最可能的shortlist个人
+
+        默认与每人的特征中心比对（人数远少于特征条数时大幅减少计算）；
+        索引为近似索引（IVF）时改用索引检索到的行所属的人。
+        """
+        if self.index.approximate:
+            rows, _ = self.index.search(queries, shortlist)
+            return [np.unique(self._row_person[r[r >= 0]]) for r in rows]
+
+        count = len(self.people)
+        if count <= shortlist:
+            return [np.arange(count)] * len(queries)
+
+        scores = self._centroid_sq[:count][None, :] - 2 * self._scan(queries, self._centroids[:count])
+        top = np.argpartition(scores, shortlist - 1, axis=1)[:, :shortlist]
+        return list(top)
+
+    def search_people(self, queries, shortlist=8):
+        """按人员检索：中心粗筛后，在候选人的全部特征上取最近的一条
+
+        返回 (人员序号, 距离)，库为空时人员序号为-1、距离为inf。
+        """
+        with self.lock.read():
+            queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+            people = np.full(len(queries), -1, dtype=np.int64)
+            distances = np.full(len(queries), np.inf, dtype=np.float32)
+            if self.size == 0:
+                return people, distances
+
+            query_sq = np.einsum('ij,ij->i', queries, queries)
+            for i, candidates in enumerate(self._candidate_people(queries, shortlist)):
+                if len(candidates) == len(self.people):
+                    rows = np.arange(self.size)
+                else:
+                    rows = np.array([row for p in candidates for row in self.person_rows[p]], dtype=np.int64)
+                if len(rows) == 0:
+                    continue
+
+                # 精确重排：候选人每条特征的距离，取最近的一条
+                dist_sq = self.encodings_of(rows) @ queries[i]
+                dist_sq *= -2
+                dist_sq += self._sq_norms[rows] + query_sq[i]
+                best = int(np.argmin(dist_sq))
+                people[i] = self._row_person[rows[best]]
+                distances[i] = np.sqrt(max(dist_sq[best], 0))
+
+            return people, distances
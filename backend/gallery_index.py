@@ -0,0 +1,293 @@
+import os
+import threading
+
+import numpy as np
+
+
+def _nearest_centroids(data, centroids, scale=1, chunk_size=8192):
+    """分块计算每个向量最近的聚类中心；data为int8编码时scale为编码的缩放因子"""
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    scaled = (centroids * scale).T
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        # |x|^2 对argmin无影响，省略
+        scores = centroid_sq[None, :] - 2 * (chunk @ scaled)
+        assignments[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return assignments
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """纯NumPy实现的k-means，返回聚类中心"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _nearest_centroids(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        order = np.argsort(assignments, kind='stable')
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+
+        # 空簇重新随机取点
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+
+    return centroids
+
+
+class BruteForceIndex:
+    """精确线性扫描（默认索引）"""
+
+    approximate = False
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    def add(self, rows):
+        pass
+
+    def remove(self, row, moved_from):
+        pass
+
+    def search(self, queries, k=1):
+        return self.gallery.match(queries, k)
+
+
+class IVFIndex:
+    """倒排文件索引：k-means划分特征空间，只扫描最近的n_probe个分区
+
+    每个分区连续存放自己的特征副本（与特征库相同的float32或int8格式），检索时只做少量小矩阵乘法，
+    不需要在整个特征矩阵上随机gather。删除只把分区中的行号置为-1（墓碑），
+    墓碑超过分区的compact_ratio时才整体压缩该分区。
+
+    库规模翻倍触发的重新训练在后台线程中基于特征副本进行，期间旧倒排表
+    照常检索和增删；训练完成后在短暂的写锁内重放期间的增删并换入。
+    """
+
+    def __init__(self, gallery, n_lists=None, n_probe=16, min_train_size=10000,
+                 train_sample_size=65536, compact_ratio=0.25, background=True):
+        self.gallery = gallery
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.train_sample_size = train_sample_size
+        self.compact_ratio = compact_ratio
+        self.background = background
+
+        self.centroids = None
+        self.centroid_sq = None
+        self.lists = []
+        self.list_encodings = []
+        # 每行所在的分区及其在分区中的位置，删除时不必在分区中查找
+        self.row_lists = np.empty(0, dtype=np.int64)
+        self.row_positions = np.empty(0, dtype=np.int64)
+        self.tombstones = np.empty(0, dtype=np.int64)
+        self.trained_size = 0
+
+        # 后台训练线程，以及训练期间的增删操作（换入新倒排表前按顺序重放）
+        self._training = None
+        self._pending = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def nbytes(self):
+        """聚类中心、倒排表和分区特征副本占用的字节数"""
+        arrays = [self.row_lists, self.row_positions, self.tombstones] + self.lists + self.list_encodings
+        if self.is_trained:
+            arrays += [self.centroids, self.centroid_sq]
+        return sum(a.nbytes for a in arrays)
+
+    @property
+    def approximate(self):
+        """训练前退化为精确扫描"""
+        return self.is_trained
+
+    def train(self):
+        """在当前特征库上同步训练聚类中心并重建倒排表（调用方独占特征库）"""
+        codes = self.gallery.codes_of(slice(0, len(self.gallery)))
+        self._swap(self._build(np.arange(len(codes)), codes))
+
+    def _build(self, rows, codes):
+        """在给定的特征副本（特征库的存储格式）上训练并划分倒排表，返回新的索引对象；
+        不读取特征库，可在锁外执行"""
+        built = IVFIndex(self.gallery, self.n_lists, self.n_probe, self.min_train_size,
+                         self.train_sample_size, self.compact_ratio, background=False)
+        n_lists = self.n_lists or int(np.clip(4 * np.sqrt(len(codes)), 16, 4096))
+        n_lists = min(n_lists, len(codes))
+
+        rng = np.random.default_rng(0)
+        if len(codes) > self.train_sample_size:
+            sample = codes[rng.choice(len(codes), self.train_sample_size, replace=False)]
+        else:
+            sample = codes
+
+        built.centroids = kmeans(self.gallery.dequantize(sample), n_lists)
+        built.centroid_sq = np.einsum('ij,ij->i', built.centroids, built.centroids)
+        built.lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        built.list_encodings = [np.empty((0, self.gallery.dim), dtype=codes.dtype) for _ in range(n_lists)]
+        built.tombstones = np.zeros(n_lists, dtype=np.int64)
+        built.trained_size = len(codes)
+        built._assign(rows, codes)
+        return built
+
+    def _swap(self, built):
+        for name in ('centroids', 'centroid_sq', 'lists', 'list_encodings',
+                     'row_lists', 'row_positions', 'tombstones', 'trained_size'):
+            setattr(self, name, getattr(built, name))
+
+    def _start_training(self):
+        """调用方持有特征库写锁：锁内只取特征快照，训练和划分在后台线程中进行"""
+        if not self.background:
+            self.train()
+            return
+        if self.is_trained:
+            # 分区中的特征副本只会被整体替换、不会原地修改，锁内只需复制行号
+            snapshot = ([rows.copy() for rows in self.lists], list(self.list_encodings))
+        else:
+            snapshot = ([np.arange(len(self.gallery))], [self.gallery.codes_of(slice(0, len(self.gallery))).copy()])
+        self._pending = []
+        self._training = threading.Thread(target=self._train_in_background, args=snapshot,
+                                          name='ivf-train', daemon=True)
+        self._training.start()
+
+    def _train_in_background(self, lists, list_encodings):
+        built = None
+        try:
+            rows = np.concatenate(lists)
+            codes = np.concatenate(list_encodings)
+            live = rows >= 0
+            built = self._build(rows[live], codes[live])
+        except Exception as e:
+            print(f"IVF training failed: {e}")
+
+        with self.gallery.lock.write():
+            if built is not None:
+                for op, *args in self._pending:
+                    if op == 'add':
+                        built._assign(*args)
+                    else:
+                        built.remove(*args)
+                self._swap(built)
+            self._pending = None
+
+    def wait(self, timeout=None):
+        """等待进行中的后台训练完成"""
+        if self._training is not None:
+            self._training.join(timeout)
+
+    def _assign(self, rows, codes=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        codes = self.gallery.codes_of(rows) if codes is None else codes
+        assignments = _nearest_centroids(codes, self.centroids, self.gallery.code_scale)
+        capacity = max(self.gallery.capacity, int(rows.max()) + 1 if len(rows) else 0)
+        if len(self.row_lists) < capacity:
+            extra = np.full(capacity - len(self.row_lists), -1, dtype=np.int64)
+            self.row_lists = np.concatenate((self.row_lists, extra))
+            self.row_positions = np.concatenate((self.row_positions, extra))
+        self.row_lists[rows] = assignments
+        order = np.argsort(assignments, kind='stable')
+        list_ids, starts = np.unique(assignments[order], return_index=True)
+        for list_id, members in zip(list_ids, np.split(order, starts[1:])):
+            self.row_positions[rows[members]] = len(self.lists[list_id]) + np.arange(len(members))
+            self.lists[list_id] = np.concatenate((self.lists[list_id], rows[members]))
+            self.list_encodings[list_id] = np.concatenate((self.list_encodings[list_id], codes[members]))
+
+    def add(self, rows):
+        """增量插入新行；达到训练规模或库规模翻倍时启动（后台）训练"""
+        if self._pending is not None:
+            self._pending.append(('add', np.asarray(rows, dtype=np.int64), self.gallery.codes_of(rows)))
+        if self.is_trained:
+            self._assign(rows)
+        if self._pending is None and len(self.gallery) >= max(self.min_train_size, 2 * self.trained_size):
+            self._start_training()
+
+    def remove(self, row, moved_from):
+        """行被删除，原最后一行moved_from搬到了row；均摊O(1)"""
+        if self._pending is not None:
+            self._pending.append(('remove', row, moved_from))
+        if not self.is_trained:
+            return
+        list_id = self.row_lists[row]
+        self.lists[list_id][self.row_positions[row]] = -1
+        self.tombstones[list_id] += 1
+
+        if moved_from != row:
+            moved_list = self.row_lists[moved_from]
+            position = self.row_positions[moved_from]
+            self.lists[moved_list][position] = row
+            self.row_lists[row] = moved_list
+            self.row_positions[row] = position
+        self.row_lists[moved_from] = -1
+        self.row_positions[moved_from] = -1
+
+        if self.tombstones[list_id] > self.compact_ratio * len(self.lists[list_id]):
+            self._compact(list_id)
+
+    def _compact(self, list_id):
+        """去掉分区中的墓碑，重新记录各行的位置"""
+        live = self.lists[list_id] >= 0
+        self.lists[list_id] = self.lists[list_id][live]
+        self.list_encodings[list_id] = self.list_encodings[list_id][live]
+        self.row_positions[self.lists[list_id]] = np.arange(len(self.lists[list_id]))
+        self.tombstones[list_id] = 0
+
+    def search(self, queries, k=1):
+        if not self.is_trained:
+            return self.gallery.match(queries, k)
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.gallery.dim)
+        query_sq = np.einsum('ij,ij->i', queries, queries)
+        n_probe = min(self.n_probe, len(self.lists))
+        centroid_scores = self.centroid_sq[None, :] - 2 * (queries @ self.centroids.T)
+        probe = np.argpartition(centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+
+        sq_norms = self.gallery.sq_norms
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+
+        # 分区按特征库的存储格式保存（float32或int8编码），缩放因子乘在查询上
+        scaled_queries = queries * self.gallery.code_scale
+        for i, query in enumerate(scaled_queries):
+            candidates = np.concatenate([self.lists[list_id] for list_id in probe[i]])
+            dist_sq = np.concatenate([self.list_encodings[list_id] @ query for list_id in probe[i]])
+            live = candidates >= 0
+            if not live.all():
+                candidates, dist_sq = candidates[live], dist_sq[live]
+            if len(candidates) == 0:
+                continue
+
+            dist_sq *= -2
+            dist_sq += sq_norms[candidates] + query_sq[i]
+            candidate_distances = np.sqrt(np.maximum(dist_sq, 0))
+
+            top = min(k, len(candidates))
+            best = np.argpartition(candidate_distances, top - 1)[:top]
+            best = best[np.argsort(candidate_distances[best])]
+            indices[i, :top] = candidates[best]
+            distances[i, :top] = candidate_distances[best]
+
+        return indices, distances
+
+
+def create_index(gallery, kind=None):
+    """根据名称（或GALLERY_INDEX环境变量）创建索引"""
+    kind = (kind or os.getenv('GALLERY_INDEX', 'brute')).lower()
+    if kind == 'brute':
+        return BruteForceIndex(gallery)
+    if kind == 'ivf':
+        n_lists = os.getenv('IVF_NLIST')
+        return IVFIndex(
+            gallery,
+            n_lists=int(n_lists) if n_lists else None,
+            n_probe=int(os.getenv('IVF_NPROBE', 16)),
+            min_train_size=int(os.getenv('IVF_MIN_TRAIN_SIZE', 10000))
+        )
+    raise ValueError(f"Unknown gallery index: {kind}")
@@ -0,0 +1,654 @@
+#!/usr/bin/env python3
+"""
+单文件人脸特征库存储
+运行: python backend/gallery_store.py migrate|compact [--dir DIR]
+     python backend/gallery_store.py rotate-key --new-key KEY
+
+gallery.bin 布局（小端）：
+    头部    magic, version, dim, generation, count, segment_count, 名称表偏移/长度
+    段表    每段 (offset, length, rows)
+    名称表  加密的JSON [{"id": ..., "name": ...}, ...]
+    特征段  每段为加密的 rows×dim float32 连续数据
+
+新注册写入 gallery.<generation>.journal（追加写），compact 时合并为新的
+gallery.bin 并切换到下一代 journal。加密以段为单位，而不是每条记录。
+
+版本2起用AES-256-GCM加密（nonce + 密文 + tag，附加数据绑定generation和段号），
+加载时多线程并行解密各段；版本1（Fernet）的快照和日志记录仍可读取，
+下一次合并时升级。记录格式为JSON和原始float32，不使用pickle。
+
+版本3的日志记录的附加数据绑定generation和记录在日志中的偏移，旧日志中的记录
+或同一日志中其他位置的记录被复制过来时无法通过认证。附加数据固定的旧记录
+（以及Fernet记录）只在快照仍低于版本3的那一代日志中接受，合并后即不再接受。
+
+(generation, journal偏移) 单调递增，作为特征库版本：其他进程/副本只需
+从上次的偏移继续读取日志即可增量同步。追加和合并在 gallery.lock 上加文件锁。
+
+日志记录分三种：add（带特征）、delete（墓碑）、rename；compact 时回放后
+只把仍然有效的记录写入新快照。
+"""
+
+import argparse
+import base64
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+import mmap
+import os
+import pickle
+import struct
+import sys
+import uuid
+
+import numpy as np
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持跨进程文件锁
+    fcntl = None
+
+MAGIC = b'FGAL'
+VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+# 从该版本起，日志只接受绑定了generation和偏移的记录
+BOUND_JOURNAL_VERSION = 3
+HEADER = struct.Struct('<4sHHQIIQQ')
+SEGMENT = struct.Struct('<QQI')
+RECORD_LENGTH = struct.Struct('<I')
+NAME_LENGTH = struct.Struct('<H')
+
+SNAPSHOT_FILE = 'gallery.bin'
+LOCK_FILE = 'gallery.lock'
+SEGMENT_ROWS = 65536
+
+# 日志记录的首字节：AES-GCM记录以此开头；Fernet令牌（旧记录）以 b'g' 开头
+RECORD_BOUND = b'\x03'
+# 附加数据固定的旧版AES-GCM记录
+RECORD_AESGCM = b'\x02'
+JOURNAL_AAD = b'gallery-journal'
+
+
+class GalleryCipher:
+    """特征库加密：AES-256-GCM，密钥由Fernet格式的ENCRYPTION_KEY经HKDF派生
+
+    保留Fernet实例，用于读取版本1的快照/日志和旧格式文件。
+    """
+
+    NONCE_SIZE = 12
+    OVERHEAD = NONCE_SIZE + 16
+
+    def __init__(self, key):
+        key = key.encode() if isinstance(key, str) else key
+        self.fernet = Fernet(key)
+        derived = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b'face-gallery-store'
+        ).derive(base64.urlsafe_b64decode(key))
+        self.aead = AESGCM(derived)
+
+    def encrypt(self, data, aad=b''):
+        nonce = os.urandom(self.NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, data, aad)
+
+    def decrypt(self, token, aad=b''):
+        token = memoryview(token)
+        return self.aead.decrypt(bytes(token[:self.NONCE_SIZE]), bytes(token[self.NONCE_SIZE:]), aad)
+
+
+def _segment_aad(generation, index):
+    return struct.pack('<QI', generation, index)
+
+
+def _names_aad(generation):
+    return struct.pack('<Q', generation) + b'names'
+
+
+def _record_aad(generation, offset):
+    return struct.pack('<QQ', generation, offset) + b'journal'
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """旧格式文件只包含 {'name': str, 'encoding': ndarray}，拒绝其他任何类"""
+
+    ALLOWED = {
+        ('numpy.core.multiarray', '_reconstruct'),
+        ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy.core.multiarray', 'scalar'),
+        ('numpy._core.multiarray', 'scalar'),
+        ('numpy', 'ndarray'),
+        ('numpy', 'dtype'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.ALLOWED:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Forbidden class in legacy face file: {module}.{name}")
+
+
+def _replay_plan(ids, names, records):
+    """按顺序回放日志记录，返回 (ids, names, keep, added_encodings)
+
+    行号先是已有的行，再接上日志新增的行；keep 为仍然有效的行号（全部有效时为None），
+    返回的 ids/names 已按 keep 筛选。
+    """
+    positions = {face_id: i for i, face_id in enumerate(ids)}
+    names = list(names)
+    alive = [True] * len(ids)
+    added_ids, added_names, added_encodings = [], [], []
+
+    for op, face_id, name, encoding in records:
+        if op == 'add':
+            positions[face_id] = len(ids) + len(added_ids)
+            alive.append(True)
+            added_ids.append(face_id)
+            added_names.append(name)
+            added_encodings.append(encoding)
+            continue
+
+        position = positions.get(face_id)
+        if position is None or not alive[position]:
+            continue
+        if op == 'delete':
+            alive[position] = False
+        elif op == 'rename':
+            if position < len(names):
+                names[position] = name
+            else:
+                added_names[position - len(names)] = name
+
+    ids = list(ids) + added_ids
+    names = names + added_names
+    if all(alive):
+        return ids, names, None, added_encodings
+
+    keep = np.flatnonzero(alive)
+    return [ids[i] for i in keep], [names[i] for i in keep], keep, added_encodings
+
+
+def replay(ids, names, encodings, records, dim=128):
+    """在 (ids, names, encodings) 上按顺序回放日志记录，返回新的三元组"""
+    if not records:
+        return ids, names, encodings
+
+    ids, names, keep, added_encodings = _replay_plan(ids, names, records)
+    if added_encodings:
+        encodings = np.concatenate((encodings, np.array(added_encodings, dtype=np.float32).reshape(-1, dim)))
+    if keep is not None:
+        encodings = encodings[keep]
+    return ids, names, encodings
+
+
+class GalleryStore:
+    """快照 + 追加日志 形式的加密特征库存储"""
+
+    def __init__(self, directory, cipher, dim=128, segment_rows=SEGMENT_ROWS, load_threads=None):
+        self.directory = directory
+        self.cipher = cipher
+        self.dim = dim
+        self.segment_rows = segment_rows
+        if load_threads is None:
+            load_threads = int(os.getenv('GALLERY_LOAD_THREADS', min(os.cpu_count() or 1, 8)))
+        self.load_threads = max(load_threads, 1)
+        self.journal_count = 0
+        # 无法解密/解析而被跳过的日志记录数（密钥不对或文件损坏）
+        self.unreadable_records = 0
+        # load() 读到的版本：(generation, 日志偏移)
+        self.loaded_generation = 0
+        self.journal_offset = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    def journal_path(self, generation):
+        return os.path.join(self.directory, f'gallery.{generation}.journal')
+
+    def read_header(self):
+        """读取快照头部，不存在时返回None"""
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, 'rb') as f:
+            magic, version, dim, generation, count, segments, names_offset, names_length = \
+                HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported gallery file: {self.snapshot_path}")
+        return {
+            'version': version,
+            'dim': dim,
+            'generation': generation,
+            'count': count,
+            'segments': segments,
+            'names_offset': names_offset,
+            'names_length': names_length,
+        }
+
+    @property
+    def generation(self):
+        header = self.read_header()
+        return header['generation'] if header else 0
+
+    @property
+    def needs_upgrade(self):
+        """快照仍是旧版本（Fernet加密，或日志记录未绑定位置）"""
+        header = self.read_header()
+        return header is not None and header['version'] < VERSION
+
+    @contextmanager
+    def lock(self, shared=False):
+        """跨进程文件锁：追加/合并用排他锁，完整加载用共享锁"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def load(self):
+        """加载快照并重放日志，返回 (ids, names, encodings)"""
+        self.unreadable_records = 0
+        with self.lock(shared=True):
+            generation = self.generation
+            try:
+                ids, names, encodings = self._load_snapshot()
+            except (InvalidTag, InvalidToken) as e:
+                raise ValueError(
+                    f"Cannot decrypt {self.snapshot_path}: ENCRYPTION_KEY differs from the key it was written with"
+                ) from e
+            records, offset = self.tail_journal(generation)
+        self.journal_count = len(records)
+        self.loaded_generation = generation
+        self.journal_offset = offset
+        return replay(ids, names, encodings, records, self.dim)
+
+    def _decrypt_block(self, header, token, aad):
+        if header['version'] == 1:
+            return self.cipher.fernet.decrypt(bytes(token))
+        return self.cipher.decrypt(token, aad)
+
+    def _read_table(self, header, mm):
+        """段表和解密后的名称表，返回 (segments, ids, names)"""
+        segments = [
+            SEGMENT.unpack_from(mm, HEADER.size + i * SEGMENT.size)
+            for i in range(header['segments'])
+        ]
+        names_start = header['names_offset']
+        table = json.loads(self._decrypt_block(
+            header, mm[names_start:names_start + header['names_length']], _names_aad(header['generation'])
+        ))
+        return segments, [entry['id'] for entry in table], [entry['name'] for entry in table]
+
+    def _load_snapshot(self):
+        header = self.read_header()
+        if header is None:
+            return [], [], np.empty((0, self.dim), dtype=np.float32)
+        if header['dim'] != self.dim:
+            raise ValueError(f"Gallery dimension {header['dim']} != {self.dim}")
+
+        with open(self.snapshot_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                segments, ids, names = self._read_table(header, mm)
+                encodings = np.empty((header['count'], self.dim), dtype=np.float32)
+                starts = np.concatenate(([0], np.cumsum([rows for _, _, rows in segments])))
+
+                def decrypt_segment(index):
+                    offset, length, rows = segments[index]
+                    block = self._decrypt_block(
+                        header, memoryview(mm)[offset:offset + length], _segment_aad(header['generation'], index)
+                    )
+                    encodings[starts[index]:starts[index] + rows] = \
+                        np.frombuffer(block, dtype=np.float32).reshape(rows, self.dim)
+
+                # 各段相互独立，多线程并行解密（解密时释放GIL）
+                if self.load_threads > 1 and len(segments) > 1:
+                    with ThreadPoolExecutor(max_workers=min(self.load_threads, len(segments))) as executor:
+                        list(executor.map(decrypt_segment, range(len(segments))))
+                else:
+                    for index in range(len(segments)):
+                        decrypt_segment(index)
+
+        return ids, names, encodings
+
+    def _iter_segments(self, header, mm, segments):
+        """逐段解密快照，产出 (起始行号, 特征块)；只占用一段的内存"""
+        row = 0
+        for index, (offset, length, rows) in enumerate(segments):
+            block = self._decrypt_block(header, mm[offset:offset + length], _segment_aad(header['generation'], index))
+            yield row, np.frombuffer(block, dtype=np.float32).reshape(rows, self.dim)
+            row += rows
+
+    def write_snapshot(self, ids, names, encodings, generation, cipher=None):
+        """原子地写入新快照（先写临时文件再rename）"""
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        self._write_snapshot_stream(ids, names, [encodings], generation, cipher)
+
+    def _write_snapshot_stream(self, ids, names, blocks, generation, cipher=None):
+        """把按顺序产出的特征块重新切分成段、加密并写入新快照
+
+        AES-GCM密文长度固定为明文长度加OVERHEAD，段表可以在写入特征前算出，
+        因此整个过程只需要一段的内存。
+        """
+        cipher = cipher or self.cipher
+        count = len(ids)
+        table = cipher.encrypt(json.dumps(
+            [{'id': face_id, 'name': name} for face_id, name in zip(ids, names)]
+        ).encode(), _names_aad(generation))
+
+        segment_count = (count + self.segment_rows - 1) // self.segment_rows
+        names_offset = HEADER.size + SEGMENT.size * segment_count
+        offset = names_offset + len(table)
+        segments = []
+        for index in range(segment_count):
+            rows = min(self.segment_rows, count - index * self.segment_rows)
+            length = rows * self.dim * 4 + cipher.OVERHEAD
+            segments.append(SEGMENT.pack(offset, length, rows))
+            offset += length
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.dim, generation, count,
+                                segment_count, names_offset, len(table)))
+            f.writelines(segments)
+            f.write(table)
+
+            buffer = np.empty((min(self.segment_rows, max(count, 1)), self.dim), dtype=np.float32)
+            filled, index = 0, 0
+            for block in blocks:
+                position = 0
+                while position < len(block):
+                    if index >= segment_count:
+                        raise ValueError(f"More than {count} rows for the snapshot")
+                    rows = min(self.segment_rows, count - index * self.segment_rows)
+                    take = min(rows - filled, len(block) - position)
+                    buffer[filled:filled + take] = block[position:position + take]
+                    filled += take
+                    position += take
+                    if filled == rows:
+                        f.write(cipher.encrypt(buffer[:rows].tobytes(), _segment_aad(generation, index)))
+                        index += 1
+                        filled = 0
+            if index != segment_count:
+                raise ValueError(f"Expected {count} rows for the snapshot")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _encode_record(self, face_id, name, encoding, op='add'):
+        """日志记录的明文；加密在写入时进行，附加数据需要记录的偏移"""
+        entry = {'id': face_id, 'name': name} if op == 'add' else {'id': face_id, 'name': name, 'op': op}
+        name_bytes = json.dumps(entry).encode()
+        payload = NAME_LENGTH.pack(len(name_bytes)) + name_bytes
+        if op == 'add':
+            payload += np.asarray(encoding, dtype=np.float32).reshape(self.dim).tobytes()
+        return payload
+
+    def _write_records(self, payloads):
+        # 在锁内读取generation和日志末尾偏移，避免写入其他进程刚合并掉的旧日志；
+        # 所有写入者都持有排他锁，记录会落在这里算出的偏移上
+        with self.lock():
+            generation = self.generation
+            with open(self.journal_path(generation), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                records = []
+                for payload in payloads:
+                    token = RECORD_BOUND + self.cipher.encrypt(payload, _record_aad(generation, offset))
+                    records.append(RECORD_LENGTH.pack(len(token)) + token)
+                    offset += len(records[-1])
+                f.write(b''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+        self.journal_count += len(payloads)
+
+    def append(self, encoding, name):
+        """追加一条注册记录到当前日志，返回新ID"""
+        return self.append_many([encoding], [name])[0]
+
+    def append_many(self, encodings, names):
+        """一次写入并fsync多条注册记录，返回新ID列表"""
+        ids = [uuid.uuid4().hex for _ in names]
+        self._write_records([
+            self._encode_record(face_id, name, encoding)
+            for face_id, name, encoding in zip(ids, names, encodings)
+        ])
+        return ids
+
+    def delete(self, ids):
+        """为给定ID写入删除墓碑"""
+        self._write_records([self._encode_record(face_id, None, None, op='delete') for face_id in ids])
+
+    def rename(self, ids, name):
+        """把给定ID的记录改名"""
+        self._write_records([self._encode_record(face_id, name, None, op='rename') for face_id in ids])
+
+    def read_journal(self, generation, offset=0):
+        """读取日志中的记录并回放，返回 (ids, names, encodings)；忽略末尾未写完整的记录"""
+        records, _ = self.tail_journal(generation, offset)
+        return replay([], [], np.empty((0, self.dim), dtype=np.float32), records, self.dim)
+
+    def tail_journal(self, generation, offset=0):
+        """从offset开始读取日志，返回 (记录列表, 下一次读取的偏移)
+
+        每条记录为 (op, id, name, encoding)，op为 add/delete/rename，
+        只有add带特征。日志不存在（尚未写入或已被合并删除）时返回空列表和原偏移。
+        """
+        records = []
+        path = self.journal_path(generation)
+        position = 0
+        if os.path.exists(path):
+            header = self.read_header()
+            legacy = header is None or header['version'] < BOUND_JOURNAL_VERSION
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                data = b''
+
+            while position + RECORD_LENGTH.size <= len(data):
+                (length,) = RECORD_LENGTH.unpack_from(data, position)
+                end = position + RECORD_LENGTH.size + length
+                if end > len(data):
+                    break
+                token = data[position + RECORD_LENGTH.size:end]
+                try:
+                    records.append(self._decode_record(token, generation, offset + position, legacy))
+                except (InvalidTag, InvalidToken, ValueError, KeyError, struct.error) as e:
+                    # 与旧格式逐个文件加载一致：跳过坏记录，不影响其余人脸
+                    print(f"Skipping unreadable journal record in {path} at offset {offset + position}: "
+                          f"{type(e).__name__}")
+                    self.unreadable_records += 1
+                position = end
+
+        return records, offset + position
+
+    def _decode_record(self, token, generation, offset, legacy=False):
+        """解密并解析位于 generation 代日志 offset 处的一条记录，返回 (op, id, name, encoding)
+
+        legacy 为真时才接受附加数据不绑定位置的旧记录（AES-GCM固定附加数据或Fernet）。
+        """
+        if token[:1] == RECORD_BOUND:
+            payload = self.cipher.decrypt(memoryview(token)[1:], _record_aad(generation, offset))
+        elif not legacy:
+            raise ValueError("Unbound journal record")
+        elif token[:1] == RECORD_AESGCM:
+            payload = self.cipher.decrypt(memoryview(token)[1:], JOURNAL_AAD)
+        else:
+            payload = self.cipher.fernet.decrypt(token)
+        (name_length,) = NAME_LENGTH.unpack_from(payload)
+        entry = json.loads(payload[NAME_LENGTH.size:NAME_LENGTH.size + name_length])
+        op = entry.get('op', 'add')
+        encoding = None
+        if op == 'add':
+            encoding = np.frombuffer(payload[NAME_LENGTH.size + name_length:], dtype=np.float32)
+            if len(encoding) != self.dim:
+                raise ValueError(f"Encoding has {len(encoding)} dimensions")
+        return op, entry['id'], entry['name'], encoding
+
+    def _rewrite(self, cipher, drop_unreadable=False):
+        """流式合并：逐段解密旧快照、按日志丢弃/追加行，用cipher加密写入下一代快照
+
+        调用方持有排他锁；返回记录数。日志中有无法解密的记录时默认拒绝合并，
+        以免密钥配置错误时把这些记录永久丢弃。
+        """
+        header = self.read_header()
+        generation = header['generation'] if header else 0
+        skipped = self.unreadable_records
+        records, _ = self.tail_journal(generation)
+        skipped = self.unreadable_records - skipped
+        if skipped and not drop_unreadable:
+            raise ValueError(f"{skipped} journal records could not be decrypted; "
+                             f"check ENCRYPTION_KEY or compact with --drop-unreadable")
+
+        with ExitStack() as stack:
+            segments, ids, names, mm = [], [], [], None
+            if header is not None:
+                f = stack.enter_context(open(self.snapshot_path, 'rb'))
+                mm = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                segments, ids, names = self._read_table(header, mm)
+
+            snapshot_count = len(ids)
+            ids, names, keep, added_encodings = _replay_plan(ids, names, records)
+            added = np.array(added_encodings, dtype=np.float32).reshape(-1, self.dim)
+            if keep is None:
+                keep = np.arange(snapshot_count + len(added))
+
+            def blocks():
+                for start, block in self._iter_segments(header, mm, segments):
+                    lo, hi = np.searchsorted(keep, [start, start + len(block)])
+                    if hi > lo:
+                        yield block[keep[lo:hi] - start]
+                tail = keep[np.searchsorted(keep, snapshot_count):] - snapshot_count
+                if len(tail):
+                    yield added[tail]
+
+            self._write_snapshot_stream(ids, names, blocks(), generation + 1, cipher)
+
+        old_journal = self.journal_path(generation)
+        if os.path.exists(old_journal):
+            os.remove(old_journal)
+        self.journal_count = 0
+        return len(ids)
+
+    def compact(self, drop_unreadable=False):
+        """把快照和日志合并为新一代快照，返回记录数"""
+        with self.lock():
+            count = self._rewrite(self.cipher, drop_unreadable)
+        self.unreadable_records = 0
+        return count
+
+    def compact_from(self, generation, offset):
+        """合并，并在同一把锁内取出调用方 (generation, offset) 之后尚未读过的日志记录
+
+        返回 (记录列表, 新一代)；调用方的版本已不是当前这一代时记录列表为None，
+        需要重新加载。调用方回放这些记录后即与新一代快照一致，不必重新读取快照。
+        """
+        with self.lock():
+            records = None
+            if self.generation == generation:
+                records, _ = self.tail_journal(generation, offset)
+            self._rewrite(self.cipher)
+            new_generation = self.generation
+        self.unreadable_records = 0
+        return records, new_generation
+
+    def rotate_key(self, cipher):
+        """用新密钥流式重新加密整个特征库（快照与日志合并为新一代），返回记录数
+
+        所有进程都需要换成新密钥后重启；旧格式文件需先迁移。
+        """
+        if self.legacy_files():
+            raise ValueError("Migrate legacy .encrypted files before rotating the key")
+        with self.lock():
+            count = self._rewrite(cipher)
+            self.cipher = cipher
+        return count
+
+    def legacy_files(self):
+        """旧格式（每个人脸一个.encrypted pickle文件）的文件列表"""
+        return sorted(
+            filename for filename in os.listdir(self.directory)
+            if filename.endswith('.encrypted')
+        )
+
+    def load_legacy(self):
+        """读取旧格式文件，返回 (names, encodings, 失败文件列表)"""
+        names, encodings, failed = [], [], []
+        for filename in self.legacy_files():
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    face_data = _LegacyUnpickler(io.BytesIO(self.cipher.fernet.decrypt(f.read()))).load()
+                names.append(face_data['name'])
+                encodings.append(face_data['encoding'])
+            except Exception as e:
+                print(f"Error loading face {filename}: {e}")
+                failed.append(filename)
+
+        return names, np.array(encodings, dtype=np.float32).reshape(-1, self.dim), failed
+
+    def migrate(self, remove_legacy=False):
+        """把旧格式目录转换进单文件存储，返回迁移的记录数
+
+        迁移成功的文件会被重命名为 .migrated（或在remove_legacy时删除），
+        避免下次启动时被重复加载。
+        """
+        names, encodings, failed = self.load_legacy()
+        if names:
+            self.append_many(encodings, names)
+        self.compact()
+
+        for filename in self.legacy_files():
+            if filename in failed:
+                continue
+            path = os.path.join(self.directory, filename)
+            if remove_legacy:
+                os.remove(path)
+            else:
+                os.replace(path, path + '.migrated')
+        return len(names)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Gallery store maintenance")
+    parser.add_argument('command', choices=['migrate', 'compact', 'rotate-key'])
+    parser.add_argument('--dir', default=os.getenv('KNOWN_FACES_DIR', './data/known_faces'))
+    parser.add_argument('--remove-legacy', action='store_true',
+                        help="delete migrated .encrypted files instead of renaming them")
+    parser.add_argument('--drop-unreadable', action='store_true',
+                        help="compact: discard journal records that cannot be decrypted")
+    parser.add_argument('--new-key', default=os.getenv('NEW_ENCRYPTION_KEY'),
+                        help="rotate-key: key to re-encrypt the gallery with (default: NEW_ENCRYPTION_KEY)")
+    args = parser.parse_args()
+
+    encryption_key = os.getenv('ENCRYPTION_KEY')
+    if not encryption_key or encryption_key == 'your-32-character-encryption-key-here':
+        sys.exit("ENCRYPTION_KEY must be set to the key the gallery was written with")
+
+    store = GalleryStore(args.dir, GalleryCipher(encryption_key))
+
+    if args.command == 'migrate':
+        count = store.migrate(remove_legacy=args.remove_legacy)
+        print(f"Migrated {count} legacy faces into {store.snapshot_path}")
+    elif args.command == 'rotate-key':
+        if not args.new_key:
+            sys.exit("--new-key (or NEW_ENCRYPTION_KEY) is required")
+        count = store.rotate_key(GalleryCipher(args.new_key))
+        print(f"Re-encrypted {count} faces; set ENCRYPTION_KEY to the new key and restart all processes")
+    else:
+        count = store.compact(drop_unreadable=args.drop_unreadable)
+        print(f"Compacted {count} faces into {store.snapshot_path}")
+
+
+if __name__ == "__main__":
+    main()
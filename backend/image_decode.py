@@ -0,0 +1,118 @@
+import base64
+import binascii
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# EXIF方向标签；5-8表示图像需要旋转90度，宽高互换
+EXIF_ORIENTATION = 0x0112
+
+# OpenCV在解码JPEG时直接按1/2、1/4、1/8缩小（DCT缩放），不生成全尺寸帧
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class ImageDecodeError(ValueError):
+    """无法解码的图像数据"""
+
+
+class ImageTooLarge(ImageDecodeError):
+    """图像字节数或像素数超过限制，未解码即拒绝"""
+
+
+def decode_limits():
+    """从环境变量读取解码限制"""
+    return {
+        'max_bytes': int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024)),
+        'max_pixels': int(os.getenv('MAX_IMAGE_PIXELS', 40_000_000)),
+        # 大于0时，识别请求的图像在解码时就缩小到不小于该宽度
+        'max_width': int(os.getenv('DECODE_MAX_WIDTH', 0)),
+    }
+
+DECODE_LIMITS = decode_limits()
+
+
+def _reduce_flag(width, max_width):
+    """选择解码后宽度仍不小于max_width的最大缩小倍数"""
+    if max_width > 0:
+        for factor, flag in REDUCED_FLAGS:
+            if width // factor >= max_width:
+                return flag
+    return cv2.IMREAD_COLOR
+
+
+def _decode_pil(image, max_width):
+    """OpenCV不支持的格式：PIL的draft模式缩小解码，再按EXIF方向旋转"""
+    if max_width > 0 and image.width > max_width:
+        image.draft('RGB', (max_width, max_width * image.height // image.width))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+
+def decode_image(image_bytes, max_width=None, limits=None):
+    """把JPEG/PNG字节直接解码为RGB uint8数组，返回 (rgb_image, scale)
+
+    scale 为解码后宽度与原图（旋转后）宽度之比，未缩小时为1.0。
+    先读文件头检查尺寸，超过限制时抛出ImageTooLarge，不会分配整帧内存。
+    """
+    limits = limits or DECODE_LIMITS
+    max_width = limits['max_width'] if max_width is None else max_width
+    if not image_bytes:
+        raise ImageDecodeError("Empty image data")
+    if len(image_bytes) > limits['max_bytes']:
+        raise ImageTooLarge(f"Image exceeds {limits['max_bytes']} bytes")
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception as e:
+        raise ImageDecodeError(f"Unrecognized image data: {e}") from e
+
+    width, height = image.size
+    if width * height > limits['max_pixels']:
+        raise ImageTooLarge(f"Image exceeds {limits['max_pixels']} pixels ({width}x{height})")
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    # OpenCV直接解码到NumPy缓冲区（灰度自动扩展为3通道，RGBA丢弃alpha，按EXIF旋转），
+    # 再原地把BGR转成RGB，整个过程只有一帧内存
+    flag = _reduce_flag(width, max_width)
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    bgr_image = cv2.imdecode(buffer, flag)
+    if bgr_image is not None:
+        rgb_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB, dst=bgr_image)
+    else:
+        try:
+            rgb_image = _decode_pil(image, max_width)
+        except Exception as e:
+            raise ImageDecodeError(f"Failed to decode image: {e}") from e
+    return rgb_image, rgb_image.shape[1] / width
+
+
+def decode_base64_image(base64_string, max_width=None, limits=None):
+    """解码base64（可带data URL前缀）图像，解码base64之前先按长度检查大小"""
+    limits = limits or DECODE_LIMITS
+    if not isinstance(base64_string, str):
+        raise ImageDecodeError("Image data must be a base64 string")
+    if ',' in base64_string[:100]:
+        base64_string = base64_string.split(',', 1)[1]
+    if len(base64_string) * 3 // 4 > limits['max_bytes']:
+        raise ImageTooLarge(f"Image exceeds {limits['max_bytes']} bytes")
+    try:
+        image_bytes = base64.b64decode(base64_string)
+    except (binascii.Error, ValueError) as e:
+        raise ImageDecodeError(f"Invalid base64 data: {e}") from e
+    return decode_image(image_bytes, max_width, limits)
+
+
+def restore_locations(results, scale):
+    """把缩小解码后图像上的人脸框换算回原图坐标"""
+    if scale == 1.0:
+        return results
+    # 返回新的字典，跟踪器缓存的结果保持在解码坐标系中
+    return [dict(result, location=[int(round(value / scale)) for value in result['location']])
+            for result in results]
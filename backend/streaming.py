@@ -0,0 +1,71 @@
+import threading
+
+
+class LatestFrame:
+    """只保留最新一帧的槽位：处理跟不上时旧帧被直接丢弃"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._sequence = 0
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._sequence += 1
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def get(self):
+        """阻塞直到有新帧，返回 (序号, 帧)；连接关闭且无剩余帧时返回 (None, None)"""
+        with self._condition:
+            while self._frame is None and not self._closed:
+                self._condition.wait()
+            if self._frame is None:
+                return None, None
+            frame, self._frame = self._frame, None
+            return self._sequence, frame
+
+
+def serve_stream(receive, send, process):
+    """读线程不断接收帧放入槽位，当前线程始终处理最新一帧并推送结果
+
+    receive() 返回下一条消息（连接关闭时返回None或抛出异常），
+    send(message) 推送结果，process(frame) 返回要推送的dict。
+    """
+    slot = LatestFrame()
+
+    def reader():
+        try:
+            while True:
+                message = receive()
+                if message is None:
+                    break
+                if isinstance(message, (bytes, bytearray)):
+                    slot.put(bytes(message))
+        except Exception:
+            pass
+        finally:
+            slot.close()
+
+    thread = threading.Thread(target=reader, name='stream-reader', daemon=True)
+    thread.start()
+
+    while True:
+        sequence, frame = slot.get()
+        if frame is None:
+            break
+        message = process(frame)
+        message['frame'] = sequence
+        message['dropped_frames'] = slot.dropped
+        send(message)
+
+    thread.join()
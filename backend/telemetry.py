@@ -0,0 +1,238 @@
+import atexit
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 延迟直方图的桶上界（毫秒）
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """固定桶直方图，只保存累计计数和总和"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """按桶内线性插值估算分位数"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= target:
+                if i == len(self.buckets):
+                    return float(self.buckets[-1])
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return float(self.buckets[-1])
+
+
+class MetricsBuffer:
+    """进程内指标缓冲：计数器和直方图在内存中累加，由后台线程定期写出"""
+
+    def __init__(self, sink=None, flush_interval=None, sample_rate=None):
+        self.sink = sink
+        self.flush_interval = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', 30)) \
+            if flush_interval is None else flush_interval
+        self.sample_rate = float(os.getenv('TELEMETRY_SAMPLE_RATE', 0.0)) \
+            if sample_rate is None else sample_rate
+
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(Histogram)
+        self.gauges = {}
+        self._samples = []
+        self._last_flushed = {}
+        self._step = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def observe_all(self, timings):
+        """批量记录 {阶段名: 毫秒} 形式的耗时"""
+        with self._lock:
+            for name, value in timings.items():
+                self.histograms[name].observe(value)
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        """记录代码块耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def render_prometheus(self, prefix='face_'):
+        """导出Prometheus文本格式：计数器、仪表、直方图及p50/p95/p99"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE {prefix}{name}_total counter')
+                lines.append(f'{prefix}{name}_total {value:g}')
+
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f'# TYPE {prefix}{name} gauge')
+                lines.append(f'{prefix}{name} {value:g}')
+
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f'{prefix}{name}'
+                lines.append(f'# TYPE {metric} histogram')
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum {histogram.sum:g}')
+                lines.append(f'{metric}_count {histogram.count}')
+
+                lines.append(f'# TYPE {metric}_percentile gauge')
+                for q in (0.5, 0.95, 0.99):
+                    lines.append(f'{metric}_percentile{{quantile="{q}"}} {histogram.quantile(q):g}')
+
+        return '\n'.join(lines) + '\n'
+
+    def should_sample(self):
+        """按采样率决定是否记录单个请求的详细信息"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record_sample(self, **fields):
+        with self._lock:
+            self._samples.append(dict(fields, timestamp=time.time()))
+
+    def interval_metrics(self):
+        """自上次调用以来的增量：计数器差值、直方图的次数和均值，以及仪表的当前值"""
+        with self._lock:
+            current = {name: value for name, value in self.counters.items()}
+            gauges = dict(self.gauges)
+            histogram_names = list(self.histograms)
+            for name, histogram in self.histograms.items():
+                current[f'{name}_count'] = histogram.count
+                current[f'{name}_sum'] = histogram.sum
+            samples, self._samples = self._samples, []
+
+        metrics = {}
+        for name, value in current.items():
+            metrics[name] = value - self._last_flushed.get(name, 0)
+        for name in histogram_names:
+            count = metrics.pop(f'{name}_count')
+            total = metrics.pop(f'{name}_sum')
+            metrics[f'{name}_count'] = count
+            if count:
+                metrics[f'{name}_mean'] = total / count
+        metrics.update(gauges)
+
+        self._last_flushed = current
+        return metrics, samples
+
+    def flush(self):
+        """把本周期的汇总作为一个step写入sink"""
+        if self.sink is None:
+            return
+        metrics, samples = self.interval_metrics()
+        try:
+            self.sink.log(self._step, metrics, samples)
+            self._step += 1
+        except Exception as e:
+            print(f"Error flushing telemetry: {e}")
+
+    def _run(self):
+        try:
+            self.sink.open()
+        except Exception as e:
+            print(f"Error opening telemetry sink: {e}")
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """启动后台写出线程（未配置sink时不启动）"""
+        if self.sink is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        self.sink.close()
+
+
+class MlflowSink:
+    """把每个周期的指标写入同一个MLflow run（step序列），采样明细写为artifact"""
+
+    def __init__(self, tracking_uri, experiment_name, run_name='face_recognition_service'):
+        self.tracking_uri = tracking_uri
+        self.experiment_name = experiment_name
+        self.run_name = run_name
+        self._client = None
+        self._run_id = None
+
+    def open(self):
+        """创建（或复用）本进程的MLflow run"""
+        if self._run_id is not None:
+            return
+        from mlflow.tracking import MlflowClient
+
+        self._client = MlflowClient(tracking_uri=self.tracking_uri)
+        experiment = self._client.get_experiment_by_name(self.experiment_name)
+        experiment_id = experiment.experiment_id if experiment else \
+            self._client.create_experiment(self.experiment_name)
+        self._run_id = self._client.create_run(experiment_id, run_name=self.run_name).info.run_id
+
+    def log(self, step, metrics, samples):
+        if not metrics and not samples:
+            return
+        from mlflow.entities import Metric
+
+        self.open()
+        timestamp = int(time.time() * 1000)
+        self._client.log_batch(self._run_id, metrics=[
+            Metric(name, float(value), timestamp, step) for name, value in metrics.items()
+        ])
+        if samples:
+            self._client.log_dict(self._run_id, samples, f'samples/step_{step:06d}.json')
+
+    def close(self):
+        if self._run_id is not None:
+            self._client.set_terminated(self._run_id)
+
+
+def create_metrics():
+    """根据环境变量创建指标缓冲；配置了MLflow时写入MLflow"""
+    tracking_uri = os.getenv('MLFLOW_TRACKING_URI')
+    sink = None
+    if tracking_uri:
+        sink = MlflowSink(tracking_uri, os.getenv('MLFLOW_EXPERIMENT_NAME', 'face_recognition'))
+    return MetricsBuffer(sink=sink)
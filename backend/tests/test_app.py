@@ -2,14 +2,20 @@ import pytest
 import sys
 import os
 import json
+import io
+import base64
+from PIL import Image
 
 # 添加backend目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from app import app
+from app import app, warm_up
+from engine import EngineBusy
 
 @pytest.fixture
 def client():
+    # 等待后台预热完成（特征库加载后才能访问识别接口）
+    warm_up()
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
@@ -37,6 +43,58 @@ def test_health_check(client):
     data = json.loads(response.data)
     assert 'status' in data
 
+def test_health_reports_startup(client):
+    """测试健康检查返回就绪状态和启动耗时；预热失败时如实报告错误"""
+    data = json.loads(client.get('/health').data)
+    error = data['startup'].get('model_warmup_error')
+    assert data['ready'] is (error is None)
+    assert data['error'] == error
+    # 预热必须加载dlib的face_recognition库，而不是backend下的模块
+    assert error is None or "has no attribute" not in error
+    assert data['startup']['import_seconds'] > 0
+    assert 'gallery_load_seconds' in data['startup']
+
+def test_health_not_ready_when_warmup_failed(client, monkeypatch):
+    """测试模型预热失败时ready为false并返回错误"""
+    import app as app_module
+    monkeypatch.setitem(app_module.startup, 'model_warmup_error', 'model files missing')
+    data = json.loads(client.get('/health').data)
+    assert data['ready'] is False
+    assert data['face_system_ready'] is True
+    assert data['error'] == 'model files missing'
+
+def test_startup_failure_counted(monkeypatch):
+    """测试初始化失败时记录startup_failures并仍启动指标写出"""
+    import app as app_module
+    from telemetry import MetricsBuffer
+    
+    def failing_system(metrics=None):
+        raise RuntimeError("gallery unreadable")
+    
+    started = []
+    metrics = MetricsBuffer()
+    monkeypatch.setattr(metrics, 'start', lambda: started.append(True))
+    monkeypatch.setattr(app_module, 'metrics', metrics)
+    monkeypatch.setattr(app_module, 'FaceRecognitionSystem', failing_system)
+    monkeypatch.setattr(app_module, 'face_system', None)
+    monkeypatch.setattr(app_module, 'engine', None)
+    monkeypatch.setattr(app_module, 'startup', {'import_seconds': 0.1})
+    monkeypatch.setattr(app_module, '_ready', app_module.threading.Event())
+    
+    assert app_module.warm_up() is False
+    assert metrics.counters['startup_failures'] == 1
+    assert metrics.gauges['startup_import_seconds'] == 0.1
+    assert started == [True]
+
+def test_unavailable_while_starting(client, monkeypatch):
+    """测试预热完成前识别接口返回503"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'face_system', None)
+    monkeypatch.setattr(app_module, '_ready', app_module.threading.Event())
+    response = client.post('/recognize', json={})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
 def test_recognize_no_data(client):
     """测试无数据的人脸识别"""
     response = client.post('/recognize', json={})
@@ -63,4 +121,107 @@ def test_register_missing_image(client):
     response = client.post('/register', json={'name': 'test'})
     assert response.status_code == 400
     data = json.loads(response.data)
-    assert 'error' in data
\ No newline at end of file
+    assert 'error' in data
+
+def test_recognize_batch_no_data(client):
+    """测试无图像的批量识别"""
+    response = client.post('/recognize/batch', data={})
+    assert response.status_code == 400
+    data = json.loads(response.data)
+    assert 'error' in data
+
+def test_recognize_batch_invalid_images(client):
+    """测试批量识别中无法解码的图像逐张报错"""
+    response = client.post(
+        '/recognize/batch',
+        data={'images': [(io.BytesIO(b'not an image'), 'a.jpg'), (io.BytesIO(b'garbage'), 'b.jpg')]},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [item['filename'] for item in data['images']] == ['a.jpg', 'b.jpg']
+    assert all('error' in item for item in data['images'])
+    assert data['faces_detected'] == 0
+
+def test_recognize_busy_returns_429(client, monkeypatch):
+    """测试识别队列已满时返回429"""
+    import app as app_module
+    
+    class BusyEngine:
+        def recognize_batch(self, rgb_images):
+            raise EngineBusy("Recognition queue is full")
+    
+    monkeypatch.setattr(app_module, 'engine', BusyEngine())
+    buffered = io.BytesIO()
+    Image.new('RGB', (16, 16)).save(buffered, format='JPEG')
+    image_data = 'data:image/jpeg;base64,' + base64.b64encode(buffered.getvalue()).decode()
+    
+    response = client.post('/recognize', json={'image': image_data})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+def test_recognize_oversize_image_returns_413(client, monkeypatch):
+    """测试超过像素限制的图像在解码前被拒绝"""
+    import image_decode
+    monkeypatch.setitem(image_decode.DECODE_LIMITS, 'max_pixels', 100)
+    buffered = io.BytesIO()
+    Image.new('RGB', (16, 16)).save(buffered, format='JPEG')
+    image_data = base64.b64encode(buffered.getvalue()).decode()
+    
+    response = client.post('/recognize', json={'image': image_data})
+    assert response.status_code == 413
+
+def test_non_string_image_returns_400(client):
+    """测试image字段不是字符串时返回400而不是500"""
+    response = client.post('/recognize', json={'image': 12345})
+    assert response.status_code == 400
+
+def test_request_body_limit(client, monkeypatch):
+    """测试单图接口的请求体超过一张图的上限时在读取前返回413"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'IMAGE_REQUEST_BYTES', 1024)
+    response = client.post('/register', json={'image': 'A' * 2048, 'name': 'alice'})
+    assert response.status_code == 413
+    assert 'error' in json.loads(response.data)
+    assert app.config['MAX_CONTENT_LENGTH'] > 0
+
+def test_metrics_endpoint(client):
+    """测试Prometheus指标端点"""
+    client.post('/recognize', json={})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b'face_gallery_size' in response.data
+    assert b'face_queue_depth' in response.data
+
+def test_register_bulk_no_data(client):
+    """测试无文件的批量注册"""
+    response = client.post('/register/bulk', data={})
+    assert response.status_code == 400
+
+def test_register_bulk_reports_failures(client):
+    """测试批量注册逐张报告失败原因"""
+    response = client.post(
+        '/register/bulk',
+        data={'images': [(io.BytesIO(b'not an image'), 'alice.jpg')]},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['enrolled'] == 0
+    assert data['failures'] == [{'filename': 'alice.jpg', 'name': 'alice', 'error': 'Invalid image data'}]
+
+def test_identities_pagination(client):
+    """测试人员列表分页参数"""
+    response = client.get('/identities?offset=0&limit=5')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['limit'] == 5
+    assert len(data['identities']) <= 5
+    assert 'total' in data
+
+def test_identity_not_found(client):
+    """测试不存在的人返回404"""
+    assert client.get('/identities/nobody-here').status_code == 404
+    assert client.delete('/identities/nobody-here').status_code == 404
+    assert client.delete('/faces/missing-id').status_code == 404
@@ -0,0 +1,92 @@
+import pytest
+import sys
+import os
+import json
+import asyncio
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+import asgi
+
+def call(method, path, body=b''):
+    """直接调用ASGI应用，返回 (状态码, JSON响应)"""
+    messages = []
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [], 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+    }
+    asyncio.run(asgi.application(scope, receive, send))
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, json.loads(body)
+
+@pytest.fixture(autouse=True)
+def ready():
+    app_module.warm_up()
+
+def test_recognize_without_image():
+    """测试异步识别接口缺少图像时返回400"""
+    status, data = call('POST', '/recognize', json.dumps({'stream_id': 'x'}).encode())
+    assert status == 400
+    assert data['error'] == 'No image data provided'
+
+def test_recognize_invalid_json():
+    """测试请求体不是JSON时返回400"""
+    status, _ = call('POST', '/recognize', b'not json')
+    assert status == 400
+
+def test_other_routes_delegate_to_flask():
+    """测试其他接口交给Flask应用处理"""
+    status, data = call('GET', '/health')
+    assert status == 200
+    assert data['face_system_ready'] is True
+
+def test_concurrent_stream_requests_do_not_starve_executor(monkeypatch):
+    """测试默认线程池被跟踪器占满时，带stream_id的并发请求仍能完成"""
+    import base64
+    import cv2
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    class StubEngine:
+        def recognize_batch(self, rgb_images):
+            return [[] for _ in rgb_images]
+    monkeypatch.setattr(app_module, 'engine', StubEngine())
+
+    _, jpeg = cv2.imencode('.jpg', np.zeros((32, 32, 3), dtype=np.uint8))
+    image = 'data:image/jpeg;base64,' + base64.b64encode(jpeg.tobytes()).decode()
+
+    async def one(i):
+        messages = []
+        body = json.dumps({'image': image, 'stream_id': f'stream-{i}'}).encode()
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        async def send(message):
+            messages.append(message)
+        await asgi.recognize(receive, send)
+        return next(m for m in messages if m['type'] == 'http.response.start')
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=4))
+        return await asyncio.wait_for(asyncio.gather(*(one(i) for i in range(8))), 10)
+
+    starts = asyncio.run(main())
+    assert [start['status'] for start in starts] == [200] * 8
+    assert (b'access-control-allow-origin', b'*') in starts[0]['headers']
+
+def test_websocket_rejected():
+    """测试WebSocket连接在握手前被关闭，而不是交给WSGI适配器"""
+    sent = []
+    async def receive():
+        return {'type': 'websocket.connect'}
+    async def send(message):
+        sent.append(message)
+    asyncio.run(asgi.application({'type': 'websocket', 'path': '/ws/recognize'}, receive, send))
+    assert sent == [{'type': 'websocket.close', 'code': 1008}]
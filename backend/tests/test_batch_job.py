@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+import json
+import csv
+import cv2
+import numpy as np
+from PIL import Image
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import batch_job
+from batch_job import list_sources, iter_frames, run
+
+class FakeFaceSystem:
+    def match_detections(self, detections):
+        return [[{'name': 'alice', 'confidence': 0.9, 'location': location} for location in locations]
+                for locations, _, _ in detections]
+
+def fake_detect_and_encode_batch(rgb_images):
+    return [([(0, 10, 10, 0)], [np.zeros(128)], []) for _ in rgb_images]
+
+def write_video(path, frames, fps=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (32, 24))
+    for i in range(frames):
+        writer.write(np.full((24, 32, 3), i, dtype=np.uint8))
+    writer.release()
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_job, 'detect_and_encode_batch', fake_detect_and_encode_batch)
+    footage = tmp_path / 'footage'
+    footage.mkdir()
+    for i in range(3):
+        Image.new('RGB', (32, 24)).save(footage / f'{i}.jpg')
+    write_video(footage / 'camera.avi', 20)
+    (footage / 'notes.txt').write_text('skip')
+    return list_sources(str(footage))
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_video_sampling(sources):
+    """测试视频按fps抽帧，图像和视频帧连续编号"""
+    frames = list(iter_frames(sources, fps=5))
+    assert [frame[0] for frame in frames] == list(range(len(frames)))
+    assert [frame[2] for frame in frames if frame[1].endswith('.avi')] == [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+
+def test_run_writes_jsonl_and_csv(sources, tmp_path):
+    """测试逐帧写出JSONL和CSV结果"""
+    summary = run(FakeFaceSystem(), sources, str(tmp_path / 'out.jsonl'), fps=5, batch_size=4)
+    rows = read_rows(tmp_path / 'out.jsonl')
+    assert summary['frames'] == len(rows) == 13
+    assert rows[0]['name'] == 'alice' and rows[-1]['timestamp'] == 1.8
+    
+    run(FakeFaceSystem(), sources, str(tmp_path / 'out.csv'), fps=5, batch_size=4)
+    with open(tmp_path / 'out.csv') as f:
+        assert len(list(csv.DictReader(f))) == 13
+
+def test_resume_from_checkpoint(sources, tmp_path, monkeypatch):
+    """测试中断后从断点继续，结果不重复不遗漏"""
+    output = str(tmp_path / 'out.jsonl')
+    calls = []
+    
+    def failing_batch(rgb_images):
+        calls.append(len(rgb_images))
+        if len(calls) == 3:
+            raise RuntimeError("interrupted")
+        return fake_detect_and_encode_batch(rgb_images)
+    
+    monkeypatch.setattr(batch_job, 'detect_and_encode_batch', failing_batch)
+    with pytest.raises(RuntimeError):
+        run(FakeFaceSystem(), sources, output, fps=5, batch_size=4)
+    assert len(read_rows(output)) == 8
+    
+    monkeypatch.setattr(batch_job, 'detect_and_encode_batch', fake_detect_and_encode_batch)
+    summary = run(FakeFaceSystem(), sources, output, fps=5, batch_size=4)
+    assert summary['frames'] == 5
+    rows = read_rows(output)
+    assert len(rows) == 13
+    assert len({(row['source'], row['frame']) for row in rows}) == 13
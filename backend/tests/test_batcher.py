@@ -0,0 +1,53 @@
+import pytest
+import sys
+import os
+import asyncio
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from batcher import MicroBatcher
+from engine import EngineBusy
+from telemetry import MetricsBuffer
+
+def run_concurrently(batcher, items):
+    async def main():
+        try:
+            return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+        finally:
+            await batcher.close()
+    return asyncio.run(main())
+
+def test_concurrent_requests_form_one_batch():
+    """测试并发请求被合并成一批，结果按请求分发"""
+    batches = []
+    def process(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+    
+    metrics = MetricsBuffer()
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=50, metrics=metrics)
+    assert run_concurrently(batcher, [1, 2, 3]) == [10, 20, 30]
+    assert batches == [[1, 2, 3]]
+    assert metrics.counters['microbatch_batches'] == 1
+    assert metrics.counters['microbatch_items'] == 3
+
+def test_batch_size_limit():
+    """测试超过最大批大小时拆成多批"""
+    batches = []
+    def process(items):
+        batches.append(len(items))
+        return list(items)
+    
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=50)
+    assert run_concurrently(batcher, list(range(5))) == list(range(5))
+    assert batches == [2, 2, 1]
+
+def test_exception_propagates_to_every_request():
+    """测试批处理失败时该批的每个请求都收到异常"""
+    def process(items):
+        raise EngineBusy("full")
+    
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=10)
+    results = run_concurrently(batcher, [1, 2])
+    assert all(isinstance(result, EngineBusy) for result in results)
@@ -0,0 +1,79 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from gallery import FaceGallery
+from calibration import ScoreCalibrator, fit_slope
+
+SETTINGS = {'threshold': 0.6, 'enabled': True, 'max_adjust': 0.1, 'margin': 0.02, 'sample_size': 256}
+
+def _point(x):
+    encoding = np.zeros(128, dtype=np.float32)
+    encoding[0] = x
+    return encoding
+
+def _gallery():
+    """spread的两张照片相距0.65；close与neighbor只相距0.5"""
+    gallery = FaceGallery()
+    gallery.add_many([_point(0.0), _point(0.65)], ["spread", "spread"])
+    gallery.add_many([_point(10.0), _point(10.5)], ["close", "neighbor"])
+    return gallery
+
+def test_per_identity_thresholds():
+    """测试照片分散的人阈值放宽，与他人接近的人阈值收紧"""
+    gallery = _gallery()
+    calibrator = ScoreCalibrator(SETTINGS)
+    calibrator.fit(gallery)
+
+    thresholds = dict(zip(gallery.people, gallery.thresholds))
+    assert thresholds["spread"] == pytest.approx(0.65)
+    assert thresholds["close"] == pytest.approx(0.5)
+    assert thresholds["neighbor"] == pytest.approx(0.5)
+    assert not gallery.stale_people
+
+def test_score_against_threshold_vector():
+    """测试按各人阈值一次判定，距离等于阈值时置信度为0.5"""
+    gallery = _gallery()
+    calibrator = ScoreCalibrator(SETTINGS)
+    calibrator.fit(gallery)
+
+    people = np.array([0, 1, -1])
+    distances = np.array([0.62, 0.52, np.inf], dtype=np.float32)
+    accepted, confidence = calibrator.score(gallery, people, distances)
+    assert accepted.tolist() == [True, False, False]
+    assert confidence[0] > 0.5 > confidence[1]
+    assert confidence[2] == 0
+
+    _, at_threshold = calibrator.score(gallery, np.array([1]), np.array([0.5], dtype=np.float32))
+    assert at_threshold[0] == pytest.approx(0.5, abs=1e-3)
+
+def test_refresh_only_changed_people():
+    """测试增量校准只重算有变化的人，删除后阈值作废"""
+    gallery = _gallery()
+    calibrator = ScoreCalibrator(SETTINGS)
+    calibrator.fit(gallery)
+
+    gallery.thresholds[0] = 0.55
+    gallery.remove(gallery.person_rows[2][0])
+    assert gallery.stale_people == {2}
+    calibrator.refresh(gallery)
+
+    assert np.isnan(gallery.thresholds[2])
+    assert gallery.thresholds[0] == pytest.approx(0.55)
+    # neighbor已被删除，close下次全量校准前仍保持原阈值
+    assert gallery.thresholds[1] == pytest.approx(0.5)
+
+def test_fit_slope_separates_classes():
+    """测试拟合出的斜率使同一人余量为正时置信度高"""
+    rng = np.random.default_rng(0)
+    genuine = rng.normal(0.1, 0.05, 500)
+    impostor = rng.normal(-0.2, 0.05, 500)
+    slope = fit_slope(genuine, impostor)
+
+    assert 1.0 < slope <= 200.0
+    assert 1 / (1 + np.exp(-slope * 0.1)) > 0.9
+    assert fit_slope([], impostor, slope=5.0) == 5.0
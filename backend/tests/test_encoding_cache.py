@@ -0,0 +1,78 @@
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import encoding_cache
+from encoding_cache import EncodingCache, content_key, perceptual_key
+from telemetry import MetricsBuffer
+
+def make_image(seed):
+    return np.random.default_rng(seed).integers(0, 256, (32, 32, 3), dtype=np.uint8)
+
+def test_content_key_depends_on_pixels_and_shape():
+    """测试内容哈希区分像素和尺寸"""
+    image = make_image(0)
+    assert content_key(image) == content_key(image.copy())
+    assert content_key(image) != content_key(make_image(1))
+    assert content_key(np.zeros((4, 8, 3), np.uint8)) != content_key(np.zeros((8, 4, 3), np.uint8))
+
+def test_perceptual_key_ignores_small_noise():
+    """测试感知哈希对轻微噪声不敏感"""
+    gradient = np.tile(np.linspace(0, 250, 64, dtype=np.uint8), (64, 1))
+    image = np.stack([gradient] * 3, axis=2)
+    noisy = image.copy()
+    noisy[::7, ::5] += 1
+    assert perceptual_key(image) == perceptual_key(noisy)
+    assert content_key(image) != content_key(noisy)
+
+def test_perceptual_hit_verified_on_face_regions():
+    """测试静态背景前换了一个人时整帧dHash相同，但核对人脸区域后拒绝命中"""
+    gradient = np.tile(np.linspace(0, 250, 320, dtype=np.uint8), (240, 1))
+    background = np.stack([gradient] * 3, axis=2)
+    alice, bob = background.copy(), background.copy()
+    # 两张“脸”亮度均值相同，明暗分布不同
+    face = np.tile(np.linspace(60, 190, 40, dtype=np.uint8), (40, 1))
+    alice[100:140, 150:190] = face[:, :, None]
+    bob[100:140, 150:190] = face.T[:, :, None]
+    assert perceptual_key(alice) == perceptual_key(bob)
+    
+    metrics = MetricsBuffer()
+    cache = EncodingCache(max_entries=4, ttl=60, perceptual=True, metrics=metrics)
+    detection = ([(100, 190, 140, 150)], [np.zeros(128)])
+    cache.put(cache.key(alice), detection, alice)
+    noisy = alice.copy()
+    noisy[::7, ::5] += 1
+    assert cache.get(cache.key(noisy), noisy) is detection
+    assert cache.get(cache.key(bob), bob) is None
+    assert metrics.counters['encoding_cache_rejected'] == 1
+
+def test_hit_miss_and_lru_eviction():
+    """测试命中统计和按条数淘汰"""
+    metrics = MetricsBuffer()
+    cache = EncodingCache(max_entries=2, ttl=60, perceptual=False, metrics=metrics)
+    cache.put('a', ([], []))
+    cache.put('b', ([], []))
+    assert cache.get('a') == ([], [])
+    cache.put('c', ([], []))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.hits == 2 and cache.misses == 1
+    assert metrics.counters['encoding_cache_hits'] == 2
+    assert len(cache) == 2
+
+def test_ttl_expiry(monkeypatch):
+    """测试条目超过TTL后失效"""
+    now = [100.0]
+    monkeypatch.setattr(encoding_cache.time, 'monotonic', lambda: now[0])
+    cache = EncodingCache(max_entries=4, ttl=5, perceptual=False)
+    cache.put('a', ([], []))
+    now[0] += 6
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+def test_zero_size_disables_cache():
+    """测试大小为0时禁用缓存"""
+    assert not EncodingCache(max_entries=0).enabled
@@ -0,0 +1,66 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import engine as engine_module
+from engine import RecognitionEngine, EngineBusy
+from telemetry import MetricsBuffer
+
+class FakeFaceSystem:
+    def __init__(self):
+        self.registered = []
+        self.metrics = MetricsBuffer()
+    
+    def match_detections(self, detections):
+        return [[{'name': 'Unknown', 'location': location} for location in locations]
+                for locations, _, _ in detections]
+    
+    def register_detection(self, detection, name):
+        self.registered.append(name)
+        return len(detection[1]) > 0
+
+def fake_detect_and_encode_batch(rgb_images, timings=None):
+    if timings is not None:
+        timings['face_locations_ms'] = 1.0
+    return [([(0, 10, 10, 0)], [np.zeros(128)], []) for _ in rgb_images]
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(engine_module, 'detect_and_encode_batch', fake_detect_and_encode_batch)
+    return RecognitionEngine(FakeFaceSystem(), workers=0, queue_size=1)
+
+def test_inline_recognize_batch(engine):
+    """测试无工作进程时在当前线程中执行"""
+    images = [np.zeros((8, 8, 3), dtype=np.uint8)] * 2
+    results = engine.recognize_batch(images)
+    assert len(results) == 2
+    assert engine.queue_depth == 0
+    # 未命中缓存的图像在同一块中一次检测编码
+    assert engine.face_system.metrics.histograms['face_locations_ms'].count == 1
+
+def test_add_new_face(engine):
+    """测试通过引擎注册人脸"""
+    assert engine.add_new_face(np.zeros((8, 8, 3), dtype=np.uint8), "alice")
+    assert engine.face_system.registered == ["alice"]
+
+def test_queue_full_raises_busy(engine):
+    """测试队列已满时拒绝新任务"""
+    engine._slots.acquire()
+    try:
+        with pytest.raises(EngineBusy):
+            engine.recognize_batch([np.zeros((8, 8, 3), dtype=np.uint8)])
+    finally:
+        engine._slots.release()
+
+def test_repeated_image_uses_cache(engine):
+    """测试重复图像命中缓存，不再重新检测"""
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    engine.recognize_batch([image])
+    assert engine.face_system.metrics.histograms['face_locations_ms'].count == 1
+    engine.recognize_batch([image.copy()])
+    assert engine.face_system.metrics.histograms['face_locations_ms'].count == 1
+    assert engine.cache.hits == 1
@@ -0,0 +1,108 @@
+import sys
+import os
+import io
+import tarfile
+import zipfile
+import numpy as np
+import pytest
+from PIL import Image
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import enrollment
+from enrollment import name_from_path, iter_archive, iter_directory, encode_items, enroll
+
+def jpeg_bytes(width):
+    buffered = io.BytesIO()
+    Image.new('RGB', (width, 16)).save(buffered, format='JPEG')
+    return buffered.getvalue()
+
+def fake_detect_and_encode(rgb_image, timings=None):
+    # 用图像宽度模拟人脸数量：16→0张，32→1张，48→2张
+    count = rgb_image.shape[1] // 16 - 1
+    return [(0, 1, 1, 0)] * count, [np.full(128, count, dtype=np.float32)] * count, []
+
+class FakeFaceSystem:
+    def __init__(self):
+        self.saved = []
+    
+    def save_faces(self, face_encodings, names):
+        self.saved.append((len(face_encodings), list(names)))
+
+def test_name_from_path():
+    """测试从路径推断姓名"""
+    assert name_from_path('alice/001.jpg') == 'alice'
+    assert name_from_path('people/bob/a.png') == 'bob'
+    assert name_from_path('carol.jpg') == 'carol'
+
+def test_iter_directory_and_archive(tmp_path):
+    """测试目录和zip归档的遍历"""
+    (tmp_path / 'alice').mkdir()
+    (tmp_path / 'alice' / '1.jpg').write_bytes(jpeg_bytes(32))
+    (tmp_path / 'notes.txt').write_text('skip')
+    assert [(f, n) for f, n, _ in iter_directory(str(tmp_path))] == [('alice/1.jpg', 'alice')]
+    
+    buffered = io.BytesIO()
+    with zipfile.ZipFile(buffered, 'w') as archive:
+        archive.writestr('bob/1.jpg', jpeg_bytes(32))
+        archive.writestr('readme.md', 'skip')
+    items = list(iter_archive(buffered))
+    assert [(f, n) for f, n, _ in items] == [('bob/1.jpg', 'bob')]
+
+def test_archive_oversized_entries_not_decompressed(monkeypatch):
+    """测试归档中声明大小超限的条目不解压，逐张记为失败"""
+    monkeypatch.setitem(enrollment.DECODE_LIMITS, 'max_bytes', 1024)
+    monkeypatch.setattr(enrollment, 'detect_and_encode', fake_detect_and_encode)
+    bomb = b'\0' * (1 << 20)
+
+    zipped = io.BytesIO()
+    with zipfile.ZipFile(zipped, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('bomb/1.jpg', bomb)
+    monkeypatch.setattr(zipfile.ZipFile, 'read', lambda *args: pytest.fail('oversized entry decompressed'))
+    items = list(iter_archive(zipped))
+    _, _, failures = encode_items(items)
+    assert failures[0]['filename'] == 'bomb/1.jpg'
+    assert failures[0]['error'] == 'Image exceeds 1024 bytes'
+
+    tarred = io.BytesIO()
+    with tarfile.open(fileobj=tarred, mode='w:gz') as archive:
+        info = tarfile.TarInfo('bomb/2.jpg')
+        info.size = len(bomb)
+        archive.addfile(info, io.BytesIO(bomb))
+        info = tarfile.TarInfo('ok/3.jpg')
+        small = jpeg_bytes(32)
+        info.size = len(small)
+        archive.addfile(info, io.BytesIO(small))
+    _, names, failures = encode_items(iter_archive(tarred))
+    assert names == ['ok']
+    assert [f['filename'] for f in failures] == ['bomb/2.jpg']
+
+def test_encode_items_reports_failures(monkeypatch):
+    """测试无人脸、多张人脸和无效图像逐张报错"""
+    monkeypatch.setattr(enrollment, 'detect_and_encode', fake_detect_and_encode)
+    items = [
+        ('a.jpg', 'a', jpeg_bytes(32)),
+        ('b.jpg', 'b', jpeg_bytes(16)),
+        ('c.jpg', 'c', jpeg_bytes(48)),
+        ('d.jpg', 'd', b'garbage'),
+    ]
+    encodings, names, failures = encode_items(items)
+    assert names == ['a']
+    assert [f['filename'] for f in failures] == ['b.jpg', 'c.jpg', 'd.jpg']
+    assert failures[1]['error'].startswith('Multiple faces')
+
+def test_low_quality_enrolment_rejected(monkeypatch):
+    """测试只检测到不合格人脸的注册照片被拒绝"""
+    monkeypatch.setattr(enrollment, 'detect_and_encode', lambda rgb_image: ([], [], [((0, 1, 1, 0), 'blurry')]))
+    _, _, failures = encode_items([('a.jpg', 'a', jpeg_bytes(32))])
+    assert failures[0]['error'] == 'Low quality face (blurry)'
+
+def test_enroll_commits_once(monkeypatch):
+    """测试整批只提交一次"""
+    monkeypatch.setattr(enrollment, 'detect_and_encode', fake_detect_and_encode)
+    face_system = FakeFaceSystem()
+    items = [(f'{i}.jpg', f'p{i}', jpeg_bytes(32)) for i in range(5)]
+    summary = enroll(face_system, items)
+    assert summary['enrolled'] == 5 and summary['failed'] == 0
+    assert face_system.saved == [(5, ['p0', 'p1', 'p2', 'p3', 'p4'])]
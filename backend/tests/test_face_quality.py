@@ -0,0 +1,52 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from face_quality import assess_faces, estimate_yaw, sharpness
+
+QUALITY = {'enabled': True, 'min_size': 20, 'min_sharpness': 25, 'max_yaw': 45}
+
+def frontal_landmarks(location):
+    return {'left_eye': [(30, 40), (40, 40)], 'right_eye': [(60, 40), (70, 40)], 'nose_tip': [(50, 60)]}
+
+def profile_landmarks(location):
+    return {'left_eye': [(30, 40), (34, 40)], 'right_eye': [(40, 40), (44, 40)], 'nose_tip': [(60, 60)]}
+
+def textured_image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (100, 100, 3), dtype=np.uint8)
+
+def test_sharpness():
+    """测试纹理丰富的人脸比平坦区域清晰"""
+    location = (0, 100, 100, 0)
+    assert sharpness(textured_image(), location) > 25
+    assert sharpness(np.full((100, 100, 3), 128, dtype=np.uint8), location) == 0
+
+def test_estimate_yaw():
+    """测试正脸偏转角接近0，侧脸偏转角大"""
+    assert estimate_yaw(frontal_landmarks(None)) < 5
+    assert estimate_yaw(profile_landmarks(None)) > 60
+
+def test_assess_faces_reasons():
+    """测试大小、清晰度、姿态依次检查，关键点只对前两项合格的人脸计算"""
+    image = textured_image()
+    image[:, 50:] = 128
+    locations = [(0, 10, 10, 0), (0, 100, 40, 60), (0, 40, 40, 0)]
+    requested = []
+    
+    def landmarks(rgb_image, face_locations):
+        requested.extend(face_locations)
+        return [profile_landmarks(location) for location in face_locations]
+    
+    reasons = assess_faces(image, locations, landmarks, QUALITY)
+    assert reasons == ['too_small', 'blurry', 'pose']
+    assert requested == [(0, 40, 40, 0)]
+
+def test_disabled_gate():
+    """测试关闭质量检查时全部通过"""
+    reasons = assess_faces(np.zeros((10, 10, 3), dtype=np.uint8), [(0, 5, 5, 0)], None, dict(QUALITY, enabled=False))
+    assert reasons == [None]
@@ -0,0 +1,233 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from face_system import FaceRecognitionSystem
+from gallery import FaceGallery
+from face_quality import NO_QUALITY_GATE, LowQualityFace
+
+def test_encryption_decryption():
+    """测试加密解密功能"""
+    system = FaceRecognitionSystem()
+    test_data = b"test data for encryption"
+    
+    encrypted = system.encrypt_data(test_data)
+    decrypted = system.decrypt_data(encrypted)
+    
+    assert decrypted == test_data
+    assert encrypted != test_data  # 确保数据确实被加密
+
+def test_string_encryption():
+    """测试字符串加密"""
+    system = FaceRecognitionSystem()
+    test_string = "test string"
+    
+    encrypted = system.encrypt_data(test_string)
+    decrypted = system.decrypt_data(encrypted)
+    
+    assert decrypted.decode() == test_string
+
+def test_numpy_encryption():
+    """测试numpy数组加密"""
+    system = FaceRecognitionSystem()
+    test_array = np.array([1.0, 2.0, 3.0, 4.0])
+    
+    encrypted = system.encrypt_data(test_array)
+    decrypted_bytes = system.decrypt_data(encrypted)
+    decrypted_array = np.frombuffer(decrypted_bytes, dtype=test_array.dtype)
+    
+    assert np.array_equal(test_array, decrypted_array)
+
+def test_system_initialization():
+    """测试系统初始化"""
+    system = FaceRecognitionSystem()
+    assert system.known_faces_dir is not None
+    assert system.unknown_faces_dir is not None
+    assert hasattr(system, 'known_face_encodings')
+    assert hasattr(system, 'known_face_names')
+
+def test_match_faces_returns_best_match():
+    """测试批量比对返回距离最近的人脸"""
+    system = FaceRecognitionSystem()
+    system.gallery = FaceGallery()
+    base = np.zeros(128)
+    system.gallery.add(base + 0.05, "far")
+    system.gallery.add(base + 0.01, "near")
+    
+    results = system.match_faces([base, base + 1.0], [(0, 10, 10, 0), (5, 15, 15, 5)])
+    
+    assert results[0]['name'] == "near"
+    assert results[1]['name'] == "Unknown"
+    assert results[0]['confidence'] > results[1]['confidence']
+
+def test_face_api_loads_library_not_backend_module(tmp_path, monkeypatch):
+    """测试以backend为工作目录运行时（python app.py）加载的是face_recognition库"""
+    import face_system as fr_module
+    package = tmp_path / 'face_recognition'
+    package.mkdir()
+    (package / '__init__.py').write_text("def face_locations(*args, **kwargs):\n    return []\n")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.setattr(sys, 'path', [backend_dir, str(tmp_path)] + sys.path)
+    monkeypatch.delitem(sys.modules, 'face_recognition', raising=False)
+    monkeypatch.setattr(fr_module, '_face_api', None)
+    
+    api = fr_module.face_api()
+    assert os.path.dirname(api.__file__) == str(package)
+    assert fr_module.detect_faces(np.zeros((8, 8, 3), dtype=np.uint8)) == []
+
+def test_downscaled_detection_rescales_boxes(monkeypatch):
+    """测试缩小检测后人脸框换算回原图坐标，编码使用原图"""
+    import face_system as fr_module
+    from types import SimpleNamespace
+    
+    detected_shapes = []
+    encoded = {}
+    
+    def fake_face_locations(image, number_of_times_to_upsample=1, model='hog'):
+        detected_shapes.append(image.shape)
+        return [(10, 60, 60, 10)]
+    
+    def fake_face_encodings(image, locations, model='small'):
+        encoded['shape'] = image.shape
+        encoded['locations'] = locations
+        return [np.zeros(128) for _ in locations]
+    
+    # 替换dlib的face_recognition库
+    monkeypatch.setattr(fr_module, '_face_api', SimpleNamespace(
+        face_locations=fake_face_locations, face_encodings=fake_face_encodings
+    ))
+    
+    settings = {'model': 'hog', 'upsample': 0, 'max_width': 320, 'encoding_model': 'small'}
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    locations, encodings, _ = fr_module.detect_and_encode(image, settings=settings, quality=NO_QUALITY_GATE)
+    
+    assert detected_shapes == [(180, 320, 3)]
+    assert locations == [(40, 240, 240, 40)]
+    assert encoded['shape'] == (720, 1280, 3)
+    assert encoded['locations'] == locations
+    assert len(encodings) == 1
+
+def test_encoding_model_matches_enrolled_gallery(monkeypatch):
+    """测试.env中的FACE_ENCODING_MODEL不会让查询改用与特征库不同的编码模型"""
+    import face_system as fr_module
+    
+    monkeypatch.setenv('FACE_ENCODING_MODEL', 'large')
+    monkeypatch.setenv('FACE_DETECTION_UPSAMPLE', '2')
+    settings = fr_module.detection_settings()
+    assert settings['encoding_model'] == 'small'
+    assert settings['upsample'] == 2
+
+def test_low_quality_faces_skip_encoding(monkeypatch):
+    """测试不合格的人脸不计算特征，作为low_quality返回"""
+    import face_system as fr_module
+    from types import SimpleNamespace
+    
+    encoded = []
+    monkeypatch.setattr(fr_module, '_face_api', SimpleNamespace(
+        face_locations=lambda image, number_of_times_to_upsample=1, model='hog': [(0, 100, 100, 0), (0, 130, 10, 120)],
+        face_encodings=lambda image, locations, model='small': encoded.extend(locations) or [np.zeros(128) for _ in locations],
+    ))
+    
+    settings = {'model': 'hog', 'upsample': 0, 'max_width': 0, 'encoding_model': 'small'}
+    quality = {'enabled': True, 'min_size': 20, 'min_sharpness': 0, 'max_yaw': 0}
+    image = np.zeros((200, 200, 3), dtype=np.uint8)
+    detection = fr_module.detect_and_encode(image, settings=settings, quality=quality)
+    
+    assert encoded == [(0, 100, 100, 0)]
+    assert detection[2] == [((0, 130, 10, 120), 'too_small')]
+    
+    system = FaceRecognitionSystem()
+    results = system.match_detections([detection])[0]
+    assert results[-1]['low_quality'] == 'too_small'
+    assert system.metrics.counters['low_quality_faces'] == 1
+    
+    with pytest.raises(LowQualityFace):
+        system.register_detection(([], [], detection[2]), "bob")
+
+def test_sync_applies_other_process_writes(tmp_path, monkeypatch):
+    """测试另一个进程注册的人脸通过增量同步可见，合并后也不重复"""
+    from cryptography.fernet import Fernet
+    monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+    monkeypatch.setenv('KNOWN_FACES_DIR', str(tmp_path))
+    writer = FaceRecognitionSystem()
+    reader = FaceRecognitionSystem()
+    
+    writer.save_face(np.full(128, 0.1), "alice")
+    assert reader.sync() == 1
+    assert reader.known_face_names == ["alice"]
+    assert reader.sync() == 0
+    
+    writer.save_faces(np.full((2, 128), 0.2), ["bob", "bob"])
+    writer.store.compact()
+    assert reader.sync() == 2
+    assert reader.known_face_names == ["alice", "bob", "bob"]
+    assert writer.sync() == 0
+
+def test_delete_and_rename_sync_between_processes(tmp_path, monkeypatch):
+    """测试删除和改名写入日志后其他进程同步生效"""
+    from cryptography.fernet import Fernet
+    monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+    monkeypatch.setenv('KNOWN_FACES_DIR', str(tmp_path))
+    writer = FaceRecognitionSystem()
+    reader = FaceRecognitionSystem()
+    
+    writer.save_faces(np.eye(3, 128), ["alice", "bob", "bob"])
+    reader.sync()
+    
+    assert writer.rename_person("bob", "robert") == 2
+    assert writer.delete_person("alice") == 1
+    assert reader.sync() == 3
+    assert reader.list_people() == ([("robert", 2)], 1)
+    
+    writer.delete_faces(writer.person_face_ids("robert")[:1])
+    writer.store.compact()
+    assert reader.sync() == 1
+    assert sorted(reader.face_ids) == sorted(writer.face_ids)
+
+def test_ephemeral_key_does_not_persist(tmp_path, monkeypatch):
+    """测试未配置密钥时不写入KNOWN_FACES_DIR，重启后仍能正常启动"""
+    monkeypatch.delenv('ENCRYPTION_KEY', raising=False)
+    monkeypatch.setenv('KNOWN_FACES_DIR', str(tmp_path))
+    system = FaceRecognitionSystem()
+    system.save_face(np.full(128, 0.1), "alice")
+    assert system.known_face_names == ["alice"]
+    assert os.listdir(tmp_path) == []
+    
+    assert FaceRecognitionSystem().known_face_names == []
+
+def test_save_face_compacts_without_reload(tmp_path, monkeypatch):
+    """测试逐条注册也会触发合并，合并后同步不重新加载，其他进程的写入不丢"""
+    from cryptography.fernet import Fernet
+    monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+    monkeypatch.setenv('KNOWN_FACES_DIR', str(tmp_path))
+    monkeypatch.setenv('GALLERY_COMPACT_THRESHOLD', '3')
+    system = FaceRecognitionSystem()
+    other = FaceRecognitionSystem()
+    
+    system.save_face(np.full(128, 0.1), "alice")
+    other.save_face(np.full(128, 0.2), "bob")
+    system.save_face(np.full(128, 0.3), "carol")
+    system.save_face(np.full(128, 0.4), "dave")
+    assert system.store.journal_count == 0
+    assert sorted(system.known_face_names) == ["alice", "bob", "carol", "dave"]
+    
+    monkeypatch.setattr(system.store, 'load', lambda: pytest.fail("sync reloaded the gallery"))
+    assert system.sync() == 0
+
+def test_legacy_faces_not_listed(tmp_path, monkeypatch):
+    """测试未迁移的旧格式特征没有ID，不出现在可删除的列表中"""
+    from cryptography.fernet import Fernet
+    monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+    monkeypatch.setenv('KNOWN_FACES_DIR', str(tmp_path))
+    system = FaceRecognitionSystem()
+    system.gallery.add(np.full(128, 0.1), "alice")
+    system.save_face(np.full(128, 0.2), "alice")
+    
+    face_ids = system.person_face_ids("alice")
+    assert len(face_ids) == 1 and None not in face_ids
+    assert system.delete_person("alice") == 1
+    assert system.person_face_ids("alice") == []
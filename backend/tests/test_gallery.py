@@ -0,0 +1,195 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from gallery import FaceGallery
+
+def test_gallery_growth():
+    """测试特征库自动扩容"""
+    gallery = FaceGallery(capacity=2)
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        gallery.add(rng.normal(size=128), f"person_{i}")
+    
+    assert len(gallery) == 5
+    assert gallery.capacity >= 5
+    assert gallery.encodings.shape == (5, 128)
+    assert gallery.encodings.dtype == np.float32
+    assert gallery.names == [f"person_{i}" for i in range(5)]
+
+def test_gallery_distances_match_numpy():
+    """测试批量距离与逐个计算一致"""
+    rng = np.random.default_rng(1)
+    encodings = rng.normal(scale=0.1, size=(50, 128))
+    queries = rng.normal(scale=0.1, size=(3, 128))
+    
+    gallery = FaceGallery()
+    gallery.add_many(encodings, [str(i) for i in range(50)])
+    
+    expected = np.linalg.norm(encodings[None, :, :] - queries[:, None, :], axis=2)
+    assert np.allclose(gallery.distances(queries), expected, atol=1e-4)
+
+def test_gallery_top_k():
+    """测试top-k结果按距离升序"""
+    rng = np.random.default_rng(2)
+    encodings = rng.normal(scale=0.1, size=(20, 128))
+    
+    gallery = FaceGallery()
+    gallery.add_many(encodings, [str(i) for i in range(20)])
+    
+    indices, distances = gallery.match(encodings[:4], k=3)
+    assert indices.shape == (4, 3)
+    assert list(indices[:, 0]) == [0, 1, 2, 3]
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+def test_empty_gallery_match():
+    """测试空特征库匹配"""
+    gallery = FaceGallery()
+    indices, distances = gallery.match(np.zeros(128), k=1)
+    assert indices.shape == (1, 0)
+    assert distances.shape == (1, 0)
+
+def test_people_and_centroids():
+    """测试同名特征归为同一人并维护中心"""
+    gallery = FaceGallery(capacity=2)
+    gallery.add_many([np.zeros(128), np.full(128, 0.2)], ["alice", "bob"])
+    gallery.add(np.full(128, 0.4), "bob")
+    
+    assert gallery.people == ["alice", "bob"]
+    assert gallery.person_rows == [[0], [1, 2]]
+    assert list(gallery.row_person) == [0, 1, 1]
+    np.testing.assert_allclose(gallery.centroids[1], np.full(128, 0.3), rtol=1e-6)
+
+def test_search_people_matches_exact_best_of_person():
+    """测试中心粗筛+重排与精确的每人最近特征一致"""
+    rng = np.random.default_rng(3)
+    centers = rng.normal(scale=0.3, size=(40, 128))
+    names, encodings = [], []
+    for person, center in enumerate(centers):
+        for _ in range(5):
+            encodings.append(center + rng.normal(scale=0.02, size=128))
+            names.append(f"person_{person}")
+    
+    gallery = FaceGallery(index='brute')
+    gallery.add_many(encodings, names)
+    queries = centers[:10] + rng.normal(scale=0.02, size=(10, 128))
+    
+    people, distances = gallery.search_people(queries, shortlist=4)
+    exact = gallery.distances(queries)
+    exact_rows = np.argmin(exact, axis=1)
+    np.testing.assert_array_equal(people, gallery.row_person[exact_rows])
+    np.testing.assert_allclose(distances, exact.min(axis=1), rtol=1e-4)
+
+def test_search_people_empty_gallery():
+    """测试空库返回-1"""
+    people, distances = FaceGallery().search_people(np.zeros((2, 128)))
+    assert list(people) == [-1, -1]
+    assert np.isinf(distances).all()
+
+def test_remove_swaps_last_row():
+    """测试删除时最后一行搬到被删除的位置，ID映射同步更新"""
+    gallery = FaceGallery()
+    encodings = np.eye(4, 128)
+    gallery.add_many(encodings, ["a", "b", "b", "c"], ids=["id0", "id1", "id2", "id3"])
+    
+    gallery.remove(gallery.slots["id1"])
+    assert len(gallery) == 3
+    assert gallery.ids == ["id0", "id3", "id2"]
+    assert gallery.slots == {"id0": 0, "id3": 1, "id2": 2}
+    assert gallery.names == ["a", "c", "b"]
+    np.testing.assert_array_equal(gallery.encodings[1], encodings[3])
+    np.testing.assert_allclose(gallery.centroids[1], encodings[2])
+    
+    gallery.remove(gallery.slots["id2"])
+    assert gallery.list_people() == ([("a", 1), ("c", 1)], 2)
+    people, _ = gallery.search_people(encodings[1:2])
+    assert gallery.people[people[0]] != "b"
+
+def test_rename_moves_row_to_other_person():
+    """测试改名把特征并入另一个人"""
+    gallery = FaceGallery()
+    gallery.add_many(np.eye(2, 128), ["a", "b"], ids=["x", "y"])
+    gallery.rename(gallery.slots["y"], "a")
+    assert gallery.list_people() == ([("a", 2)], 1)
+    np.testing.assert_allclose(gallery.centroids[0], np.eye(2, 128).mean(axis=0))
+
+def test_list_people_pages():
+    """测试人员分页：无空人员时直接切片，删光特征的人被跳过且不计入总数"""
+    gallery = FaceGallery()
+    names = [f"p{i}" for i in range(10)]
+    gallery.add_many(np.eye(10, 128), names, ids=names)
+    gallery.add(np.eye(1, 128, 20)[0], "p3", face_id="p3b")
+    assert gallery.list_people(2, 3) == ([("p2", 1), ("p3", 2), ("p4", 1)], 10)
+    assert gallery.face_ids_of("p3") == ["p3", "p3b"]
+    assert gallery.face_ids_of("nobody") == []
+    
+    for face_id in ("p1", "p3", "p3b"):
+        gallery.remove(gallery.slots[face_id])
+    assert gallery.list_people(1, 3) == ([("p2", 1), ("p4", 1), ("p5", 1)], 8)
+    assert gallery.list_people(7) == ([("p9", 1)], 8)
+    assert gallery.face_ids_of("p3") == []
+    
+    gallery.add(np.eye(1, 128, 30)[0], "p3", face_id="again")
+    assert gallery.list_people(0, 3) == ([("p0", 1), ("p2", 1), ("p3", 1)], 9)
+
+def test_search_during_concurrent_adds():
+    """测试边添加边检索时不会匹配到还没登记完的人（曾把新人认成person_0）"""
+    import threading
+    rng = np.random.default_rng(5)
+    encodings = rng.normal(size=(4000, 128)).astype(np.float32)
+    names = [f"person_{i}" for i in range(len(encodings))]
+    gallery = FaceGallery(capacity=1)
+    gallery.add(encodings[0], names[0])
+    done = threading.Event()
+    
+    def writer():
+        for start in range(1, len(encodings), 200):
+            gallery.add_many(encodings[start:start + 200], names[start:start + 200])
+        done.set()
+    
+    thread = threading.Thread(target=writer)
+    thread.start()
+    errors = []
+    while not done.is_set():
+        i = len(gallery) - 1
+        people, distances = gallery.search_people(encodings[i:i + 1], shortlist=4)
+        if gallery.people[people[0]] != names[i] or distances[0] > 0.1:
+            errors.append((i, int(people[0]), float(distances[0])))
+    thread.join()
+    assert errors == []
+
+def test_int8_storage_matches_float32():
+    """测试int8存储每条特征只占dim字节，距离与float32存储的误差在量化步长量级，识别结果一致"""
+    rng = np.random.default_rng(5)
+    encodings = rng.normal(scale=0.09, size=(3000, 128)).astype(np.float32)
+    names = [f"person_{i // 3}" for i in range(len(encodings))]
+    queries = encodings[::97] + rng.normal(scale=0.02, size=(31, 128)).astype(np.float32)
+    
+    exact = FaceGallery(capacity=1000, storage='float32')
+    compact = FaceGallery(capacity=1000, storage='int8')
+    for gallery in (exact, compact):
+        gallery.add_many(encodings, names)
+    
+    assert compact.codes_of(slice(0, len(compact))).nbytes == len(encodings) * 128
+    assert compact.encodings.dtype == np.float32
+    assert np.max(np.abs(compact.distances(queries) - exact.distances(queries))) < 0.01
+    
+    exact_people, exact_distances = exact.search_people(queries)
+    people, distances = compact.search_people(queries)
+    assert np.array_equal(people, exact_people)
+    assert np.allclose(distances, exact_distances, atol=0.01)
+    
+    # 删除（swap-remove）和改名同样作用于编码
+    compact.remove(0)
+    compact.rename(1, "renamed")
+    assert np.allclose(compact.encodings_of(0), encodings[-1], atol=0.5 / 127)
+    assert compact.list_people()[0][-1] == ("renamed", 1)
+
+def test_unknown_storage_rejected():
+    """测试未知的存储格式"""
+    with pytest.raises(ValueError):
+        FaceGallery(storage='float16')
@@ -0,0 +1,161 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from gallery import FaceGallery
+from gallery_index import BruteForceIndex, IVFIndex, create_index
+
+def _random_encodings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=0.09, size=(count, 128)).astype(np.float32)
+
+def test_default_index_is_brute_force(monkeypatch):
+    """测试默认使用精确扫描"""
+    monkeypatch.delenv('GALLERY_INDEX', raising=False)
+    gallery = FaceGallery()
+    assert isinstance(gallery.index, BruteForceIndex)
+
+def test_index_selected_by_env(monkeypatch):
+    """测试通过环境变量选择索引"""
+    monkeypatch.setenv('GALLERY_INDEX', 'ivf')
+    assert isinstance(create_index(FaceGallery(index='brute')), IVFIndex)
+    
+    with pytest.raises(ValueError):
+        create_index(FaceGallery(index='brute'), 'unknown')
+
+def test_ivf_recall_against_exact():
+    """测试IVF检索结果与精确扫描基本一致"""
+    encodings = _random_encodings(2000)
+    gallery = FaceGallery(index='brute')
+    gallery.index = IVFIndex(gallery, n_lists=32, n_probe=8, min_train_size=500)
+    gallery.add_many(encodings, [str(i) for i in range(len(encodings))])
+    gallery.index.wait()
+    assert gallery.index.is_trained
+    
+    queries = encodings[:100] + 0.005
+    ivf_indices, _ = gallery.search(queries, k=1)
+    exact_indices, _ = gallery.match(queries, k=1)
+    
+    assert np.mean(ivf_indices[:, 0] == exact_indices[:, 0]) >= 0.95
+
+def test_ivf_incremental_insert():
+    """测试训练后增量插入的人脸可被检索到"""
+    encodings = _random_encodings(600)
+    gallery = FaceGallery(index='brute')
+    gallery.index = IVFIndex(gallery, n_lists=16, n_probe=4, min_train_size=500)
+    gallery.add_many(encodings[:550], [''] * 550)
+    
+    new_face = _random_encodings(1, seed=42)[0]
+    row = gallery.add(new_face, "new")
+    
+    indices, distances = gallery.search(new_face, k=1)
+    assert indices[0, 0] == row
+    assert distances[0, 0] < 1e-3
+
+def test_ivf_remove_keeps_lists_consistent():
+    """测试删除后倒排表仍与特征库一致"""
+    rng = np.random.default_rng(5)
+    gallery = FaceGallery(index='brute')
+    gallery.index = IVFIndex(gallery, n_lists=4, min_train_size=1)
+    encodings = rng.normal(size=(40, 128)).astype(np.float32)
+    gallery.add_many(encodings, [f"p{i}" for i in range(40)])
+    gallery.index.wait()
+    
+    for row in (0, 5, 20, 36):
+        gallery.remove(row)
+    
+    rows = np.concatenate(gallery.index.lists)
+    np.testing.assert_array_equal(np.sort(rows[rows >= 0]), np.arange(len(gallery)))
+    for rows, list_encodings in zip(gallery.index.lists, gallery.index.list_encodings):
+        live = rows >= 0
+        np.testing.assert_array_equal(gallery.codes_of(rows[live]), list_encodings[live])
+        np.testing.assert_array_equal(gallery.index.row_positions[rows[live]], np.flatnonzero(live))
+    indices, _ = gallery.index.search(gallery.encodings[:3], k=1)
+    np.testing.assert_array_equal(indices[:, 0], [0, 1, 2])
+
+def test_ivf_remove_tombstones_then_compacts():
+    """测试删除先留墓碑，墓碑超过比例后才压缩分区"""
+    rng = np.random.default_rng(6)
+    gallery = FaceGallery(index='brute')
+    gallery.index = IVFIndex(gallery, n_lists=1, min_train_size=1, compact_ratio=0.25)
+    encodings = rng.normal(size=(20, 128)).astype(np.float32)
+    gallery.add_many(encodings, [f"p{i}" for i in range(20)])
+    index = gallery.index
+    index.wait()
+    
+    for _ in range(5):
+        gallery.remove(0)
+    assert len(index.lists[0]) == 20 and index.tombstones[0] == 5
+    assert (index.lists[0] == -1).sum() == 5
+    indices, _ = index.search(gallery.encodings, k=1)
+    np.testing.assert_array_equal(indices[:, 0], np.arange(len(gallery)))
+    
+    gallery.remove(0)
+    assert len(index.lists[0]) == 14 and index.tombstones[0] == 0
+    np.testing.assert_array_equal(np.sort(index.lists[0]), np.arange(14))
+    indices, _ = index.search(gallery.encodings, k=1)
+    np.testing.assert_array_equal(indices[:, 0], np.arange(14))
+
+def test_ivf_retrains_in_background(monkeypatch):
+    """测试重新训练不持有写锁：训练期间检索和增删照常进行，完成后重放这些增删"""
+    import threading
+    import gallery_index
+    release = threading.Event()
+    real_kmeans = gallery_index.kmeans
+    
+    def slow_kmeans(*args, **kwargs):
+        release.wait(10)
+        return real_kmeans(*args, **kwargs)
+    
+    encodings = _random_encodings(400, seed=7)
+    gallery = FaceGallery(index='brute')
+    gallery.index = IVFIndex(gallery, n_lists=8, n_probe=8, min_train_size=100)
+    gallery.add_many(encodings[:100], [str(i) for i in range(100)])
+    gallery.index.wait()
+    trained_centroids = gallery.index.centroids
+    
+    monkeypatch.setattr(gallery_index, 'kmeans', slow_kmeans)
+    gallery.add_many(encodings[100:200], [str(i) for i in range(100, 200)])
+    assert gallery.index._training.is_alive()
+    
+    # 训练被阻塞时，检索和增删都不等待训练
+    indices, _ = gallery.search(encodings[150:151], k=1)
+    assert indices[0, 0] == 150
+    gallery.add_many(encodings[200:220], [str(i) for i in range(200, 220)])
+    for row in (3, 120, 210, 50):
+        gallery.remove(row)
+    assert gallery.index.centroids is trained_centroids
+    
+    release.set()
+    gallery.index.wait()
+    index = gallery.index
+    assert index.centroids is not trained_centroids and index.trained_size == 200
+    rows = np.concatenate(index.lists)
+    np.testing.assert_array_equal(np.sort(rows[rows >= 0]), np.arange(len(gallery)))
+    for rows, list_encodings in zip(index.lists, index.list_encodings):
+        live = rows >= 0
+        np.testing.assert_array_equal(gallery.codes_of(rows[live]), list_encodings[live])
+    indices, _ = gallery.search(gallery.encodings, k=1)
+    np.testing.assert_array_equal(indices[:, 0], np.arange(len(gallery)))
+
+def test_ivf_partitions_keep_int8_codes():
+    """测试int8存储时IVF分区也只保存int8编码，检索结果与精确扫描基本一致"""
+    encodings = _random_encodings(2000)
+    gallery = FaceGallery(index='brute', storage='int8')
+    gallery.index = IVFIndex(gallery, n_lists=32, n_probe=8, min_train_size=500)
+    gallery.add_many(encodings[:1500], [str(i) for i in range(1500)])
+    gallery.index.wait()
+    gallery.add_many(encodings[1500:], [str(i) for i in range(1500, 2000)])
+    gallery.index.wait()
+    
+    assert all(codes.dtype == np.int8 for codes in gallery.index.list_encodings)
+    queries = encodings[::20] + 0.005
+    ivf_indices, ivf_distances = gallery.search(queries, k=1)
+    exact_indices, exact_distances = gallery.match(queries, k=1)
+    assert np.mean(ivf_indices[:, 0] == exact_indices[:, 0]) >= 0.95
+    same = ivf_indices[:, 0] == exact_indices[:, 0]
+    assert np.allclose(ivf_distances[same], exact_distances[same], atol=1e-4)
@@ -0,0 +1,229 @@
+import pytest
+import sys
+import os
+import pickle
+import struct
+import json
+import numpy as np
+from cryptography.fernet import Fernet
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import gallery_store
+from gallery_store import GalleryStore, GalleryCipher
+
+@pytest.fixture
+def store(tmp_path):
+    return GalleryStore(str(tmp_path), GalleryCipher(Fernet.generate_key()), segment_rows=4)
+
+def _encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, 128)).astype(np.float32)
+
+def test_empty_store(store):
+    """测试空目录加载"""
+    ids, names, encodings = store.load()
+    assert ids == [] and names == []
+    assert encodings.shape == (0, 128)
+
+def test_journal_roundtrip(store):
+    """测试追加日志后重新加载"""
+    encodings = _encodings(3)
+    ids = store.append_many(encodings, ["a", "b", "c"])
+    
+    loaded_ids, names, loaded = store.load()
+    assert loaded_ids == ids
+    assert names == ["a", "b", "c"]
+    assert np.array_equal(loaded, encodings)
+
+def test_compact_multiple_segments(store):
+    """测试合并为跨多个加密段的快照"""
+    encodings = _encodings(10)
+    store.append_many(encodings, [str(i) for i in range(10)])
+    assert store.compact() == 10
+    assert store.generation == 1
+    assert not os.path.exists(store.journal_path(0))
+    
+    extra = _encodings(1, seed=1)
+    store.append(extra[0], "extra")
+    
+    _, names, loaded = store.load()
+    assert names == [str(i) for i in range(10)] + ["extra"]
+    assert np.array_equal(loaded, np.concatenate((encodings, extra)))
+    assert store.read_header()['segments'] == 3
+
+def test_truncated_journal_tail_ignored(store):
+    """测试日志末尾写了一半的记录被忽略"""
+    store.append_many(_encodings(2), ["a", "b"])
+    with open(store.journal_path(0), 'ab') as f:
+        f.write(b'\x10\x00\x00\x00partial')
+    
+    _, names, _ = store.load()
+    assert names == ["a", "b"]
+
+def test_migrate_legacy_files(store):
+    """测试旧格式文件迁移"""
+    encoding = np.random.default_rng(2).normal(size=128)
+    data = pickle.dumps({'encoding': encoding, 'name': 'legacy'})
+    with open(os.path.join(store.directory, 'legacy_0.encrypted'), 'wb') as f:
+        f.write(store.cipher.fernet.encrypt(data))
+    
+    assert store.migrate() == 1
+    assert store.legacy_files() == []
+    
+    _, names, loaded = store.load()
+    assert names == ['legacy']
+    assert np.allclose(loaded[0], encoding)
+
+def test_tail_journal_returns_offset(store):
+    """测试从偏移继续读取日志只返回新记录"""
+    store.append_many(_encodings(2), ["a", "b"])
+    records, offset = store.tail_journal(store.generation)
+    assert len(records) == 2
+    
+    new_ids = store.append_many(_encodings(1, seed=1), ["c"])
+    records, next_offset = store.tail_journal(store.generation, offset)
+    assert [(op, face_id, name) for op, face_id, name, _ in records] == [("add", new_ids[0], "c")]
+    assert next_offset > offset
+    assert store.tail_journal(store.generation, next_offset)[0] == []
+
+def test_delete_and_rename_survive_compaction(store):
+    """测试删除墓碑和改名在重新加载与合并后都生效"""
+    ids = store.append_many(_encodings(3), ["a", "b", "c"])
+    store.compact()
+    store.delete([ids[0]])
+    store.rename([ids[2]], "carol")
+    new_id = store.append(_encodings(1, seed=2)[0], "d")
+    store.delete([new_id])
+    
+    loaded_ids, names, encodings = store.load()
+    assert loaded_ids == ids[1:]
+    assert names == ["b", "carol"]
+    assert np.array_equal(encodings, _encodings(3)[1:])
+    
+    store.compact()
+    assert store.load()[:2] == (ids[1:], ["b", "carol"])
+
+
+def _write_v1_snapshot(store, ids, names, encodings):
+    """按版本1格式（Fernet加密）写快照，模拟升级前的数据"""
+    fernet = store.cipher.fernet
+    table = fernet.encrypt(json.dumps([{'id': i, 'name': n} for i, n in zip(ids, names)]).encode())
+    segments = [fernet.encrypt(encodings[i:i + store.segment_rows].tobytes())
+                for i in range(0, len(ids), store.segment_rows)]
+    names_offset = gallery_store.HEADER.size + gallery_store.SEGMENT.size * len(segments)
+    offset = names_offset + len(table)
+    with open(store.snapshot_path, 'wb') as f:
+        f.write(gallery_store.HEADER.pack(b'FGAL', 1, 128, 0, len(ids), len(segments), names_offset, len(table)))
+        for i, segment in enumerate(segments):
+            rows = min(store.segment_rows, len(ids) - i * store.segment_rows)
+            f.write(gallery_store.SEGMENT.pack(offset, len(segment), rows))
+            offset += len(segment)
+        f.write(table)
+        f.writelines(segments)
+
+def test_v1_snapshot_and_journal_upgraded(store):
+    """测试版本1的快照和Fernet日志记录可读，合并后升级为当前版本，之后不再接受不绑定位置的旧记录"""
+    encodings = _encodings(6)
+    _write_v1_snapshot(store, [str(i) for i in range(6)], list("abcdef"), encodings)
+    payload = json.dumps({'id': 'old', 'name': 'g'}).encode()
+    token = store.cipher.fernet.encrypt(struct.pack('<H', len(payload)) + payload + _encodings(1, seed=1).tobytes())
+    with open(store.journal_path(0), 'wb') as f:
+        f.write(struct.pack('<I', len(token)) + token)
+    store.append(_encodings(1, seed=2)[0], "h")
+
+    expected = np.concatenate((encodings, _encodings(1, seed=1), _encodings(1, seed=2)))
+    _, names, loaded = store.load()
+    assert names == list("abcdefgh")
+    assert np.array_equal(loaded, expected)
+    assert store.needs_upgrade
+
+    store.compact()
+    assert store.read_header()['version'] == gallery_store.VERSION
+    assert not store.needs_upgrade
+    assert np.array_equal(store.load()[2], expected)
+    
+    with open(store.journal_path(1), 'ab') as f:
+        f.write(struct.pack('<I', len(token)) + token)
+    assert store.load()[1] == list("abcdefgh")
+    assert store.unreadable_records == 1
+
+def test_rotate_key(store, tmp_path):
+    """测试换密钥后旧密钥无法读取，新密钥读到相同的数据"""
+    ids = store.append_many(_encodings(5), list("abcde"))
+    store.compact()
+    store.delete([ids[1]])
+    before = store.load()
+
+    new_cipher = GalleryCipher(Fernet.generate_key())
+    assert store.rotate_key(new_cipher) == 4
+    after = GalleryStore(str(tmp_path), new_cipher, segment_rows=4).load()
+    assert after[:2] == before[:2]
+    assert np.array_equal(after[2], before[2])
+
+    with pytest.raises(Exception):
+        GalleryStore(str(tmp_path), GalleryCipher(Fernet.generate_key())).load()
+
+def test_tampered_segment_rejected(store):
+    """测试被改动的加密段无法通过认证"""
+    store.append_many(_encodings(8), [str(i) for i in range(8)])
+    store.compact()
+    with open(store.snapshot_path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with pytest.raises(Exception):
+        store.load()
+
+def test_parallel_load_matches_serial(store, tmp_path):
+    """测试多线程并行解密与单线程结果一致"""
+    encodings = _encodings(30)
+    store.write_snapshot([str(i) for i in range(30)], [str(i) for i in range(30)], encodings, 0)
+    serial = GalleryStore(str(tmp_path), store.cipher, segment_rows=4, load_threads=1).load()
+    parallel = GalleryStore(str(tmp_path), store.cipher, segment_rows=4, load_threads=4).load()
+    assert serial[:2] == parallel[:2]
+    assert np.array_equal(serial[2], encodings)
+    assert np.array_equal(parallel[2], encodings)
+
+def test_legacy_file_rejects_foreign_classes(store):
+    """测试旧格式文件中的非numpy对象不会被反序列化"""
+    data = pickle.dumps({'encoding': os.getcwd, 'name': 'evil'})
+    with open(os.path.join(store.directory, 'legacy_0.encrypted'), 'wb') as f:
+        f.write(store.cipher.fernet.encrypt(data))
+
+    names, _, _ = store.load_legacy()
+    assert names == []
+
+def test_unreadable_journal_record_skipped(store):
+    """测试无法解密的日志记录被跳过，其余记录照常加载，且不会被合并丢弃"""
+    store.append(_encodings(1)[0], "a")
+    other = GalleryStore(store.directory, GalleryCipher(Fernet.generate_key()), segment_rows=4)
+    other.append(_encodings(1, seed=1)[0], "wrong-key")
+    store.append(_encodings(1, seed=2)[0], "c")
+
+    _, names, _ = store.load()
+    assert names == ["a", "c"]
+    assert store.unreadable_records == 1
+
+    with pytest.raises(ValueError):
+        store.compact()
+    assert store.compact(drop_unreadable=True) == 2
+    assert store.load()[1] == ["a", "c"]
+
+def test_replayed_journal_records_rejected(store):
+    """测试从旧日志或同一日志其他位置复制来的记录无法通过认证，被跳过"""
+    ids = store.append_many(_encodings(2), ["a", "b"])
+    with open(store.journal_path(0), 'rb') as f:
+        old_records = f.read()
+    store.compact()
+    store.delete([ids[0]])
+    with open(store.journal_path(1), 'rb') as f:
+        delete_record = f.read()
+    store.append(_encodings(1, seed=1)[0], "c")
+    with open(store.journal_path(1), 'ab') as f:
+        f.write(old_records + delete_record)
+    
+    _, names, _ = store.load()
+    assert names == ["b", "c"]
+    assert store.unreadable_records == 3
@@ -0,0 +1,66 @@
+import pytest
+import sys
+import os
+import io
+import numpy as np
+from PIL import Image
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from image_decode import decode_image, decode_base64_image, restore_locations, ImageDecodeError, ImageTooLarge
+
+LIMITS = {'max_bytes': 1024 * 1024, 'max_pixels': 1_000_000, 'max_width': 0}
+
+def encode(image, format='PNG', **kwargs):
+    buffered = io.BytesIO()
+    image.save(buffered, format=format, **kwargs)
+    return buffered.getvalue()
+
+def test_decode_rgb_channels():
+    """测试解码结果为RGB顺序的uint8数组"""
+    rgb_image, scale = decode_image(encode(Image.new('RGB', (8, 4), (255, 0, 0))), limits=LIMITS)
+    assert rgb_image.shape == (4, 8, 3)
+    assert rgb_image.dtype == np.uint8
+    assert tuple(rgb_image[0, 0]) == (255, 0, 0)
+    assert scale == 1.0
+
+@pytest.mark.parametrize('mode', ['L', 'RGBA', 'P'])
+def test_decode_other_modes(mode):
+    """测试灰度/RGBA/调色板图像都解码为3通道"""
+    rgb_image, _ = decode_image(encode(Image.new(mode, (8, 4))), limits=LIMITS)
+    assert rgb_image.shape == (4, 8, 3)
+
+def test_exif_rotation():
+    """测试按EXIF方向旋转，宽高互换"""
+    image = Image.new('RGB', (40, 20))
+    exif = image.getexif()
+    exif[0x0112] = 6
+    rgb_image, _ = decode_image(encode(image, 'JPEG', exif=exif), limits=LIMITS)
+    assert rgb_image.shape[:2] == (40, 20)
+
+def test_reduced_decode():
+    """测试按最大宽度缩小解码并换算回原图坐标"""
+    data = encode(Image.new('RGB', (800, 400)), 'JPEG')
+    rgb_image, scale = decode_image(data, max_width=200, limits=LIMITS)
+    assert rgb_image.shape[1] == 200
+    assert scale == 0.25
+    restored = restore_locations([{'name': 'a', 'location': [10, 20, 30, 5]}], scale)
+    assert restored[0]['location'] == [40, 80, 120, 20]
+
+def test_oversize_rejected():
+    """测试超过字节数或像素数限制时拒绝"""
+    data = encode(Image.new('RGB', (2000, 1000)))
+    with pytest.raises(ImageTooLarge):
+        decode_image(data, limits=LIMITS)
+    with pytest.raises(ImageTooLarge):
+        decode_base64_image('A' * (2 * 1024 * 1024), limits=LIMITS)
+
+def test_invalid_data():
+    """测试无法识别的数据"""
+    with pytest.raises(ImageDecodeError):
+        decode_image(b'not an image', limits=LIMITS)
+    with pytest.raises(ImageDecodeError):
+        decode_base64_image('data:image/png;base64,@@@', limits=LIMITS)
+    with pytest.raises(ImageDecodeError):
+        decode_base64_image(['not', 'a', 'string'], limits=LIMITS)
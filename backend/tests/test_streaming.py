@@ -0,0 +1,58 @@
+import pytest
+import sys
+import os
+import queue
+import threading
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from streaming import LatestFrame, serve_stream
+
+def test_latest_frame_drops_stale_frames():
+    """测试未处理的旧帧被新帧覆盖"""
+    slot = LatestFrame()
+    slot.put(b'1')
+    slot.put(b'2')
+    slot.put(b'3')
+    
+    assert slot.get() == (3, b'3')
+    assert slot.dropped == 2
+    
+    slot.close()
+    assert slot.get() == (None, None)
+
+def test_serve_stream_processes_latest_frame():
+    """测试处理期间到达的帧只保留最新一帧"""
+    incoming = queue.Queue()
+    received_all = threading.Event()
+    sent = []
+    
+    def receive():
+        message = incoming.get()
+        if message is None:
+            received_all.set()
+        return message
+
+    first_started = threading.Event()
+    release_first = threading.Event()
+    
+    def process(frame):
+        if frame == b'first':
+            first_started.set()
+            release_first.wait(5)
+        return {'frame_data': frame.decode()}
+    
+    worker = threading.Thread(target=serve_stream, args=(receive, sent.append, process))
+    worker.start()
+    
+    incoming.put(b'first')
+    assert first_started.wait(5)
+    for frame in (b'a', b'b', b'latest', None):
+        incoming.put(frame)
+    assert received_all.wait(5)
+    release_first.set()
+    worker.join(5)
+    
+    assert [message['frame_data'] for message in sent] == ['first', 'latest']
+    assert sent[-1]['dropped_frames'] == 2
@@ -0,0 +1,111 @@
+import pytest
+import sys
+import os
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from telemetry import MetricsBuffer, Histogram
+
+class ListSink:
+    def __init__(self):
+        self.steps = []
+        self.closed = False
+    
+    def open(self):
+        pass
+    
+    def log(self, step, metrics, samples):
+        self.steps.append((step, metrics, samples))
+    
+    def close(self):
+        self.closed = True
+
+def test_histogram_buckets():
+    """测试直方图分桶"""
+    histogram = Histogram(buckets=(1, 10))
+    for value in (0.5, 5, 50):
+        histogram.observe(value)
+    assert histogram.counts == [1, 1, 1]
+    assert histogram.count == 3
+    assert histogram.sum == 55.5
+
+def test_flush_reports_interval_deltas():
+    """测试每次写出的是本周期的增量"""
+    sink = ListSink()
+    metrics = MetricsBuffer(sink=sink, flush_interval=60, sample_rate=0)
+    
+    metrics.increment("faces_detected", 3)
+    metrics.observe("recognize_ms", 10)
+    metrics.observe("recognize_ms", 30)
+    metrics.flush()
+    
+    metrics.increment("faces_detected", 2)
+    metrics.flush()
+    
+    (step0, first, _), (step1, second, _) = sink.steps
+    assert (step0, step1) == (0, 1)
+    assert first["faces_detected"] == 3
+    assert first["recognize_ms_count"] == 2
+    assert first["recognize_ms_mean"] == 20
+    assert second["faces_detected"] == 2
+    assert second["recognize_ms_count"] == 0
+    assert "recognize_ms_mean" not in second
+
+def test_flush_includes_gauges():
+    """测试仪表（例如启动耗时）按当前值写出"""
+    sink = ListSink()
+    metrics = MetricsBuffer(sink=sink, flush_interval=60, sample_rate=0)
+    metrics.set_gauge("startup_gallery_load_seconds", 1.5)
+    metrics.flush()
+    metrics.flush()
+    
+    assert sink.steps[0][1] == {"startup_gallery_load_seconds": 1.5}
+    assert sink.steps[1][1] == {"startup_gallery_load_seconds": 1.5}
+
+def test_samples_flushed_once():
+    """测试采样明细随一次写出清空"""
+    sink = ListSink()
+    metrics = MetricsBuffer(sink=sink, flush_interval=60, sample_rate=1.0)
+    
+    assert metrics.should_sample()
+    metrics.record_sample(endpoint="recognize", faces_detected=1)
+    metrics.flush()
+    metrics.flush()
+    
+    assert len(sink.steps[0][2]) == 1
+    assert sink.steps[1][2] == []
+
+def test_background_thread_flushes_on_stop():
+    """测试停止后台线程时写出剩余指标并关闭sink"""
+    sink = ListSink()
+    metrics = MetricsBuffer(sink=sink, flush_interval=60, sample_rate=0)
+    metrics.start()
+    metrics.increment("recognize_requests")
+    metrics.stop()
+    
+    assert sink.steps[-1][1]["recognize_requests"] == 1
+    assert sink.closed
+
+def test_histogram_quantile():
+    """测试分位数估算"""
+    histogram = Histogram(buckets=(10, 20, 30))
+    for value in range(1, 31):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(15)
+    assert 25 <= histogram.quantile(0.95) <= 30
+    assert Histogram().quantile(0.99) == 0.0
+
+def test_render_prometheus():
+    """测试Prometheus文本格式导出"""
+    metrics = MetricsBuffer(sample_rate=0)
+    metrics.increment("recognize_requests")
+    metrics.set_gauge("gallery_size", 3)
+    with metrics.timer("match_ms"):
+        pass
+    
+    text = metrics.render_prometheus()
+    assert "face_recognize_requests_total 1" in text
+    assert "face_gallery_size 3" in text
+    assert 'face_match_ms_bucket{le="+Inf"} 1' in text
+    assert 'face_match_ms_percentile{quantile="0.99"}' in text
@@ -0,0 +1,64 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from tracking import StreamTracker
+
+def _frame(offset_x=0, offset_y=0, textured=True):
+    """生成一帧灰度图：一个带纹理的方块在(100+dy, 100+dx)处"""
+    frame = np.zeros((240, 320), dtype=np.uint8)
+    if textured:
+        patch = np.random.default_rng(0).integers(0, 255, size=(60, 60), dtype=np.uint8)
+        frame[100 + offset_y:160 + offset_y, 100 + offset_x:160 + offset_x] = patch
+    return frame
+
+class CountingRecognizer:
+    def __init__(self):
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        return [{'name': 'alice', 'confidence': 0.9, 'location': (100, 160, 160, 100)}]
+
+def test_tracks_between_detections():
+    """测试两次完整检测之间用光流平移人脸框"""
+    tracker = StreamTracker(detect_every=5, session_ttl=30, max_sessions=4)
+    recognize = CountingRecognizer()
+    
+    first = tracker.process('cam', _frame(), recognize)
+    assert first[0]['tracked'] is False
+    
+    moved = tracker.process('cam', _frame(offset_x=4, offset_y=2), recognize)
+    assert recognize.calls == 1
+    assert moved[0]['tracked'] is True
+    assert moved[0]['name'] == 'alice'
+    top, right, bottom, left = moved[0]['location']
+    assert abs(left - 104) <= 1 and abs(top - 102) <= 1
+    
+    for _ in range(3):
+        tracker.process('cam', _frame(offset_x=4, offset_y=2), recognize)
+    assert recognize.calls == 1
+    
+    tracker.process('cam', _frame(offset_x=4, offset_y=2), recognize)
+    assert recognize.calls == 2
+
+def test_lost_face_triggers_detection():
+    """测试跟丢人脸时重新做完整检测"""
+    tracker = StreamTracker(detect_every=10, session_ttl=30, max_sessions=4)
+    recognize = CountingRecognizer()
+    
+    tracker.process('cam', _frame(), recognize)
+    tracker.process('cam', _frame(textured=False), recognize)
+    assert recognize.calls == 2
+
+def test_sessions_are_bounded():
+    """测试会话数量上限"""
+    tracker = StreamTracker(detect_every=5, session_ttl=30, max_sessions=2)
+    recognize = CountingRecognizer()
+    for stream_id in ('a', 'b', 'c'):
+        tracker.process(stream_id, _frame(), recognize)
+    assert len(tracker) == 2
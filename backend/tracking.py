@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class StreamSession:
+    """单个视频流的跟踪状态"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prev_gray = None
+        self.results = []
+        self.points = []
+        self.frames_since_detection = 0
+        self.last_seen = time.monotonic()
+
+    def reset(self, gray, results, max_points=30):
+        """用一次完整检测的结果重新初始化每张人脸的跟踪点"""
+        self.prev_gray = gray
+        self.results = [dict(result, tracked=False) for result in results]
+        self.frames_since_detection = 0
+        self.points = []
+
+        height, width = gray.shape[:2]
+        for result in results:
+            top, right, bottom, left = result['location']
+            mask = np.zeros_like(gray)
+            mask[max(top, 0):min(bottom, height), max(left, 0):min(right, width)] = 255
+            points = cv2.goodFeaturesToTrack(gray, max_points, 0.01, 3, mask=mask)
+            self.points.append(points)
+
+    def propagate(self, gray, min_points=4, max_error=1.0):
+        """用光流把上一帧的人脸框平移到当前帧；任一人脸跟丢时返回False
+
+        每个点做前向-后向一致性检查，往返误差超过max_error像素的点视为跟丢。
+        """
+        moved_results = []
+        moved_points = []
+        height, width = gray.shape[:2]
+
+        for result, points in zip(self.results, self.points):
+            if points is None or len(points) < min_points:
+                return False
+
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None)
+            back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, next_points, None)
+            round_trip = np.abs(back_points - points).reshape(-1, 2).max(axis=1)
+            good = (status.reshape(-1) == 1) & (back_status.reshape(-1) == 1) & (round_trip < max_error)
+            if good.sum() < min_points:
+                return False
+
+            dx, dy = np.median((next_points[good] - points[good]).reshape(-1, 2), axis=0)
+            top, right, bottom, left = result['location']
+            top, bottom = int(round(top + dy)), int(round(bottom + dy))
+            left, right = int(round(left + dx)), int(round(right + dx))
+            if bottom <= 0 or right <= 0 or top >= height or left >= width:
+                return False
+
+            moved_results.append(dict(result, location=(top, right, bottom, left), tracked=True))
+            moved_points.append(next_points[good].reshape(-1, 1, 2))
+
+        self.prev_gray = gray
+        self.results = moved_results
+        self.points = moved_points
+        self.frames_since_detection += 1
+        return True
+
+
+class StreamTracker:
+    """按流ID保存会话：每N帧（或跟丢时）做完整检测+编码，其余帧只做光流跟踪"""
+
+    def __init__(self, detect_every=None, session_ttl=None, max_sessions=None, metrics=None):
+        self.detect_every = int(os.getenv('STREAM_DETECT_EVERY', 5)) if detect_every is None else detect_every
+        self.session_ttl = float(os.getenv('STREAM_SESSION_TTL', 30)) if session_ttl is None else session_ttl
+        self.max_sessions = int(os.getenv('STREAM_MAX_SESSIONS', 256)) if max_sessions is None else max_sessions
+        self.metrics = metrics
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _session(self, stream_id):
+        now = time.monotonic()
+        with self._lock:
+            # 会话按最近访问排序，从最旧的开始清理过期会话
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_seen <= self.session_ttl:
+                    break
+                self._sessions.popitem(last=False)
+
+            session = self._sessions.pop(stream_id, None) or StreamSession()
+            session.last_seen = now
+            self._sessions[stream_id] = session
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def process(self, stream_id, gray, recognize):
+        """处理一帧灰度图；需要完整识别时调用recognize()，返回识别结果"""
+        session = self._session(stream_id)
+        with session.lock:
+            needs_detection = (
+                session.prev_gray is None
+                or session.prev_gray.shape != gray.shape
+                or session.frames_since_detection + 1 >= self.detect_every
+            )
+            if not needs_detection and session.propagate(gray):
+                self._count('stream_frames_tracked')
+                return session.results
+
+            results = recognize()
+            session.reset(gray, results)
+            self._count('stream_frames_detected')
+            return session.results
+
+    def end(self, stream_id):
+        with self._lock:
+            self._sessions.pop(stream_id, None)
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.increment(name)
@@ -1,27 +1,27 @@
 import cv2
 import base64
-import numpy as np
 from PIL import Image
 import io
+from image_decode import decode_image, decode_base64_image
 
 def base64_to_image(base64_string):
-    """将base64字符串转换为OpenCV图像"""
+    """将base64字符串转换为OpenCV(BGR)图像"""
     try:
-        # 移除数据URL前缀（如果存在）
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        # 解码base64
-        image_data = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # 转换为OpenCV格式
-        opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        return opencv_image
+        rgb_image, _ = decode_base64_image(base64_string, max_width=0)
+        return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR, dst=rgb_image)
     except Exception as e:
         print(f"Error converting base64 to image: {e}")
         return None
 
+def bytes_to_rgb_image(image_bytes):
+    """将JPEG/PNG原始字节直接解码为RGB数组（不经过BGR中转）"""
+    try:
+        rgb_image, _ = decode_image(image_bytes, max_width=0)
+        return rgb_image
+    except Exception as e:
+        print(f"Error decoding image bytes: {e}")
+        return None
+
 def image_to_base64(image):
     """将OpenCV图像转换为base64字符串"""
     try:
@@ -10,9 +10,9 @@ mkdir -p data/known_faces data/unknown_faces
 mkdir -p mlflow/tracking
 
 # 创建后端文件
-touch backend/app.py backend/face_recognition.py backend/utils.py
+touch backend/app.py backend/face_system.py backend/utils.py
 touch backend/requirements.txt backend/Dockerfile
-touch backend/tests/test_app.py backend/tests/test_face_recognition.py
+touch backend/tests/test_app.py backend/tests/test_face_system.py
 
 # 创建前端文件
 touch frontend/index.html frontend/style.css frontend/script.js frontend/Dockerfile
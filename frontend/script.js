@@ -7,6 +7,9 @@ class FaceRecognitionApp {
         this.recognitionInterval = null;
         this.currentName = '';
         this.backendUrl = 'http://localhost:5000';
+        this.streamId = null;
+        this.socket = null;
+        this.requestPending = false;
         
         this.initializeElements();
         this.initializeCamera();
@@ -77,6 +80,8 @@ class FaceRecognitionApp {
         if (this.isRecognizing) return;
         
         this.isRecognizing = true;
+        // 每次开始识别使用新的流ID，后端据此在帧间跟踪人脸
+        this.streamId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
         this.updateStatus('人脸识别中...', 'success');
         
         // 更新按钮状态
@@ -84,9 +89,34 @@ class FaceRecognitionApp {
         document.getElementById('stopBtn').disabled = false;
         document.getElementById('captureBtn').disabled = true;
         
+        this.connectStream();
+        
         this.recognitionInterval = setInterval(() => {
             this.processFrame();
-        }, 1000); // 每秒处理一帧
+        }, 200); // 每秒最多5帧，后端处理不过来时只处理最新帧
+    }
+
+    connectStream() {
+        // 优先使用WebSocket持续发送二进制帧，不可用时回退到HTTP请求
+        const wsUrl = `${this.backendUrl.replace(/^http/, 'ws')}/ws/recognize?stream_id=${encodeURIComponent(this.streamId)}`;
+        
+        let socket;
+        try {
+            socket = new WebSocket(wsUrl);
+        } catch (error) {
+            console.error('WebSocket unavailable:', error);
+            this.socket = null;
+            return;
+        }
+        
+        socket.binaryType = 'arraybuffer';
+        socket.onmessage = (event) => this.handleRecognitionResult(JSON.parse(event.data));
+        socket.onclose = () => {
+            if (this.socket === socket) {
+                this.socket = null;
+            }
+        };
+        this.socket = socket;
     }
 
     stopRecognition() {
@@ -94,6 +124,10 @@ class FaceRecognitionApp {
         
         this.isRecognizing = false;
         clearInterval(this.recognitionInterval);
+        if (this.socket) {
+            this.socket.close();
+            this.socket = null;
+        }
         this.updateStatus('识别已停止', 'info');
         
         // 更新按钮状态
@@ -111,9 +145,31 @@ class FaceRecognitionApp {
             return;
         }
         
+        if (this.socket && this.socket.readyState === WebSocket.CONNECTING) {
+            return;
+        }
+        
         // 绘制视频帧到canvas
         this.ctx.drawImage(this.video, 0, 0, this.canvas.width, this.canvas.height);
         
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            // 上一帧还没发出去时跳过，避免在客户端堆积
+            if (this.socket.bufferedAmount > 0) {
+                return;
+            }
+            this.canvas.toBlob((blob) => {
+                if (blob && this.socket && this.socket.readyState === WebSocket.OPEN) {
+                    this.socket.send(blob);
+                }
+            }, 'image/jpeg', 0.8);
+            return;
+        }
+        
+        // HTTP回退：上一个请求未返回时不再发送新请求
+        if (this.requestPending) {
+            return;
+        }
+        
         // 获取base64图像数据
         const imageData = this.canvas.toDataURL('image/jpeg', 0.8);
         
@@ -121,14 +177,28 @@ class FaceRecognitionApp {
         this.sendRecognitionRequest(imageData);
     }
 
+    handleRecognitionResult(data) {
+        if (!this.isRecognizing) {
+            return;
+        }
+        
+        if (data.success) {
+            this.displayResults(data.results);
+            this.drawFaceBoxes(data.results);
+        } else if (!data.busy) {
+            this.updateStatus('识别失败: ' + data.error, 'error');
+        }
+    }
+
     async sendRecognitionRequest(imageData) {
+        this.requestPending = true;
         try {
             const response = await fetch(`${this.backendUrl}/recognize`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ image: imageData })
+                body: JSON.stringify({ image: imageData, stream_id: this.streamId })
             });
 
             if (!response.ok) {
@@ -136,16 +206,12 @@ class FaceRecognitionApp {
             }
 
             const data = await response.json();
-            
-            if (data.success) {
-                this.displayResults(data.results);
-                this.drawFaceBoxes(data.results);
-            } else {
-                this.updateStatus('识别失败: ' + data.error, 'error');
-            }
+            this.handleRecognitionResult(data);
         } catch (error) {
             console.error('Recognition error:', error);
             this.updateStatus('识别请求失败: ' + error.message, 'error');
+        } finally {
+            this.requestPending = false;
         }
     }
 
@@ -169,6 +235,7 @@ class FaceRecognitionApp {
                 <strong>${result.name}</strong>
                 <br>置信度: ${confidencePercent}%
                 <br>位置: [${result.location[0]}, ${result.location[1]}, ${result.location[2]}, ${result.location[3]}]
+                ${result.low_quality ? `<br>质量过低: ${result.low_quality}` : ''}
             `;
             
             container.appendChild(resultElement);
@@ -265,16 +332,18 @@ class FaceRecognitionApp {
 
     async loadSystemInfo() {
         try {
-            const response = await fetch(`${this.backendUrl}/status`);
+            // 只取第一页姓名，特征库很大时不必每次轮询都传输全部姓名
+            const response = await fetch(`${this.backendUrl}/status?limit=20`);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
             const data = await response.json();
+            const more = data.known_people > data.face_names.length ? ` 等${data.known_people}人` : '';
             
             document.getElementById('systemInfo').innerHTML = `
                 已知人脸数量: ${data.known_faces}<br>
-                已注册姓名: ${data.face_names.join(', ') || '无'}
+                已注册姓名: ${data.face_names.join(', ') || '无'}${more}
             `;
         } catch (error) {
             console.error('Error loading system info:', error);